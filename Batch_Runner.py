@@ -0,0 +1,187 @@
+"""
+Пакетная генерация автотестов: параллельный прогон тест-кейсов из test_cases/
+через граф агента Local_RAG_Agent_Giga.
+
+Одновременно обрабатывается не более --concurrency тест-кейсов. Тест-кейс,
+для которого граф не вернул ответ, перезапускается до --attempts раз.
+Для каждого тест-кейса в responses/batch/<время запуска>/ сохраняется JSON
+с результатом, а в summary.json - сводка успешных, повторённых и
+неудавшихся тест-кейсов.
+
+Запуск:
+    python Batch_Runner.py --dir test_cases --concurrency 4 --attempts 2
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+from Concurrency_Utils import run_concurrently
+
+logger = logging.getLogger(__name__)
+
+BATCH_CONCURRENCY = int(os.getenv("RAG_BATCH_CONCURRENCY", 4))
+BATCH_ATTEMPTS = int(os.getenv("RAG_BATCH_ATTEMPTS", 2))
+# Пауза перед повторной попыткой (сек), растёт с номером попытки
+BATCH_RETRY_DELAY = float(os.getenv("RAG_BATCH_RETRY_DELAY", 5))
+
+
+def process_test_case(agent, file_path, output_dir, attempts=BATCH_ATTEMPTS):
+    """
+    Прогоняет тест-кейс через граф с повторами и сохраняет результат.
+
+    Args:
+        agent: Модуль агента (Local_RAG_Agent_Giga)
+        file_path (str): Путь к файлу тест-кейса
+        output_dir (str): Каталог для JSON-файлов с результатами
+        attempts (int): Максимальное число запусков графа
+
+    Returns:
+        dict: Результат обработки тест-кейса
+    """
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    started = time.perf_counter()
+    result = {}
+    attempt = 0
+
+    while attempt < attempts:
+        attempt += 1
+        try:
+            result = agent.run_test_case(file_path)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке {file_path} (попытка {attempt}): {e}")
+            result = {"question": None, "response": "", "loop_step": 0, "error": str(e)}
+
+        if result["response"]:
+            break
+        if attempt < attempts:
+            logger.warning(f"Нет ответа для {file_path}, повтор через {BATCH_RETRY_DELAY * attempt} с")
+            time.sleep(BATCH_RETRY_DELAY * attempt)
+
+    item = {
+        "file": file_path,
+        "status": "success" if result["response"] else "failed",
+        "attempts": attempt,
+        "loop_step": result["loop_step"],
+        "has_java_code": '```java' in result["response"],
+        "cached": result.get("cached", False),
+        "duration": time.perf_counter() - started,
+        "error": result["error"],
+        "response_file": None,
+        "question": result["question"],
+        "response": result["response"]
+    }
+
+    if result["response"]:
+        try:
+            item["response_file"] = agent.save_response(result["question"], result["response"], "test_case",
+                                                        file_tag=name)
+        except Exception as e:
+            item["error"] = f"Ошибка при сохранении ответа: {e}"
+
+    with open(os.path.join(output_dir, f"{name}.json"), 'w', encoding='utf-8') as f:
+        json.dump(item, f, ensure_ascii=False, indent=2)
+
+    logger.info(f"Тест-кейс {file_path}: {item['status']}, попыток: {attempt}, "
+                f"время: {item['duration']:.1f} с")
+    return item
+
+
+def run_batch(test_cases_dir='test_cases', concurrency=BATCH_CONCURRENCY, attempts=BATCH_ATTEMPTS):
+    """
+    Параллельно обрабатывает все тест-кейсы каталога.
+
+    Args:
+        test_cases_dir (str): Каталог с файлами тест-кейсов (.txt)
+        concurrency (int): Максимальное число одновременно обрабатываемых тест-кейсов
+        attempts (int): Максимальное число запусков графа на один тест-кейс
+
+    Returns:
+        dict: Сводка по запуску
+    """
+    # Импорт здесь, чтобы --help не загружал агента
+    import Local_RAG_Agent_Giga as agent
+
+    test_case_files = sorted(
+        os.path.join(test_cases_dir, f) for f in os.listdir(test_cases_dir) if f.endswith('.txt')
+    )
+    output_dir = os.path.join('responses', 'batch', datetime.now().strftime('%Y%m%d_%H%M%S'))
+    os.makedirs(output_dir)
+    logger.info(f"Найдено {len(test_case_files)} файлов тест-кейсов, параллельно: {concurrency}")
+
+    started = time.perf_counter()
+    items = run_concurrently(
+        lambda file_path: process_test_case(agent, file_path, output_dir, attempts),
+        test_case_files,
+        max_workers=concurrency
+    )
+    # run_concurrently возвращает None для тест-кейсов, обработка которых завершилась исключением
+    items = [
+        item or {"file": file_path, "status": "failed", "attempts": 0, "error": "Необработанная ошибка"}
+        for file_path, item in zip(test_case_files, items)
+    ]
+
+    similarity_grader = agent.get_similarity_grader()
+    summary = {
+        "total": len(items),
+        "succeeded": sum(item["status"] == "success" for item in items),
+        "failed": sum(item["status"] == "failed" for item in items),
+        "retried": sum(item["attempts"] > 1 for item in items),
+        "total_attempts": sum(item["attempts"] for item in items),
+        "with_java_code": sum(item.get("has_java_code", False) for item in items),
+        "from_semantic_cache": sum(item.get("cached", False) for item in items),
+        "concurrency": concurrency,
+        "duration": time.perf_counter() - started,
+        "failed_files": [item["file"] for item in items if item["status"] == "failed"],
+        # Сколько документов оценено по сходству эмбеддингов без запроса к LLM
+        "similarity_grading": similarity_grader.stats() if similarity_grader else None,
+        # Время до первого токена и длительность потоковой генерации ответов
+        "streaming": agent.stream_stats(),
+        "output_dir": output_dir
+    }
+    with open(os.path.join(output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    logger.info(f"Сводка сохранена в файл: {os.path.join(output_dir, 'summary.json')}")
+    return summary
+
+
+def print_summary(summary):
+    print(f"\nОбработано тест-кейсов: {summary['total']} за {summary['duration']:.1f} с "
+          f"(параллельно: {summary['concurrency']})")
+    print(f"  успешно: {summary['succeeded']} (с Java-кодом: {summary['with_java_code']}, "
+          f"из семантического кэша: {summary['from_semantic_cache']})")
+    print(f"  с повторами: {summary['retried']} (всего запусков графа: {summary['total_attempts']})")
+    print(f"  с ошибкой: {summary['failed']}")
+    for file_path in summary["failed_files"]:
+        print(f"    {file_path}")
+    if summary["similarity_grading"]:
+        print(f"  запросов к LLM-оценщику сэкономлено: {summary['similarity_grading']['llm_calls_saved']} "
+              f"(оценено LLM: {summary['similarity_grading']['llm_graded']})")
+    if summary["streaming"]["generations"]:
+        print(f"  время до первого токена: {summary['streaming']['avg_time_to_first_token']:.2f} с, "
+              f"генерации: {summary['streaming']['avg_duration']:.2f} с (в среднем)")
+    print(f"Результаты: {summary['output_dir']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Параллельная генерация автотестов по тест-кейсам")
+    parser.add_argument("--dir", default="test_cases", help="Каталог с файлами тест-кейсов")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY,
+                        help="Максимальное число одновременно обрабатываемых тест-кейсов")
+    parser.add_argument("--attempts", type=int, default=BATCH_ATTEMPTS,
+                        help="Максимальное число запусков графа на один тест-кейс")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.dir):
+        logger.error(f"Директория не найдена: {args.dir}")
+        return
+
+    summary = run_batch(args.dir, args.concurrency, args.attempts)
+    print_summary(summary)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
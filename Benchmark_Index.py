@@ -0,0 +1,134 @@
+"""
+Сравнение приближённых индексов FAISS (IVF, HNSW, IVF-PQ) с точным индексом
+на векторах существующей Базы-Знаний.
+
+Для каждого индекса и значения nprobe/efSearch измеряются время построения,
+размер индекса, задержка поиска и полнота (recall@k) относительно точного
+поиска. В качестве запросов берутся случайные векторы из базы.
+
+Запуск:
+    python Benchmark_Index.py --db db/db_01 --queries 200 --k 10
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+import faiss
+import numpy as np
+
+from Vector_Store import build_ann_index, index_factory_string, set_search_params
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ["ivf", "hnsw", "ivfpq"]
+NPROBE_VALUES = [1, 4, 16, 64]
+EF_SEARCH_VALUES = [16, 64, 256]
+
+
+def measure(index, queries, k, ground_truth):
+    """Возвращает среднюю задержку запроса (мс) и recall@k."""
+    started = time.perf_counter()
+    _, indices = index.search(queries, k)
+    latency = (time.perf_counter() - started) * 1000 / len(queries)
+    recall = np.mean([
+        len(set(found[found >= 0]) & set(expected)) / len(expected)
+        for found, expected in zip(indices, ground_truth)
+    ])
+    return latency, float(recall)
+
+
+def run_benchmark(db_dir, query_count, k, index_types):
+    """Строит индексы по векторам точного индекса и возвращает отчёт."""
+    flat_index = faiss.read_index(os.path.join(db_dir, 'index.faiss'))
+    vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), min(query_count, len(vectors)), replace=False)]
+    k = min(k, flat_index.ntotal)
+
+    started = time.perf_counter()
+    _, ground_truth = flat_index.search(queries, k)
+    flat_latency = (time.perf_counter() - started) * 1000 / len(queries)
+
+    rows = [{
+        "index": "flat",
+        "factory": "Flat",
+        "build_time": 0.0,
+        "size_mb": len(faiss.serialize_index(flat_index)) / 2 ** 20,
+        "search_param": None,
+        "latency_ms": flat_latency,
+        "recall": 1.0
+    }]
+    for index_type in index_types:
+        factory_string = index_factory_string(index_type, flat_index.ntotal)
+        started = time.perf_counter()
+        try:
+            index = build_ann_index(flat_index, factory_string)
+        except Exception as e:
+            logger.error(f"Ошибка при построении индекса {factory_string}: {e}")
+            continue
+        build_time = time.perf_counter() - started
+        size_mb = len(faiss.serialize_index(index)) / 2 ** 20
+
+        param_name = "efSearch" if index_type == "hnsw" else "nprobe"
+        for value in EF_SEARCH_VALUES if index_type == "hnsw" else NPROBE_VALUES:
+            if param_name == "efSearch":
+                set_search_params(index, ef_search=value)
+            else:
+                set_search_params(index, nprobe=value)
+            latency, recall = measure(index, queries, k, ground_truth)
+            row = {
+                "index": index_type,
+                "factory": factory_string,
+                "build_time": build_time,
+                "size_mb": size_mb,
+                "search_param": f"{param_name}={value}",
+                "latency_ms": latency,
+                "recall": recall
+            }
+            logger.info(row)
+            rows.append(row)
+
+    return {"db_dir": db_dir, "ntotal": flat_index.ntotal, "dim": flat_index.d, "queries": len(queries), "k": k,
+            "rows": rows}
+
+
+def print_report(report):
+    print(f"\nВекторов: {report['ntotal']}, размерность: {report['dim']}, "
+          f"запросов: {report['queries']}, k={report['k']}")
+    print(f"{'Индекс':<20}{'Параметр':<16}{'Построение, с':>15}{'Размер, МБ':>12}{'Задержка, мс':>14}"
+          f"{'Recall@k':>10}")
+    for row in report["rows"]:
+        print(f"{row['factory']:<20}{row['search_param'] or '-':<16}{row['build_time']:>15.2f}"
+              f"{row['size_mb']:>12.1f}{row['latency_ms']:>14.3f}{row['recall']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение приближённых индексов FAISS с точным индексом")
+    parser.add_argument("--db", default="db/db_01", help="Каталог с индексом FAISS")
+    parser.add_argument("--queries", type=int, default=200, help="Число запросов")
+    parser.add_argument("--k", type=int, default=10, help="Число результатов поиска для расчёта recall@k")
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=INDEX_TYPES, help="Типы индексов")
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.db, 'index.faiss')):
+        logger.error(f"Индекс не найден: {args.db}")
+        return
+
+    report = run_benchmark(args.db, args.queries, args.k, args.types)
+    print_report(report)
+
+    results_dir = os.path.join('responses', 'benchmarks')
+    if not os.path.exists(results_dir):
+        os.makedirs(results_dir)
+    report_path = os.path.join(results_dir, f"index_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logger.info(f"Отчет сохранен в файл: {report_path}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,200 @@
+"""
+Сравнение режимов проверки ответа: три отдельных запроса ('parallel')
+против одного объединённого запроса ('fused').
+
+Для каждого примера измеряются время проверки, число запросов к модели,
+объём промпта (символы и токены, если модель их возвращает) и совпадение
+итоговых вердиктов двух режимов.
+
+Запуск:
+    python Benchmark_Validation.py --agent giga --samples samples.jsonl
+
+Файл примеров - JSONL с полями context, generated_response, question.
+Если файл не указан, примеры собираются из сохранённых ответов в responses/,
+а контекстом служат тест-кейсы из test_cases/.
+"""
+import argparse
+import glob
+import importlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+from LLM_Cache import uncached
+
+logger = logging.getLogger(__name__)
+
+MODES = ["parallel", "fused"]
+
+
+class UsageRecorder:
+    """Прокси к клиенту модели, подсчитывающий запросы и объём промптов"""
+
+    def __init__(self, client):
+        self.client = client
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.prompt_chars = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _record(self, payload, response):
+        prompt_chars = len(payload) if isinstance(payload, str) else sum(
+            len(getattr(message, 'content', str(message))) for message in payload
+        )
+        prompt_tokens, completion_tokens = 0, 0
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+            completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        usage_metadata = getattr(response, 'usage_metadata', None)
+        if usage_metadata:
+            prompt_tokens = usage_metadata.get('input_tokens', 0)
+            completion_tokens = usage_metadata.get('output_tokens', 0)
+
+        with self.lock:
+            self.calls += 1
+            self.prompt_chars += prompt_chars
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def chat(self, payload, *args, **kwargs):
+        response = self.client.chat(payload, *args, **kwargs)
+        self._record(payload, response)
+        return response
+
+    def invoke(self, payload, *args, **kwargs):
+        response = self.client.invoke(payload, *args, **kwargs)
+        self._record(payload, response)
+        return response
+
+
+def load_samples(samples_path=None, limit=None):
+    """Загружает примеры для проверки из JSONL или из сохранённых ответов."""
+    samples = []
+    if samples_path:
+        with open(samples_path, 'r', encoding='utf-8') as f:
+            samples = [json.loads(line) for line in f if line.strip()]
+    else:
+        context = "\n".join(
+            open(path, 'r', encoding='utf-8').read() for path in sorted(glob.glob(os.path.join('test_cases', '*.txt')))
+        )
+        for path in sorted(glob.glob(os.path.join('responses', 'response_*.md'))):
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            question_match = re.search(r'## Исходный запрос\n(.*?)\n\n', content, re.DOTALL)
+            samples.append({
+                "context": context,
+                "generated_response": content,
+                "question": question_match.group(1).strip() if question_match else ""
+            })
+    return samples[:limit] if limit else samples
+
+
+def verdict(is_valid, validation_results):
+    """Извлекает из результатов проверки поля, по которым сравниваются режимы."""
+    return {
+        "is_valid": is_valid,
+        "has_hallucinations": validation_results["hallucination_check"].get("has_hallucinations", True),
+        "needs_improvement": validation_results["source_comparison"].get("needs_improvement", True),
+        "overall_quality": validation_results["overall_quality"]
+    }
+
+
+def run_benchmark(agent_name, samples):
+    """Прогоняет примеры через оба режима проверки и возвращает отчёт."""
+    module_name = "Local_RAG_Agent_Giga" if agent_name == "giga" else "Local_RAG_Agent"
+    agent = importlib.import_module(module_name)
+
+    # Валидаторы получают клиент через функцию модуля, подменяем её на прокси со счётчиками.
+    # Прокси оборачивает клиент без кэша ответов: иначе время и число запросов брались бы из кэша
+    accessor_name = "get_gigachat" if agent_name == "giga" else "get_llm_json_mode"
+    recorder = UsageRecorder(uncached(getattr(agent, accessor_name)()))
+    setattr(agent, accessor_name, lambda: recorder)
+
+    rows = []
+    for index, sample in enumerate(samples):
+        row = {"sample": index}
+        for mode in MODES:
+            recorder.reset()
+            started = time.perf_counter()
+            is_valid, validation_results = agent.validate_response(
+                sample["context"], sample["generated_response"], sample["question"], mode=mode
+            )
+            row[mode] = {
+                "latency": time.perf_counter() - started,
+                "calls": recorder.calls,
+                "prompt_chars": recorder.prompt_chars,
+                "prompt_tokens": recorder.prompt_tokens,
+                "completion_tokens": recorder.completion_tokens,
+                **verdict(is_valid, validation_results)
+            }
+        logger.info(f"Пример {index}: {row}")
+        rows.append(row)
+
+    summary = {}
+    for mode in MODES:
+        summary[mode] = {
+            key: sum(row[mode][key] for row in rows) / len(rows)
+            for key in ["latency", "calls", "prompt_chars", "prompt_tokens", "completion_tokens", "overall_quality"]
+        }
+    summary["agreement"] = {
+        key: sum(row["parallel"][key] == row["fused"][key] for row in rows) / len(rows)
+        for key in ["is_valid", "has_hallucinations", "needs_improvement"]
+    }
+    summary["overall_quality_mean_abs_diff"] = sum(
+        abs(row["parallel"]["overall_quality"] - row["fused"]["overall_quality"]) for row in rows
+    ) / len(rows)
+
+    return {"agent": agent_name, "samples": len(rows), "summary": summary, "rows": rows}
+
+
+def print_summary(report):
+    summary = report["summary"]
+    print(f"\nАгент: {report['agent']}, примеров: {report['samples']}")
+    print(f"{'Метрика':<22}{'parallel':>14}{'fused':>14}")
+    for key in ["latency", "calls", "prompt_chars", "prompt_tokens", "completion_tokens", "overall_quality"]:
+        print(f"{key:<22}{summary['parallel'][key]:>14.2f}{summary['fused'][key]:>14.2f}")
+    print("\nСовпадение вердиктов:")
+    for key, value in summary["agreement"].items():
+        print(f"  {key}: {value:.0%}")
+    print(f"  overall_quality (средняя абс. разница): {summary['overall_quality_mean_abs_diff']:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение режимов проверки ответа parallel и fused")
+    parser.add_argument("--agent", choices=["giga", "ollama"], default="giga", help="Агент, чьи валидаторы сравниваются")
+    parser.add_argument("--samples", help="JSONL-файл с полями context, generated_response, question")
+    parser.add_argument("--limit", type=int, help="Максимальное число примеров")
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples, args.limit)
+    if not samples:
+        logger.error("Не найдено примеров для сравнения")
+        return
+
+    report = run_benchmark(args.agent, samples)
+    print_summary(report)
+
+    results_dir = os.path.join('responses', 'benchmarks')
+    if not os.path.exists(results_dir):
+        os.makedirs(results_dir)
+    report_path = os.path.join(results_dir, f"validation_{args.agent}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logger.info(f"Отчет сохранен в файл: {report_path}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
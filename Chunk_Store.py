@@ -0,0 +1,207 @@
+"""
+Хранилище чанков Базы-Знаний в sqlite (db/db_01/chunks.sqlite).
+
+Заменяет docstore, который FAISS.save_local сериализует через pickle в
+index.pkl: вместо распаковки всех документов при старте процесса по запросу
+читаются только найденные чанки, а загрузка не требует
+allow_dangerous_deserialization. Там же хранится соответствие позиций
+индекса FAISS идентификаторам чанков.
+
+Изменения (добавление и удаление чанков) фиксируются вместе с новым
+соответствием позиций в write_positions, поэтому до сохранения индекса
+другие процессы видят прежнее состояние хранилища. Вместе с позициями
+записывается отметка файла индекса (index_stamp), для которого они
+действительны: читатель сверяет её с index.faiss и не использует
+хранилище, зафиксированное для другого файла индекса.
+
+Для переноса существующих каталогов с index.pkl см. Migrate_Chunk_Store.py.
+"""
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, List, Union
+
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+CHUNK_STORE_FILE_NAME = 'chunks.sqlite'
+PICKLE_FILE_NAME = 'index.pkl'
+
+
+class ChunkStore(Docstore, AddableMixin):
+    """Хранилище чанков с доступом по идентификатору"""
+
+    def __init__(self, path: str, read_only: bool = False):
+        self.path = path
+        self.read_only = read_only
+        self.lock = threading.Lock()
+        if read_only:
+            self.connection = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True,
+                                              check_same_thread=False)
+        else:
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.executescript(
+                "CREATE TABLE IF NOT EXISTS chunks (doc_id TEXT PRIMARY KEY, content TEXT NOT NULL, "
+                "metadata TEXT NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS positions (position INTEGER PRIMARY KEY, doc_id TEXT NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            )
+            self.connection.commit()
+
+    def _check_writable(self):
+        if self.read_only:
+            raise ValueError(f"Хранилище чанков {self.path} открыто только для чтения")
+
+    def search(self, search: str) -> Union[Document, str]:
+        """Возвращает чанк по идентификатору."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT content, metadata FROM chunks WHERE doc_id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        """Добавляет чанки (фиксируются при write_positions)."""
+        self._check_writable()
+        with self.lock:
+            self.connection.executemany(
+                "INSERT INTO chunks (doc_id, content, metadata) VALUES (?, ?, ?)",
+                [(doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False, default=str))
+                 for doc_id, doc in texts.items()]
+            )
+
+    def delete(self, ids: List) -> None:
+        """Удаляет чанки (фиксируется при write_positions)."""
+        self._check_writable()
+        with self.lock:
+            self.connection.executemany("DELETE FROM chunks WHERE doc_id = ?", [(doc_id,) for doc_id in ids])
+
+    def positions(self) -> Dict[int, str]:
+        """Возвращает соответствие позиций индекса FAISS идентификаторам чанков."""
+        with self.lock:
+            return dict(self.connection.execute("SELECT position, doc_id FROM positions"))
+
+    def position_count(self) -> int:
+        """Возвращает число позиций индекса FAISS, для которых записан идентификатор чанка."""
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+
+    def write_positions(self, index_to_docstore_id, index_stamp: str = None) -> None:
+        """
+        Сохраняет соответствие позиций и фиксирует все изменения хранилища.
+
+        Args:
+            index_to_docstore_id (dict): Позиция индекса FAISS -> идентификатор чанка
+            index_stamp (str): Отметка файла индекса, для которого действительны позиции
+        """
+        self._check_writable()
+        with self.lock:
+            self.connection.execute("DELETE FROM positions")
+            self.connection.executemany(
+                "INSERT INTO positions (position, doc_id) VALUES (?, ?)", sorted(index_to_docstore_id.items())
+            )
+            # Чанки, не попавшие в индекс (например, после прерванного обновления), удаляются
+            self.connection.execute("DELETE FROM chunks WHERE doc_id NOT IN (SELECT doc_id FROM positions)")
+            if index_stamp is None:
+                self.connection.execute("DELETE FROM meta WHERE key = 'index_stamp'")
+            else:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('index_stamp', ?)", (index_stamp,)
+                )
+            self.connection.commit()
+
+    def index_stamp(self):
+        """Возвращает отметку файла индекса, для которого зафиксированы позиции, или None."""
+        with self.lock:
+            try:
+                row = self.connection.execute("SELECT value FROM meta WHERE key = 'index_stamp'").fetchone()
+            except sqlite3.OperationalError:
+                # Хранилище создано до появления отметки (таблицы meta нет)
+                return None
+        return row[0] if row else None
+
+    def rollback(self) -> None:
+        """Отменяет незафиксированные изменения."""
+        with self.lock:
+            self.connection.rollback()
+
+    def close(self) -> None:
+        """Закрывает соединение с хранилищем (незафиксированные изменения отменяются)."""
+        with self.lock:
+            self.connection.close()
+
+    def index_to_docstore_id(self) -> "PositionMapping":
+        """Возвращает соответствие позиций, читаемое из хранилища по запросу (для режима чтения)."""
+        return PositionMapping(self)
+
+
+class PositionMapping(Mapping):
+    """Соответствие позиция индекса FAISS -> идентификатор чанка, читаемое из хранилища по запросу"""
+
+    def __init__(self, store: ChunkStore):
+        self.store = store
+
+    def __getitem__(self, position):
+        with self.store.lock:
+            row = self.store.connection.execute(
+                "SELECT doc_id FROM positions WHERE position = ?", (int(position),)
+            ).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __len__(self):
+        return self.store.position_count()
+
+    def __iter__(self):
+        with self.store.lock:
+            positions = [row[0] for row in self.store.connection.execute("SELECT position FROM positions")]
+        return iter(positions)
+
+    def values(self):
+        with self.store.lock:
+            return [row[0] for row in self.store.connection.execute("SELECT doc_id FROM positions ORDER BY position")]
+
+
+def open_chunk_store(db_dir: str, read_only: bool = False):
+    """Открывает хранилище чанков каталога индекса (None, если оно ещё не создано и нужен режим чтения)."""
+    path = os.path.join(db_dir, CHUNK_STORE_FILE_NAME)
+    if read_only and not os.path.exists(path):
+        return None
+    return ChunkStore(path, read_only=read_only)
+
+
+def migrate_pickled_docstore(db_dir: str) -> int:
+    """
+    Переносит docstore из index.pkl (формат FAISS.save_local) в хранилище чанков.
+
+    index.pkl распаковывается через pickle, поэтому переносить следует только
+    каталоги, созданные своими же процессами.
+
+    Args:
+        db_dir (str): Каталог с индексом FAISS
+
+    Returns:
+        int: Число перенесённых чанков
+    """
+    pickle_path = os.path.join(db_dir, PICKLE_FILE_NAME)
+    with open(pickle_path, 'rb') as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    store = open_chunk_store(db_dir)
+    with store.lock:
+        store.connection.execute("DELETE FROM chunks")
+    store.add({doc_id: docstore.search(doc_id) for doc_id in index_to_docstore_id.values()})
+    store.write_positions(index_to_docstore_id)
+    store.close()
+    logger.info(f'Перенесено {len(index_to_docstore_id)} чанков из {pickle_path} в {store.path}')
+    return len(index_to_docstore_id)
@@ -0,0 +1,69 @@
+"""
+Вспомогательные функции для параллельного выполнения блокирующих вызовов LLM.
+"""
+import logging
+import math
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+def run_concurrently(func, items, max_workers=4, timeout=None, default=None):
+    """
+    Выполняет func для каждого элемента в пуле потоков с сохранением порядка результатов.
+
+    Args:
+        func (callable): Функция одного аргумента
+        items (list): Элементы для обработки
+        max_workers (int): Максимальное число одновременных вызовов
+        timeout (float): Ограничение времени одного вызова в секундах (None - без ограничения)
+        default: Значение результата для вызовов, завершившихся ошибкой или по таймауту
+
+    Returns:
+        list: Результаты в порядке исходных элементов
+    """
+    items = list(items)
+    results = [default] * len(items)
+    if not items:
+        return results
+
+    started = {}
+
+    def task(index, item):
+        started[index] = time.monotonic()
+        return func(item)
+
+    # Общий лимит на случай, если все потоки заняты зависшими вызовами
+    deadline = None
+    if timeout is not None:
+        deadline = time.monotonic() + timeout * (math.ceil(len(items) / max_workers) + 1)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {executor.submit(task, index, item): index for index, item in enumerate(items)}
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=0.1 if timeout is not None else None,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    logger.error(f"Ошибка при выполнении вызова #{futures[future]}: {e}")
+
+            if timeout is None:
+                continue
+
+            now = time.monotonic()
+            for future in list(pending):
+                index = futures[future]
+                if (index in started and now - started[index] > timeout) or now > deadline:
+                    logger.warning(f"Вызов #{index} превысил таймаут {timeout} с и будет пропущен")
+                    future.cancel()
+                    pending.discard(future)
+    finally:
+        # Не ждём зависшие вызовы: их результаты уже не нужны
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
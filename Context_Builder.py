@@ -0,0 +1,134 @@
+"""
+Сборка контекста для промптов с ограничением по числу токенов.
+
+Документы из состояния графа дедуплицируются по содержимому (как в
+Document_Set.DocumentSet), упорядочиваются по оценке релевантности из
+ретривера (metadata['score']) и добавляются в контекст, пока не исчерпан
+бюджет токенов; не поместившиеся документы пропускаются. Документы без
+оценки (исходный тест-кейс, результаты веб-поиска) идут первыми в исходном
+порядке.
+
+Бюджет приблизительный: токены считаются не токенизатором модели, которой
+уходит промпт (GigaChat, Llama), а токенизатором RAG_CONTEXT_TOKENIZER -
+по умолчанию cl100k_base из tiktoken, а без tiktoken - по числу символов.
+Для русского текста и кода эти оценки расходятся с токенизатором модели на
+десятки процентов, поэтому RAG_CONTEXT_TOKENS нужно задавать с запасом
+относительно контекстного окна модели. Если в RAG_CONTEXT_TOKENIZER указан
+токенизатор HuggingFace (имя с '/', например hf-internal-testing/llama-tokenizer),
+он загружается через transformers и подсчёт совпадает с моделью.
+"""
+import logging
+import os
+
+from Document_Set import DocumentSet, document_score, document_text
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKENS", 6000))
+# Кодировка tiktoken или имя токенизатора HuggingFace (содержит '/')
+CONTEXT_TOKENIZER = os.getenv("RAG_CONTEXT_TOKENIZER", "cl100k_base")
+# Среднее число символов на токен для приблизительного подсчёта (русский текст и код)
+CHARS_PER_TOKEN = 3
+
+_encoding = None
+_encoding_loaded = False
+
+
+class _HuggingFaceEncoding:
+    """Токенизатор HuggingFace с интерфейсом кодировки tiktoken"""
+
+    def __init__(self, name: str):
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(name)
+
+    def encode(self, text: str, disallowed_special=()):
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+    def decode(self, tokens) -> str:
+        return self.tokenizer.decode(tokens)
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            if '/' in CONTEXT_TOKENIZER:
+                _encoding = _HuggingFaceEncoding(CONTEXT_TOKENIZER)
+            else:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+        except Exception as e:
+            logger.warning(f"Токенизатор {CONTEXT_TOKENIZER} недоступен, токены считаются приблизительно: {e}")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Возвращает число токенов в тексте."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Обрезает текст до заданного числа токенов."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    return text[:max_tokens * CHARS_PER_TOKEN]
+
+
+def rank_documents(documents):
+    """
+    Удаляет дубликаты документов и упорядочивает их по релевантности.
+
+    Args:
+        documents (list): Документы (Document или строки)
+
+    Returns:
+        list: Уникальные документы - сначала без оценки в исходном порядке,
+              затем по убыванию оценки ретривера
+    """
+    # Из дубликатов остаётся документ с наибольшей оценкой; размер не ограничивается - лишнее отсечёт бюджет
+    unique = DocumentSet((doc for doc in documents if document_text(doc).strip()),
+                         max_size=max(len(documents), 1)).to_list()
+
+    unscored = [doc for doc in unique if document_score(doc) is None]
+    scored = sorted((doc for doc in unique if document_score(doc) is not None),
+                    key=document_score, reverse=True)
+    return unscored + scored
+
+
+def build_context(documents, token_budget: int = None) -> str:
+    """
+    Собирает контекст из документов в пределах бюджета токенов.
+
+    Args:
+        documents (list): Документы (Document или строки)
+        token_budget (int): Максимальное число токенов контекста (по умолчанию RAG_CONTEXT_TOKENS)
+
+    Returns:
+        str: Текст контекста
+    """
+    token_budget = token_budget or CONTEXT_TOKEN_BUDGET
+    ranked = rank_documents(documents)
+
+    parts = []
+    used_tokens = 0
+    for doc in ranked:
+        text = document_text(doc)
+        tokens = count_tokens(text)
+        if used_tokens + tokens <= token_budget:
+            parts.append(text)
+            used_tokens += tokens
+        elif not parts:
+            # Самый приоритетный документ больше всего бюджета - берём его начало
+            parts.append(truncate_to_tokens(text, token_budget))
+            used_tokens = token_budget
+        # Остальные не поместившиеся документы пропускаем, но продолжаем заполнять бюджет меньшими
+
+    logger.debug(f"Контекст: {len(parts)} из {len(ranked)} уникальных документов "
+                 f"(всего {len(documents)}), {used_tokens}/{token_budget} токенов")
+    return "\n".join(parts)
@@ -0,0 +1,114 @@
+"""
+Набор документов состояния графа без дубликатов и с ограничением размера.
+
+Узлы графа не изменяют список documents из состояния, а возвращают
+обновление: найденные документы (retrieve, web_search) добавляются к набору
+редьюсером merge_documents, а отобранные (rerank, grade_documents)
+заменяют его (ReplaceDocuments). Поэтому повторные циклы
+generate -> websearch -> generate не накапливают одинаковые документы.
+
+Дубликаты определяются по sha256 содержимого; из дубликатов остаётся
+документ с большей оценкой. Если документов больше RAG_MAX_DOCUMENTS,
+вытесняются документы с наименьшей оценкой ретривера (metadata['score']);
+документы без оценки (исходный тест-кейс, результаты веб-поиска)
+вытесняются последними, начиная с добавленных позже.
+"""
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+MAX_DOCUMENTS = int(os.getenv("RAG_MAX_DOCUMENTS", 30))
+
+
+def document_text(doc) -> str:
+    """Возвращает текст документа (Document или строки)."""
+    return doc.page_content if hasattr(doc, 'page_content') else str(doc)
+
+
+def document_key(doc) -> str:
+    """Возвращает ключ документа для поиска дубликатов: sha256 содержимого."""
+    return hashlib.sha256(document_text(doc).strip().encode('utf-8')).hexdigest()
+
+
+def document_score(doc):
+    """Возвращает оценку ретривера из metadata['score'] или None для документа без оценки."""
+    metadata = getattr(doc, 'metadata', None) or {}
+    return metadata.get('score')
+
+
+class ReplaceDocuments(list):
+    """Обновление documents, которое заменяет набор документов, а не дополняет его"""
+
+
+class DocumentSet:
+    """Упорядоченный набор уникальных документов ограниченного размера"""
+
+    def __init__(self, documents=(), max_size: int = None):
+        self.max_size = max_size or MAX_DOCUMENTS
+        self._documents = {}
+        self.duplicates = 0
+        self.evicted = 0
+        self.extend(documents)
+
+    def __len__(self):
+        return len(self._documents)
+
+    def __iter__(self):
+        return iter(self._documents.values())
+
+    def add(self, doc) -> bool:
+        """Добавляет документ; возвращает False для дубликата или сразу вытесненного документа."""
+        key = document_key(doc)
+        if key in self._documents:
+            self.duplicates += 1
+            if (document_score(doc) or 0) > (document_score(self._documents[key]) or 0):
+                self._documents[key] = doc
+            return False
+
+        self._documents[key] = doc
+        if len(self._documents) > self.max_size:
+            evicted_key = self._eviction_candidate()
+            del self._documents[evicted_key]
+            self.evicted += 1
+            return evicted_key != key
+        return True
+
+    def extend(self, documents) -> None:
+        """Добавляет документы."""
+        for doc in documents:
+            self.add(doc)
+
+    def _eviction_candidate(self):
+        scored = [(score, key) for key, score in
+                  ((key, document_score(doc)) for key, doc in self._documents.items()) if score is not None]
+        if scored:
+            return min(scored)[1]
+        return next(reversed(self._documents))
+
+    def to_list(self) -> list:
+        """Возвращает документы в порядке добавления."""
+        return list(self._documents.values())
+
+
+def merge_documents(current, update):
+    """
+    Редьюсер поля documents состояния графа.
+
+    Args:
+        current (list): Документы в состоянии
+        update (list): Обновление от узла; ReplaceDocuments заменяет набор
+
+    Returns:
+        list: Новый список уникальных документов не длиннее RAG_MAX_DOCUMENTS
+    """
+    if isinstance(update, ReplaceDocuments):
+        documents = DocumentSet(update)
+    else:
+        documents = DocumentSet(current or [])
+        documents.extend(update or [])
+    if documents.duplicates or documents.evicted:
+        logger.debug(f"Документы состояния: {len(documents)}, отброшено дубликатов {documents.duplicates}, "
+                     f"вытеснено {documents.evicted}")
+    return documents.to_list()
@@ -0,0 +1,107 @@
+"""
+Персистентный кэш эмбеддингов чанков.
+
+Эмбеддинги хранятся в sqlite в виде массивов float32 с ключом
+sha256(идентификатор модели + текст чанка), поэтому при перестроении
+Базы-Знаний и экспериментах с нарезкой на чанки модель считает
+эмбеддинги только для ещё не встречавшихся текстов.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from array import array
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = 'db/embedding_cache.sqlite'
+
+
+class EmbeddingCache:
+    """Хранилище эмбеддингов в sqlite с адресацией по содержимому"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+            logger.info(f'Создана директория {cache_dir}/')
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def make_key(model_id: str, text: str) -> str:
+        """Формирует ключ кэша из идентификатора модели и текста."""
+        return hashlib.sha256(f"{model_id}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, keys: List[str]) -> dict:
+        """Возвращает найденные в кэше векторы в виде словаря {ключ: вектор}."""
+        found = {}
+        with self.lock:
+            # sqlite ограничивает число параметров запроса, поэтому читаем порциями
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+        return found
+
+    def put_many(self, items: dict) -> None:
+        """Сохраняет векторы в кэш."""
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array('f', vector).tobytes()) for key, vector in items.items()]
+            )
+            self.connection.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    """Обёртка над объектом эмбеддингов, кэширующая эмбеддинги документов"""
+
+    def __init__(self, embeddings: Embeddings, model_id: str, cache_path: str = DEFAULT_CACHE_PATH):
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.cache = EmbeddingCache(cache_path)
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Возвращает эмбеддинги текстов, считая моделью только отсутствующие в кэше."""
+        keys = [EmbeddingCache.make_key(self.model_id, text) for text in texts]
+        cached = self.cache.get_many(list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            cached.update(computed)
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        logger.debug(f"Кэш эмбеддингов: {len(texts) - len(missing)} попаданий, {len(missing)} промахов "
+                     f"(всего {self.hits}/{self.misses})")
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Эмбеддинги запросов не кэшируются."""
+        return self.embeddings.embed_query(text)
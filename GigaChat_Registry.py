@@ -0,0 +1,192 @@
+"""
+Общие для процесса клиенты GigaChat.
+
+Каждый экземпляр GigaChat открывает свои HTTP-соединения и сам получает
+OAuth-токен, поэтому модули и классы, создающие собственный клиент, делают
+лишние запросы авторизации и TLS-рукопожатия. get_gigachat_client
+возвращает один клиент (одну keep-alive сессию httpx) на каждый набор
+параметров, а токен хранится один на учётные данные и используется всеми
+клиентами с ними (в том числе с разными моделями).
+
+Токен обновляется заранее - за GIGACHAT_TOKEN_REFRESH_MARGIN секунд до
+истечения срока действия, а не после ошибки 401 на рабочем запросе.
+
+Общий токен подключается через внутренние методы клиента gigachat 0.1.x
+(_check_validity_token, _update_token, _aupdate_token, _reset_token),
+поэтому версия пакета зафиксирована в requirements.txt. Если в
+установленной версии этих методов нет, клиенты создаются без общего
+токена (каждый получает свой), а в лог выводится предупреждение.
+"""
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+import weakref
+
+from gigachat import GigaChat
+
+logger = logging.getLogger(__name__)
+
+# Внутренние методы клиента, через которые подключается общий токен
+_SDK_TOKEN_METHODS = ("_check_validity_token", "_update_token", "_aupdate_token", "_reset_token", "_use_auth")
+SHARED_TOKEN_SUPPORTED = all(hasattr(GigaChat, name) for name in _SDK_TOKEN_METHODS)
+if not SHARED_TOKEN_SUPPORTED:
+    logger.warning("Установленная версия gigachat не поддерживает общий токен (нужна 0.1.x): "
+                   "каждый клиент GigaChat получает свой токен")
+
+# За сколько секунд до истечения срока действия токен обновляется
+GIGACHAT_TOKEN_REFRESH_MARGIN = float(os.getenv("GIGACHAT_TOKEN_REFRESH_MARGIN", 60))
+
+
+class TokenCache:
+    """Токен доступа, общий для клиентов с одними учётными данными"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.access_token = None
+        self.refreshes = 0
+        # asyncio.Lock привязан к циклу событий, поэтому у каждого цикла своя блокировка
+        self._async_locks = weakref.WeakKeyDictionary()
+
+    def async_lock(self) -> asyncio.Lock:
+        """Возвращает блокировку обновления токена для текущего цикла событий."""
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            lock = self._async_locks.get(loop)
+            if lock is None:
+                lock = self._async_locks[loop] = asyncio.Lock()
+            return lock
+
+    def expires_in(self) -> float:
+        """Возвращает число секунд до истечения срока действия токена."""
+        if self.access_token is None:
+            return 0.0
+        expires_at = self.access_token.expires_at
+        # OAuth возвращает время в миллисекундах, авторизация по логину и паролю - в секундах
+        if expires_at > 1e11:
+            expires_at /= 1000
+        return expires_at - time.time()
+
+    def is_valid(self) -> bool:
+        """Возвращает True, если токен действует дольше запаса на обновление."""
+        return self.access_token is not None and self.expires_in() > GIGACHAT_TOKEN_REFRESH_MARGIN
+
+
+class SharedGigaChat(GigaChat):
+    """Клиент GigaChat с общим токеном и заблаговременным обновлением токена"""
+
+    def __init__(self, token_cache: TokenCache, **kwargs):
+        super().__init__(**kwargs)
+        self._token_cache = token_cache
+
+    def _check_validity_token(self) -> bool:
+        # Токен, переданный явно (access_token), не обновляется и используется как есть
+        if not self._use_auth:
+            return super()._check_validity_token()
+        if not self._token_cache.is_valid():
+            return False
+        self._access_token = self._token_cache.access_token
+        return True
+
+    def _store_token(self) -> None:
+        if self._access_token is not None and self._access_token is not self._token_cache.access_token:
+            self._token_cache.access_token = self._access_token
+            self._token_cache.refreshes += 1
+            logger.debug(f"Токен GigaChat обновлён, действует {self._token_cache.expires_in():.0f} с")
+
+    def _update_token(self) -> None:
+        # Общая блокировка: токен для одних учётных данных запрашивает только один клиент
+        with self._token_cache.lock:
+            if self._check_validity_token():
+                return
+            super()._update_token()
+            self._store_token()
+
+    async def _aupdate_token(self) -> None:
+        if self._check_validity_token():
+            return
+        async with self._token_cache.async_lock():
+            # Пока ждали блокировку, токен мог получить другой клиент с теми же учётными данными
+            if self._check_validity_token():
+                return
+            await super()._aupdate_token()
+            with self._token_cache.lock:
+                self._store_token()
+
+    def _reset_token(self) -> None:
+        # Ошибка 401: токен отозван раньше срока, сбрасываем его и для остальных клиентов
+        with self._token_cache.lock:
+            if self._token_cache.access_token is self._access_token:
+                self._token_cache.access_token = None
+        super()._reset_token()
+
+
+_clients = {}
+_token_caches = {}
+_registry_lock = threading.Lock()
+
+
+def get_gigachat_client(**kwargs) -> GigaChat:
+    """
+    Возвращает общий для процесса клиент GigaChat.
+
+    Args:
+        **kwargs: Параметры GigaChat (credentials, scope, model, verify_ssl_certs, timeout и т.д.)
+
+    Returns:
+        GigaChat: Клиент, созданный при первом обращении с этими параметрами
+    """
+    kwargs = {name: value for name, value in kwargs.items() if value is not None}
+    key = tuple(sorted((name, tuple(value) if isinstance(value, list) else value) for name, value in kwargs.items()))
+    with _registry_lock:
+        client = _clients.get(key)
+        if client is None:
+            token_key = (kwargs.get("credentials"), kwargs.get("scope"), kwargs.get("auth_url"), kwargs.get("user"))
+            token_cache = _token_caches.setdefault(token_key, TokenCache())
+            client = SharedGigaChat(token_cache, **kwargs) if SHARED_TOKEN_SUPPORTED else GigaChat(**kwargs)
+            _clients[key] = client
+            logger.debug(f"Создан клиент GigaChat (модель {kwargs.get('model', 'по умолчанию')}), "
+                         f"всего клиентов: {len(_clients)}")
+        return client
+
+
+def token_refreshes() -> int:
+    """Возвращает число запросов токена GigaChat за время работы процесса."""
+    with _registry_lock:
+        return sum(token_cache.refreshes for token_cache in _token_caches.values())
+
+
+async def aclose_gigachat_clients() -> None:
+    """
+    Закрывает асинхронные HTTP-соединения всех клиентов.
+
+    Вызывается в конце цикла событий, в котором выполнялись achat/astream:
+    соединения httpx.AsyncClient нельзя корректно закрыть из другого цикла.
+    """
+    with _registry_lock:
+        clients = list(_clients.values())
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.debug(f"Ошибка при закрытии асинхронного клиента GigaChat: {e}")
+
+
+@atexit.register
+def close_gigachat_clients() -> None:
+    """Закрывает синхронные и асинхронные HTTP-соединения всех клиентов."""
+    with _registry_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            logger.debug(f"Ошибка при закрытии клиента GigaChat: {e}")
+        try:
+            # Повторное закрытие уже закрытого aclose_gigachat_clients клиента ничего не делает
+            asyncio.run(client.aclose())
+        except Exception as e:
+            logger.debug(f"Ошибка при закрытии асинхронного клиента GigaChat: {e}")
@@ -0,0 +1,240 @@
+"""
+Гибридный поиск по Базе-Знаний: BM25 + FAISS с объединением результатов
+методом Reciprocal Rank Fusion (RRF).
+
+Плотный поиск плохо находит точные идентификаторы (пути эндпоинтов, имена
+полей, коды ошибок), поэтому рядом с индексом FAISS ведётся инвертированный
+BM25-индекс тех же чанков. Он хранится в sqlite (db/db_01/bm25.sqlite) и не
+загружается в память: при поиске читаются только списки документов для слов
+запроса.
+"""
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+logger = logging.getLogger(__name__)
+
+BM25_FILE_NAME = 'bm25.sqlite'
+
+# Режим поиска: 'hybrid' - BM25 + FAISS, 'dense' - только FAISS
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")
+# Сколько кандидатов берётся из каждого поиска перед объединением и константа RRF
+RETRIEVAL_FETCH_K = int(os.getenv("RAG_RETRIEVAL_FETCH_K", 20))
+RRF_K = int(os.getenv("RAG_RRF_K", 60))
+
+# Слова и составные идентификаторы: /api/v1/users, user.id, ERR-404
+TOKEN_PATTERN = re.compile(r"\w+(?:[./:\-]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Разбивает текст на термы: составные идентификаторы и их части."""
+    terms = []
+    for match in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(match)
+        parts = re.findall(r"\w+", match)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class BM25Index:
+    """Инвертированный BM25-индекс чанков в sqlite"""
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        index_dir = os.path.dirname(path)
+        if index_dir and not os.path.exists(index_dir):
+            os.makedirs(index_dir)
+            logger.info(f'Создана директория {index_dir}/')
+
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(
+            "CREATE TABLE IF NOT EXISTS docs (doc_id TEXT PRIMARY KEY, length INTEGER NOT NULL, terms TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, doc_id TEXT NOT NULL, tf INTEGER NOT NULL, "
+            "PRIMARY KEY (term, doc_id)) WITHOUT ROWID;"
+        )
+        self.connection.commit()
+        self._stats = None
+
+    def _get_stats(self):
+        if self._stats is None:
+            count, total_length = self.connection.execute("SELECT COUNT(*), SUM(length) FROM docs").fetchone()
+            self._stats = (count, (total_length or 0) / count if count else 0.0)
+        return self._stats
+
+    def count(self) -> int:
+        """Возвращает число проиндексированных чанков."""
+        with self.lock:
+            return self._get_stats()[0]
+
+    def add(self, items) -> None:
+        """Добавляет чанки в индекс. items - пары (идентификатор, текст)."""
+        with self.lock:
+            for doc_id, text in items:
+                term_counts = Counter(tokenize(text))
+                self.connection.execute(
+                    "INSERT INTO docs (doc_id, length, terms) VALUES (?, ?, ?)",
+                    (doc_id, sum(term_counts.values()), json.dumps(list(term_counts), ensure_ascii=False))
+                )
+                self.connection.executemany(
+                    "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                    [(term, doc_id, tf) for term, tf in term_counts.items()]
+                )
+                self.connection.executemany(
+                    "INSERT INTO terms (term, df) VALUES (?, 1) ON CONFLICT(term) DO UPDATE SET df = df + 1",
+                    [(term,) for term in term_counts]
+                )
+            self.connection.commit()
+            self._stats = None
+
+    def delete(self, doc_ids) -> None:
+        """Удаляет чанки из индекса."""
+        with self.lock:
+            for doc_id in doc_ids:
+                row = self.connection.execute("SELECT terms FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()
+                if row is None:
+                    continue
+                terms = json.loads(row[0])
+                self.connection.executemany(
+                    "DELETE FROM postings WHERE term = ? AND doc_id = ?", [(term, doc_id) for term in terms]
+                )
+                self.connection.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", [(term,) for term in terms])
+                self.connection.execute("DELETE FROM docs WHERE doc_id = ?", (doc_id,))
+            self.connection.execute("DELETE FROM terms WHERE df <= 0")
+            self.connection.commit()
+            self._stats = None
+
+    def sync(self, vectorstore) -> None:
+        """Приводит индекс в соответствие с набором чанков векторного хранилища."""
+        vector_ids = set(vectorstore.index_to_docstore_id.values())
+        with self.lock:
+            indexed_ids = {row[0] for row in self.connection.execute("SELECT doc_id FROM docs")}
+
+        removed = indexed_ids - vector_ids
+        added = vector_ids - indexed_ids
+        if removed:
+            self.delete(removed)
+        if added:
+            self.add((doc_id, vectorstore.docstore.search(doc_id).page_content) for doc_id in added)
+        if removed or added:
+            logger.info(f'BM25-индекс обновлён: добавлено {len(added)}, удалено {len(removed)} чанков')
+
+    def search(self, query: str, k: int = 10):
+        """
+        Ищет чанки по запросу.
+
+        Args:
+            query (str): Текст запроса
+            k (int): Число результатов
+
+        Returns:
+            list: Пары (идентификатор чанка, оценка BM25) по убыванию оценки
+        """
+        scores = Counter()
+        with self.lock:
+            count, avg_length = self._get_stats()
+            if not count:
+                return []
+            for term in set(tokenize(query)):
+                row = self.connection.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()
+                if row is None:
+                    continue
+                idf = math.log(1 + (count - row[0] + 0.5) / (row[0] + 0.5))
+                postings = self.connection.execute(
+                    "SELECT p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.doc_id = p.doc_id "
+                    "WHERE p.term = ?", (term,)
+                )
+                for doc_id, tf, length in postings:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length) if avg_length else self.k1
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K):
+    """
+    Объединяет несколько ранжированных списков идентификаторов методом RRF.
+
+    Args:
+        rankings (list): Списки идентификаторов, каждый по убыванию релевантности
+        k (int): Константа RRF, сглаживающая вклад первых позиций
+
+    Returns:
+        list: Пары (идентификатор, оценка RRF) по убыванию оценки
+    """
+    scores = Counter()
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return scores.most_common()
+
+
+class HybridRetriever(BaseRetriever):
+    """Ретривер FAISS + BM25 с объединением результатов методом RRF"""
+
+    vectorstore: Any
+    keyword_index: Optional[Any] = None
+    k: int = 3
+    fetch_k: int = RETRIEVAL_FETCH_K
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun = None) -> List[Document]:
+        """
+        Возвращает k лучших чанков.
+
+        В metadata['score'] записывается оценка RRF (больше - релевантнее) и в гибридном,
+        и в плотном режиме, поэтому оценки документов из разных запросов сравнимы.
+        Исходные значения сохраняются в metadata['dense_distance'] (расстояние L2 в FAISS,
+        меньше - ближе) и metadata['bm25_score'].
+        """
+        # Векторы индекса не нормированы, поэтому берётся расстояние L2 как есть: для RRF важен только ранг,
+        # а пересчёт в relevance score LangChain даёт для таких векторов значения вне [0, 1]
+        dense = self.vectorstore.similarity_search_with_score(
+            query, k=self.fetch_k if self.keyword_index is not None else self.k
+        )
+        if self.keyword_index is None:
+            dense_ranking = [doc.page_content for doc, _ in dense]
+            scores = dict(reciprocal_rank_fusion([dense_ranking]))
+            return [Document(page_content=doc.page_content, metadata={
+                **doc.metadata, "score": scores[doc.page_content], "dense_distance": float(distance)
+            }) for doc, distance in dense]
+
+        # Результаты объединяются по тексту чанка: у документов из старых индексов FAISS нет поля id
+        candidates = {}
+        for doc, distance in dense:
+            candidates.setdefault(doc.page_content, {"doc": doc, "dense_distance": float(distance), "bm25_score": None})
+        keyword_ranking = []
+        for doc_id, score in self.keyword_index.search(query, k=self.fetch_k):
+            doc = self.vectorstore.docstore.search(doc_id)
+            if not isinstance(doc, Document):
+                continue
+            candidate = candidates.setdefault(doc.page_content, {"doc": doc, "dense_distance": None, "bm25_score": None})
+            candidate["bm25_score"] = score
+            keyword_ranking.append(doc.page_content)
+
+        dense_ranking = list(dict.fromkeys(doc.page_content for doc, _ in dense))
+        fused = reciprocal_rank_fusion([dense_ranking, list(dict.fromkeys(keyword_ranking))])
+        documents = []
+        for key, score in fused[:self.k]:
+            candidate = candidates[key]
+            documents.append(Document(page_content=key, metadata={
+                **candidate["doc"].metadata,
+                "score": score,
+                "dense_distance": candidate["dense_distance"],
+                "bm25_score": candidate["bm25_score"]
+            }))
+        return documents
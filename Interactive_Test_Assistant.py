@@ -1,4 +1,3 @@
-from gigachat import GigaChat
 import os
 from dotenv import load_dotenv
 import logging
@@ -7,6 +6,8 @@ from PyPDF2 import PdfReader
 from typing import Dict, List, Optional
 import json
 
+from GigaChat_Registry import get_gigachat_client
+
 # Настройка логирования
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
@@ -60,7 +61,7 @@ ASSISTANT_PROMPT = """### Роль: Эксперт по тестированию
 class InteractiveTestAssistant:
     def __init__(self):
         try:
-            self.gigachat = GigaChat(
+            self.gigachat = get_gigachat_client(
                 credentials=os.getenv("GIGACHAT_CREDENTIALS"),
                 verify_ssl_certs=False
             )
@@ -0,0 +1,162 @@
+"""
+Проверка Java-кода в ответе модели.
+
+JavaStreamValidator следит за потоком ответа в generate: как только блок
+```java закрыт, генерация останавливается (пояснения после кода не нужны),
+а если блок кода так и не начался в первых RAG_JAVA_MAX_PREAMBLE символах,
+ответ считается не соответствующим формату и генерация прерывается без
+ожидания конца ответа.
+
+check_java_code проверяет структуру полученного кода (синтаксис, public
+класс, методы @Test, импорты JUnit) за миллисекунды, без запросов к LLM:
+ответ с ошибками отклоняется до LLM-валидаторов, а ошибки передаются в
+промпт следующей попытки. Синтаксис разбирается пакетом javalang; если он
+не установлен, проверяются только парность скобок и обязательные элементы.
+"""
+import logging
+import os
+import re
+import time
+
+try:
+    import javalang
+except ImportError:
+    javalang = None
+
+logger = logging.getLogger(__name__)
+
+JAVA_FENCE = "```java"
+CODE_FENCE = "```"
+# Сколько символов ответа допускается до начала блока ```java
+JAVA_MAX_PREAMBLE = int(os.getenv("RAG_JAVA_MAX_PREAMBLE", 2000))
+
+
+def find_java_fence(text: str):
+    """Возвращает позицию после открывающего ```java (но не ```javascript) или None."""
+    start = text.find(JAVA_FENCE)
+    while start >= 0:
+        fence_end = start + len(JAVA_FENCE)
+        # Пока следующий символ не получен, нельзя отличить ```java от ```javascript
+        if fence_end < len(text) and not (text[fence_end].isalnum() or text[fence_end] == '_'):
+            return fence_end
+        if fence_end >= len(text):
+            return None
+        start = text.find(JAVA_FENCE, fence_end)
+    return None
+
+
+def extract_java_block(text: str):
+    """Возвращает содержимое первого закрытого блока ```java или None."""
+    fence_end = find_java_fence(text)
+    if fence_end is None:
+        return None
+    end = text.find(CODE_FENCE, fence_end)
+    if end < 0:
+        return None
+    return text[fence_end:end].strip()
+
+
+class JavaStreamValidator:
+    """Условие остановки потоковой генерации по блоку ```java"""
+
+    def __init__(self, max_preamble: int = None):
+        self.max_preamble = max_preamble or JAVA_MAX_PREAMBLE
+        self.code = None
+        self.aborted = False
+        self.reason = None
+        self._fence_end = None
+
+    def __call__(self, text: str) -> bool:
+        """Возвращает True, если генерацию можно остановить (блок кода получен или ответ не по формату)."""
+        if self._fence_end is None:
+            self._fence_end = find_java_fence(text)
+            if self._fence_end is None:
+                if len(text) > self.max_preamble:
+                    self.aborted = True
+                    self.reason = f"нет блока {JAVA_FENCE} в первых {self.max_preamble} символах ответа"
+                    logger.warning(f"Генерация прервана: {self.reason}")
+                    return True
+                return False
+
+        end = text.find(CODE_FENCE, self._fence_end)
+        if end < 0:
+            return False
+        self.code = text[self._fence_end:end].strip()
+        logger.info(f"Блок Java-кода получен ({len(self.code)} символов), генерация остановлена")
+        return True
+
+
+def _check_brackets(code: str):
+    """Проверяет парность скобок без учёта строк и комментариев (переводы строк сохраняются для номеров строк)."""
+    code = re.sub(r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'',
+                  lambda match: re.sub(r'[^\n]', ' ', match.group()), code, flags=re.S)
+    pairs = {')': '(', ']': '[', '}': '{'}
+    stack = []
+    for line_number, line in enumerate(code.split('\n'), start=1):
+        for char in line:
+            if char in '([{':
+                stack.append((char, line_number))
+            elif char in pairs:
+                if not stack or stack[-1][0] != pairs[char]:
+                    return f"непарная скобка '{char}' (строка {line_number})"
+                stack.pop()
+    if stack:
+        return f"не закрыта скобка '{stack[-1][0]}' (строка {stack[-1][1]})"
+    return None
+
+
+def _check_with_javalang(code: str):
+    try:
+        tree = javalang.parse.parse(code)
+    except javalang.parser.JavaSyntaxError as e:
+        position = getattr(e.at, 'position', None)
+        location = f" (строка {position.line}, столбец {position.column})" if position else ""
+        return [f"синтаксическая ошибка: {e.description}{location}"]
+    except (javalang.tokenizer.LexerError, TypeError, IndexError, StopIteration) as e:
+        return [f"синтаксическая ошибка: {e}"]
+
+    errors = []
+    classes = [node for node in tree.types if isinstance(node, javalang.tree.ClassDeclaration)]
+    if not any('public' in node.modifiers for node in classes):
+        errors.append("нет public класса")
+    test_methods = [method.name for node in classes for method in node.methods
+                    if any(annotation.name.split('.')[-1] == 'Test' for annotation in method.annotations)]
+    if not test_methods:
+        errors.append("нет методов с аннотацией @Test")
+    if not any(imported.path.startswith('org.junit.jupiter.api') for imported in tree.imports):
+        errors.append("нет импорта org.junit.jupiter.api")
+    return errors
+
+
+def _check_without_parser(code: str):
+    errors = []
+    bracket_error = _check_brackets(code)
+    if bracket_error:
+        errors.append(f"синтаксическая ошибка: {bracket_error}")
+    if not re.search(r'\bpublic\s+(?:final\s+|abstract\s+)*class\s+\w+', code):
+        errors.append("нет public класса")
+    if not re.search(r'@(?:org\.junit\.jupiter\.api\.)?Test\b', code):
+        errors.append("нет методов с аннотацией @Test")
+    if not re.search(r'^\s*import\s+(?:static\s+)?org\.junit\.jupiter\.api\b', code, flags=re.M):
+        errors.append("нет импорта org.junit.jupiter.api")
+    return errors
+
+
+def check_java_code(code: str):
+    """
+    Проверяет структуру Java-кода теста без обращения к LLM.
+
+    Args:
+        code (str): Содержимое блока ```java (см. extract_java_block)
+
+    Returns:
+        list: Описания найденных ошибок; пустой список, если код прошёл проверку
+    """
+    if not code or not code.strip():
+        return ["пустой блок Java-кода"]
+
+    started = time.perf_counter()
+    errors = _check_with_javalang(code) if javalang is not None else _check_without_parser(code)
+    logger.debug(f"Статическая проверка Java-кода: ошибок {len(errors)} "
+                 f"за {(time.perf_counter() - started) * 1000:.1f} мс")
+    return errors
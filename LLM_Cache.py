@@ -0,0 +1,348 @@
+"""
+Персистентный кэш ответов LLM.
+
+Ключ кэша - sha256 от имени модели, её параметров и полного списка
+сообщений, поэтому повторный прогон тех же тест-кейсов не тратит время
+модели. Кэш хранится в sqlite, ограничен по числу записей (вытесняются
+давно не использованные) и по времени жизни записи.
+
+Кэшируются только детерминированные вызовы с temperature 0: при ненулевой
+температуре повторный запрос должен давать новый ответ. Чат-модель LangChain
+оборачивается кэшем, только если создана с temperature=0; у клиента GigaChat
+температура задаётся в запросе, поэтому кэшируются запросы с "temperature": 0.
+
+Повторная попытка генерации после отклонённого ответа (loop_step > 0) идёт
+мимо кэша (model_for_attempt): промпт повтора совпадает с первой попыткой,
+и из кэша вернулся бы тот же отклонённый ответ.
+
+Поток ответа (stream), остановленный потребителем до конца, кэшируется
+только если в полученной части уже закрыт блок ```java - так generate
+останавливает успешную генерацию. Ответ, прерванный проверкой формата
+(JavaStreamValidator) или ошибкой потребителя, не кэшируется: иначе
+повторный запрос получил бы из кэша тот же неудачный ответ.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.messages import AIMessage, AIMessageChunk, messages_from_dict, messages_to_dict
+
+from Java_Code_Check import extract_java_block
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", 'db/llm_cache.sqlite')
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 10000))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))
+
+
+class ResponseCache:
+    """LRU-кэш ответов модели в sqlite с ограничением времени жизни записей"""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 ttl: float = LLM_CACHE_TTL):
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+            logger.info(f'Создана директория {cache_dir}/')
+
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.connection.commit()
+
+    @staticmethod
+    def make_key(model: str, params: dict, messages) -> str:
+        """Формирует ключ кэша из имени модели, параметров и сообщений."""
+        payload = json.dumps({"model": model, "params": params, "messages": messages},
+                             sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        """Возвращает сохранённое значение или None."""
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl and now - row[1] > self.ttl:
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.connection.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, value) -> None:
+        """Сохраняет значение и вытесняет давно не использованные записи."""
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False, default=str), now, now)
+            )
+            count = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                self.connection.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+                self.evictions += count - self.max_entries
+            self.connection.commit()
+
+    def stats(self) -> dict:
+        """Возвращает счётчики попаданий, промахов и вытеснений."""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> ResponseCache:
+    """Возвращает общий для процесса кэш ответов."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
+
+
+def _stopped_after_code(parts) -> bool:
+    """Возвращает True, если поток остановлен после закрытого блока ```java (успешная генерация)."""
+    return extract_java_block("".join(parts)) is not None
+
+
+def _normalize_messages(messages):
+    if isinstance(messages, str):
+        return messages
+    if hasattr(messages, 'dict') and not isinstance(messages, (list, dict)):
+        messages = messages.dict()
+    if isinstance(messages, dict):
+        return messages
+    return [
+        {"type": getattr(message, 'type', None), "content": getattr(message, 'content', message)}
+        if not isinstance(message, dict) else message
+        for message in messages
+    ]
+
+
+def _is_deterministic(temperature) -> bool:
+    return temperature is not None and float(temperature) == 0
+
+
+class CachedChatModel:
+    """Обёртка над чат-моделью LangChain, кэширующая результаты invoke"""
+
+    def __init__(self, llm, cache: ResponseCache = None):
+        self.llm = llm
+        self.cache = cache or get_default_cache()
+        self.model_name = getattr(llm, 'model', None) or type(llm).__name__
+        self.params = {key: value for key, value in getattr(llm, '_identifying_params', {}).items()
+                       if isinstance(value, (str, int, float, bool, type(None)))}
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    def invoke(self, messages, *args, **kwargs):
+        if not _is_deterministic(kwargs.get("temperature", 0)):
+            return self.llm.invoke(messages, *args, **kwargs)
+        key = self.cache.make_key(self.model_name, {**self.params, **kwargs}, _normalize_messages(messages))
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.debug(f"Ответ модели {self.model_name} взят из кэша")
+            return messages_from_dict([cached])[0]
+
+        response = self.llm.invoke(messages, *args, **kwargs)
+        self.cache.put(key, messages_to_dict([response])[0])
+        return response
+
+    def stream(self, messages, *args, **kwargs):
+        """Поток ответа модели; ответ из кэша отдаётся одним фрагментом."""
+        if not _is_deterministic(kwargs.get("temperature", 0)):
+            yield from self.llm.stream(messages, *args, **kwargs)
+            return
+        key = self.cache.make_key(self.model_name, {**self.params, **kwargs}, _normalize_messages(messages))
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.debug(f"Ответ модели {self.model_name} взят из кэша")
+            yield AIMessageChunk(content=messages_from_dict([cached])[0].content)
+            return
+
+        parts = []
+        stream = self.llm.stream(messages, *args, **kwargs)
+        try:
+            for chunk in stream:
+                parts.append(chunk.content)
+                yield chunk
+        except GeneratorExit:
+            stream.close()
+            if _stopped_after_code(parts):
+                self._put_stream(key, parts)
+            raise
+        self._put_stream(key, parts)
+
+    def _put_stream(self, key, parts):
+        if "".join(parts):
+            self.cache.put(key, messages_to_dict([AIMessage(content="".join(parts))])[0])
+
+
+class CachedGigaChat:
+    """Обёртка над клиентом GigaChat, кэширующая результаты chat"""
+
+    CACHE_KEY_SETTINGS = ["model", "scope", "temperature", "top_p", "max_tokens", "profanity_check"]
+
+    def __init__(self, client, cache: ResponseCache = None):
+        self.client = client
+        self.cache = cache or get_default_cache()
+        settings = getattr(client, '_settings', None)
+        self.params = {name: getattr(settings, name, None) for name in self.CACHE_KEY_SETTINGS}
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _is_cacheable(self, payload) -> bool:
+        # Температура запроса (dict или Chat) важнее температуры клиента
+        temperature = payload.get("temperature") if isinstance(payload, dict) else getattr(payload, 'temperature', None)
+        return _is_deterministic(self.params.get("temperature") if temperature is None else temperature)
+
+    @staticmethod
+    def _load(model, data):
+        # Записи, сохранённые без by_alias, содержат object_ вместо object
+        if "object_" in data and "object" not in data:
+            data = {**data, "object": data["object_"]}
+        if hasattr(model, 'model_validate'):
+            return model.model_validate(data)
+        return model.parse_obj(data)
+
+    @staticmethod
+    def _dump(response):
+        # by_alias: поле object_ модели ответа сериализуется и читается под именем object
+        if hasattr(response, 'model_dump'):
+            return response.model_dump(by_alias=True)
+        return response.dict(by_alias=True)
+
+    def chat(self, payload):
+        from gigachat.models import ChatCompletion
+
+        if not self._is_cacheable(payload):
+            return self.client.chat(payload)
+        key = self.cache.make_key("gigachat", self.params, _normalize_messages(payload))
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.debug("Ответ GigaChat взят из кэша")
+            return self._load(ChatCompletion, cached)
+
+        response = self.client.chat(payload)
+        # Пустые ответы не кэшируем, чтобы повторный запуск мог их исправить
+        if response and getattr(response, 'choices', None):
+            self.cache.put(key, self._dump(response))
+        return response
+
+    def stream(self, payload):
+        """Поток ответа модели; ответ из кэша отдаётся одним фрагментом, полученный ответ сохраняется в кэш."""
+        from gigachat.models import ChatCompletion, ChatCompletionChunk
+
+        if not self._is_cacheable(payload):
+            yield from self.client.stream(payload)
+            return
+        key = self.cache.make_key("gigachat", self.params, _normalize_messages(payload))
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.debug("Ответ GigaChat взят из кэша")
+            completion = self._load(ChatCompletion, cached)
+            choice = completion.choices[0]
+            yield self._load(ChatCompletionChunk, {
+                "choices": [{"delta": {"role": "assistant", "content": choice.message.content}, "index": 0,
+                             "finish_reason": choice.finish_reason}],
+                "created": completion.created, "model": completion.model, "object": "chat.completion"
+            })
+            return
+
+        parts = []
+        last_chunk = None
+        stream = self.client.stream(payload)
+        try:
+            for chunk in stream:
+                last_chunk = chunk
+                if chunk.choices:
+                    parts.append(chunk.choices[0].delta.content or "")
+                yield chunk
+        except GeneratorExit:
+            stream.close()
+            if _stopped_after_code(parts):
+                self._put_stream(key, parts, last_chunk)
+            raise
+        self._put_stream(key, parts, last_chunk)
+
+    def _put_stream(self, key, parts, last_chunk):
+        # Ошибки запроса не кэшируются: сюда попадают только прочитанные до конца или остановленные после блока кода потоки
+        if last_chunk is None or not "".join(parts):
+            return
+        usage = self._dump(last_chunk.usage) if last_chunk.usage else {
+            "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        finish_reason = last_chunk.choices[0].finish_reason if last_chunk.choices else None
+        self.cache.put(key, {
+            "choices": [{"message": {"role": "assistant", "content": "".join(parts)}, "index": 0,
+                         "finish_reason": finish_reason}],
+            "created": last_chunk.created, "model": last_chunk.model, "usage": usage,
+            "object": "chat.completion"
+        })
+
+
+def cached_chat_model(llm):
+    """Оборачивает чат-модель LangChain кэшем, если кэш включён (LLM_CACHE_ENABLED) и модель создана с temperature=0."""
+    if not LLM_CACHE_ENABLED:
+        return llm
+    if not _is_deterministic(getattr(llm, 'temperature', None)):
+        logger.info(f"Ответы модели {getattr(llm, 'model', type(llm).__name__)} не кэшируются: temperature не 0")
+        return llm
+    return CachedChatModel(llm)
+
+
+def cached_gigachat(client):
+    """Оборачивает клиент GigaChat кэшем, если кэш включён (LLM_CACHE_ENABLED); кэшируются запросы с temperature 0."""
+    return CachedGigaChat(client) if LLM_CACHE_ENABLED else client
+
+
+def uncached(model):
+    """Возвращает модель или клиент GigaChat без обёртки кэша."""
+    while isinstance(model, (CachedChatModel, CachedGigaChat)):
+        model = model.llm if isinstance(model, CachedChatModel) else model.client
+    return model
+
+
+def model_for_attempt(model, loop_step: int):
+    """
+    Возвращает модель для попытки генерации.
+
+    Args:
+        model: Модель или клиент GigaChat (возможно, с кэшем)
+        loop_step (int): Число уже выполненных попыток генерации
+
+    Returns:
+        Модель с кэшем для первой попытки и без кэша для повторных
+    """
+    return model if not loop_step else uncached(model)
@@ -0,0 +1,389 @@
+"""
+Повторные попытки и автоматический выключатель для вызовов GigaChat и Ollama.
+
+Временные ошибки (429, 5xx, таймауты и обрывы соединения) повторяются с
+экспоненциальной задержкой и случайным разбросом (jitter); если сервер
+прислал заголовок Retry-After, ждём указанное им время. Ошибки запроса
+(400, 401, 404 и т.п.) не повторяются.
+
+Если модель подряд отвечает временными ошибками, выключатель (circuit
+breaker) размыкается и в течение LLM_CIRCUIT_RESET секунд вызовы сразу
+завершаются ошибкой CircuitOpenError, не нагружая сервис и не тратя время
+на ожидание. Затем пропускается один пробный вызов: при успехе выключатель
+замыкается.
+
+Для каждого места вызова (модуль.функция) считаются вызовы, повторы,
+неудачные вызовы и вызовы, отклонённые выключателем (retry_stats).
+"""
+import asyncio
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+LLM_RETRY_ENABLED = os.getenv("LLM_RETRY_ENABLED", "1") == "1"
+# Число попыток (первая и повторные) и границы задержки между ними в секундах
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", 4))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", 1.0))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", 30.0))
+# Число временных ошибок подряд, после которого выключатель размыкается, и время до пробного вызова
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", 5))
+LLM_CIRCUIT_RESET = float(os.getenv("LLM_CIRCUIT_RESET", 60.0))
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+# Модули-обёртки, которые пропускаются при определении места вызова
+_WRAPPER_MODULES = {__name__, 'LLM_Cache', 'Streaming_Output'}
+
+try:
+    import httpx
+    _TRANSIENT_ERRORS = (ConnectionError, TimeoutError, httpx.TransportError)
+except ImportError:
+    _TRANSIENT_ERRORS = (ConnectionError, TimeoutError)
+
+try:
+    import requests
+    _TRANSIENT_ERRORS += (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+except ImportError:
+    pass
+
+
+class CircuitOpenError(Exception):
+    """Вызов отклонён: выключатель разомкнут после серии временных ошибок"""
+
+
+def _status_code(error):
+    status = getattr(error, 'status_code', None)
+    if status is None and getattr(error, 'response', None) is not None:
+        status = getattr(error.response, 'status_code', None)
+    # Исключения GigaChat: ResponseError(url, status_code, content, headers)
+    if status is None and type(error).__module__.startswith('gigachat') and len(error.args) >= 2:
+        status = error.args[1]
+    return status if isinstance(status, int) else None
+
+
+def _headers(error):
+    if getattr(error, 'response', None) is not None and getattr(error.response, 'headers', None) is not None:
+        return error.response.headers
+    if type(error).__module__.startswith('gigachat') and len(error.args) >= 4:
+        return error.args[3]
+    return getattr(error, 'headers', None)
+
+
+def _describe(error) -> str:
+    status = _status_code(error)
+    return f"HTTP {status}" if status is not None else f"{type(error).__name__}: {error}"
+
+
+def is_retryable(error) -> bool:
+    """Возвращает True для временных ошибок, которые имеет смысл повторить."""
+    if isinstance(error, CircuitOpenError):
+        return False
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    return isinstance(error, _TRANSIENT_ERRORS)
+
+
+def retry_after(error):
+    """Возвращает задержку из заголовка Retry-After в секундах или None."""
+    headers = _headers(error)
+    if not headers:
+        return None
+    try:
+        value = headers.get('Retry-After') or headers.get('retry-after')
+    except AttributeError:
+        return None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, error=None, base_delay: float = None, max_delay: float = None) -> float:
+    """
+    Возвращает задержку перед повтором: экспоненциальный рост с разбросом.
+
+    Args:
+        attempt (int): Номер неудачной попытки (с 1)
+        error (Exception): Ошибка попытки; при 429 задержка удваивается
+        base_delay (float): Задержка после первой попытки (по умолчанию LLM_RETRY_BASE_DELAY)
+        max_delay (float): Максимальная задержка (по умолчанию LLM_RETRY_MAX_DELAY)
+
+    Returns:
+        float: Задержка в секундах
+    """
+    base_delay = LLM_RETRY_BASE_DELAY if base_delay is None else base_delay
+    max_delay = LLM_RETRY_MAX_DELAY if max_delay is None else max_delay
+    delay = base_delay * 2 ** (attempt - 1)
+    if error is not None and _status_code(error) == 429:
+        delay *= 2
+    delay = min(delay, max_delay)
+    # Половина задержки фиксирована, половина случайна, чтобы параллельные вызовы не повторялись одновременно
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class CircuitBreaker:
+    """Автоматический выключатель вызовов модели"""
+
+    def __init__(self, name: str, failure_threshold: int = None, reset_timeout: float = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or LLM_CIRCUIT_FAILURES
+        self.reset_timeout = LLM_CIRCUIT_RESET if reset_timeout is None else reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+
+    @property
+    def state(self) -> str:
+        """Возвращает состояние: closed, open или half-open."""
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return "open"
+            return "half-open"
+
+    def before_call(self) -> None:
+        """Пропускает вызов или выбрасывает CircuitOpenError."""
+        with self.lock:
+            if self.opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            if remaining > 0:
+                raise CircuitOpenError(f"Выключатель {self.name} разомкнут, повтор через {remaining:.0f} с")
+            # После паузы пропускаем один пробный вызов, остальные ждут его результата
+            if self.trial_in_progress:
+                raise CircuitOpenError(f"Выключатель {self.name}: выполняется пробный вызов")
+            self.trial_in_progress = True
+
+    def record_success(self) -> None:
+        """Отмечает вызов, на который сервис ответил."""
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info(f"Выключатель {self.name} замкнут: сервис снова отвечает")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_progress = False
+
+    def record_failure(self) -> None:
+        """Отмечает временную ошибку вызова."""
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_progress or (self.opened_at is None and self.failures >= self.failure_threshold):
+                logger.warning(f"Выключатель {self.name} разомкнут после {self.failures} ошибок подряд "
+                               f"на {self.reset_timeout:.0f} с")
+                self.opened_at = time.monotonic()
+            self.trial_in_progress = False
+
+
+_breakers = {}
+_stats = {}
+_registry_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Возвращает общий для процесса выключатель сервиса."""
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def _count(call_site: str, counter: str) -> None:
+    with _registry_lock:
+        stats = _stats.setdefault(call_site, {"calls": 0, "retries": 0, "failures": 0, "rejected": 0})
+        stats[counter] += 1
+
+
+def retry_stats() -> dict:
+    """Возвращает счётчики вызовов, повторов, неудач и отклонённых выключателем вызовов по местам вызова."""
+    with _registry_lock:
+        return {call_site: dict(stats) for call_site, stats in _stats.items()}
+
+
+def _call_site() -> str:
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get('__name__') in _WRAPPER_MODULES:
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    return f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
+
+
+def _before_attempt(call_site: str, breaker: CircuitBreaker) -> None:
+    try:
+        breaker.before_call()
+    except CircuitOpenError:
+        _count(call_site, "rejected")
+        raise
+
+
+def _retry_delay(error, attempt: int, attempts: int, call_site: str, breaker: CircuitBreaker):
+    # Возвращает задержку перед повтором или None, если ошибку нужно передать вызывающему
+    if not is_retryable(error):
+        # Сервис ответил, ошибка в самом запросе
+        breaker.record_success()
+        _count(call_site, "failures")
+        return None
+    breaker.record_failure()
+    # После последней попытки или размыкания выключателя повторять бессмысленно
+    if attempt == attempts or breaker.state == "open":
+        _count(call_site, "failures")
+        return None
+
+    delay = retry_after(error)
+    if delay is None:
+        delay = backoff_delay(attempt, error)
+    elif delay > LLM_RETRY_MAX_DELAY:
+        logger.warning(f"{call_site}: сервис просит повторить через {delay:.0f} с, "
+                       f"это больше LLM_RETRY_MAX_DELAY, повтор не выполняется")
+        _count(call_site, "failures")
+        return None
+    _count(call_site, "retries")
+    logger.warning(f"{call_site}: временная ошибка ({_describe(error)}), попытка {attempt + 1}/{attempts} "
+                   f"через {delay:.1f} с")
+    return delay
+
+
+def call_with_retry(func, call_site: str, breaker: CircuitBreaker, attempts: int = None):
+    """
+    Выполняет вызов модели с повторами временных ошибок.
+
+    Args:
+        func (callable): Вызов без аргументов
+        call_site (str): Место вызова для статистики и логов
+        breaker (CircuitBreaker): Выключатель сервиса
+        attempts (int): Число попыток (по умолчанию LLM_RETRY_ATTEMPTS)
+
+    Returns:
+        Результат func; после последней неудачной попытки выбрасывается её ошибка
+    """
+    attempts = attempts or LLM_RETRY_ATTEMPTS
+    _count(call_site, "calls")
+    for attempt in range(1, attempts + 1):
+        _before_attempt(call_site, breaker)
+        try:
+            result = func()
+        except Exception as e:
+            delay = _retry_delay(e, attempt, attempts, call_site, breaker)
+            if delay is None:
+                raise
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+async def acall_with_retry(afunc, call_site: str, breaker: CircuitBreaker, attempts: int = None):
+    """
+    Асинхронный вариант call_with_retry: ожидание перед повтором не блокирует цикл событий.
+
+    Args:
+        afunc (callable): Функция без аргументов, возвращающая корутину вызова
+        call_site (str): Место вызова для статистики и логов
+        breaker (CircuitBreaker): Выключатель сервиса
+        attempts (int): Число попыток (по умолчанию LLM_RETRY_ATTEMPTS)
+
+    Returns:
+        Результат вызова; после последней неудачной попытки выбрасывается её ошибка
+    """
+    attempts = attempts or LLM_RETRY_ATTEMPTS
+    _count(call_site, "calls")
+    for attempt in range(1, attempts + 1):
+        _before_attempt(call_site, breaker)
+        try:
+            result = await afunc()
+        except Exception as e:
+            delay = _retry_delay(e, attempt, attempts, call_site, breaker)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+_EMPTY_STREAM = object()
+
+
+def _retrying_stream(open_stream, call_site: str, breaker: CircuitBreaker):
+    # Повторяется только начало потока: после первого фрагмента ответ уже выведен, и ошибка передаётся вызывающему
+    def start():
+        stream = iter(open_stream())
+        try:
+            return stream, next(stream)
+        except StopIteration:
+            return stream, _EMPTY_STREAM
+        except BaseException:
+            if hasattr(stream, 'close'):
+                stream.close()
+            raise
+
+    stream, first = call_with_retry(start, call_site, breaker)
+    try:
+        if first is not _EMPTY_STREAM:
+            yield first
+        yield from stream
+    finally:
+        if hasattr(stream, 'close'):
+            stream.close()
+
+
+class ResilientGigaChat:
+    """Обёртка над клиентом GigaChat с повторами временных ошибок"""
+
+    def __init__(self, client, breaker: CircuitBreaker = None):
+        self.client = client
+        self.breaker = breaker or get_circuit_breaker("gigachat")
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def chat(self, payload):
+        return call_with_retry(lambda: self.client.chat(payload), _call_site(), self.breaker)
+
+    async def achat(self, payload):
+        return await acall_with_retry(lambda: self.client.achat(payload), _call_site(), self.breaker)
+
+    def stream(self, payload):
+        return _retrying_stream(lambda: self.client.stream(payload), _call_site(), self.breaker)
+
+
+class ResilientChatModel:
+    """Обёртка над чат-моделью LangChain (Ollama) с повторами временных ошибок"""
+
+    def __init__(self, llm, breaker: CircuitBreaker = None):
+        self.llm = llm
+        self.breaker = breaker or get_circuit_breaker("ollama")
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    def invoke(self, messages, *args, **kwargs):
+        return call_with_retry(lambda: self.llm.invoke(messages, *args, **kwargs), _call_site(), self.breaker)
+
+    def stream(self, messages, *args, **kwargs):
+        return _retrying_stream(lambda: self.llm.stream(messages, *args, **kwargs), _call_site(), self.breaker)
+
+
+def resilient_gigachat(client):
+    """Оборачивает клиент GigaChat повторами, если они включены (LLM_RETRY_ENABLED)."""
+    return ResilientGigaChat(client) if LLM_RETRY_ENABLED else client
+
+
+def resilient_chat_model(llm):
+    """Оборачивает чат-модель LangChain повторами, если они включены (LLM_RETRY_ENABLED)."""
+    return ResilientChatModel(llm) if LLM_RETRY_ENABLED else llm
@@ -6,17 +6,29 @@ from langchain_community.vectorstores import FAISS
 from langchain_core.messages import HumanMessage, SystemMessage
 from langgraph.graph import StateGraph, END
 from typing_extensions import TypedDict
-from typing import List, Annotated
+from typing import Annotated
 import operator
 import json
-from langchain_community.tools.tavily_search import TavilySearchResults
-from gigachat import GigaChat
 import os
 from dotenv import load_dotenv
-from langchain_community.embeddings import HuggingFaceEmbeddings
 import sys
 import re
 from datetime import datetime
+from Vector_Store import sync_vector_store
+from Embedding_Cache import CachedEmbeddings
+from Context_Builder import build_context
+from Hybrid_Retriever import BM25Index, HybridRetriever, BM25_FILE_NAME, RETRIEVAL_MODE
+from Similarity_Grader import SimilarityGrader, GRADE_FAST_PATH
+from Semantic_Cache import SemanticCache, answer_with_cache, invalidate_semantic_cache, SEMANTIC_CACHE_ENABLED
+from Streaming_Output import gigachat_text_stream, stream_to_writer, stream_stats, STREAM_ENABLED
+from Java_Code_Check import JavaStreamValidator, extract_java_block, check_java_code
+from Document_Set import merge_documents, ReplaceDocuments
+from Reranker import CrossEncoderReranker, rerank_documents, RERANK_ENABLED, RERANK_CANDIDATES
+from Web_Search import create_web_search_tool, WEB_SEARCH_BACKEND
+from LLM_Cache import cached_gigachat, model_for_attempt, get_default_cache, LLM_CACHE_ENABLED
+from LLM_Retry import resilient_gigachat, retry_stats
+from RAG_Agent_Common import ComponentRegistry, select_relevant_documents, validate_response as check_response
+from GigaChat_Registry import get_gigachat_client
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -48,13 +60,23 @@ else:
     logger.info("TAVILY_API_KEY успешно загружен из .env")
 os.environ["TAVILY_API_KEY"] = TAVILY_API_KEY
 
-# Инициализация необходимых компонентов
-try:
-    web_search_tool = TavilySearchResults(k=3)
-    logger.info("Tavily Search успешно инициализирован")
-except Exception as e:
-    logger.error(f"Ошибка при инициализации Tavily Search: {e}")
-    web_search_tool = None
+# Модели, эмбеддинги, векторное хранилище и веб-поиск создаются при первом обращении,
+# поэтому импорт модуля (например, ради save_response) не загружает модели
+_components = ComponentRegistry()
+
+def _create_web_search_tool():
+    try:
+        # Результаты кэшируются на диске; WEB_SEARCH_BACKEND=local заменяет Tavily поиском по сохранённым страницам
+        web_search_tool = create_web_search_tool()
+        logger.info(f"Веб-поиск ({WEB_SEARCH_BACKEND}) успешно инициализирован")
+        return web_search_tool
+    except Exception as e:
+        logger.error(f"Ошибка при инициализации веб-поиска ({WEB_SEARCH_BACKEND}): {e}")
+        return None
+
+def get_web_search_tool():
+    """Возвращает инструмент веб-поиска (Tavily или локальный) или None, если он недоступен."""
+    return _components.get("web_search_tool", _create_web_search_tool)
 
 # Инструкции для маршрутизации запросов
 router_instructions = """You are an expert at routing a user question to a vectorstore or web search.
@@ -125,84 +147,6 @@ doc_grader_prompt = """Here is the retrieved document: \n\n {document} \n\n Here
     This carefully and objectively assess whether the document contains at least some information that is relevant to the question.
     Return JSON with single key, binary_score, that is 'yes' or 'no' score to indicate whether the document contains at least some information that is relevant to the question."""
 
-# Промпт для проверки фактической точности
-fact_checking_prompt = """Ты - эксперт по проверке фактической точности. Проанализируй сгенерированный ответ и исходные документы.
-
-Исходные документы:
-{context}
-
-Сгенерированный ответ:
-{generated_response}
-
-Оцени:
-1. Соответствие фактов в ответе исходным документам
-2. Наличие утверждений, которых нет в исходных документах
-3. Точность технических деталей
-
-Верни JSON в формате:
-{
-    "factual_accuracy": float, // от 0 до 1
-    "hallucinations": [string], // список найденных галлюцинаций
-    "missing_facts": [string], // важные факты из документов, пропущенные в ответе
-    "technical_accuracy": float // от 0 до 1
-}"""
-
-# Промпт для сравнения ответа с документами
-response_comparison_prompt = """Проанализируй соответствие сгенерированного ответа исходным документам.
-
-Исходные документы:
-{context}
-
-Сгенерированный ответ:
-{generated_response}
-
-Вопрос пользователя:
-{question}
-
-Оцени:
-1. Полноту ответа на вопрос
-2. Использование информации из документов
-3. Логическую связность
-
-Верни JSON в формате:
-{
-    "completeness": float, // от 0 до 1
-    "source_usage": float, // от 0 до 1
-    "coherence": float, // от 0 до 1
-    "needs_improvement": boolean,
-    "improvement_areas": [string]
-}"""
-
-# Промпт для определения галлюцинаций
-hallucination_check_prompt = """Проверь сгенерированный ответ на наличие галлюцинаций и необоснованных утверждений.
-
-Исходные документы:
-{context}
-
-Сгенерированный ответ:
-{generated_response}
-
-Проверь:
-1. Каждое фактическое утверждение
-2. Каждую техническую деталь
-3. Каждую ссылку на источники
-
-Верни JSON в формате:
-{
-    "has_hallucinations": boolean,
-    "hallucination_details": [
-        {
-            "statement": string,
-            "type": "fact|technical|reference",
-            "confidence": float
-        }
-    ],
-    "safe_to_use": boolean
-}"""
-
-doc_grader_instructions = """You are a grader assessing relevance of a retrieved document to a user question.
-    If the document contains keyword(s) or semantic meaning related to the question, grade it as relevant."""
-
 # Определение структуры состояния графа
 class GraphState(TypedDict):
     question: str
@@ -211,38 +155,58 @@ class GraphState(TypedDict):
     max_retries: int
     answers: int
     loop_step: Annotated[int, operator.add]
-    documents: List[str]
+    # Узлы возвращают новые документы, а редьюсер добавляет их к набору без дубликатов (Document_Set.py)
+    documents: Annotated[list, merge_documents]
+    java_errors: str
 
 # Настройка GigaChat
-try:
-    gigachat = GigaChat(
-        credentials=os.getenv("GIGACHAT_CREDENTIALS"),
-        verify_ssl_certs=False
-    )
-    logger.info("GigaChat успешно инициализирован")
-except Exception as e:
-    logger.error(f"Ошибка при инициализации GigaChat: {e}")
-    raise Exception("Не удалось инициализировать GigaChat")
+def _create_gigachat():
+    try:
+        gigachat = get_gigachat_client(
+            credentials=os.getenv("GIGACHAT_CREDENTIALS"),
+            verify_ssl_certs=False
+        )
+        logger.info("GigaChat успешно инициализирован")
+    except Exception as e:
+        logger.error(f"Ошибка при инициализации GigaChat: {e}")
+        raise Exception("Не удалось инициализировать GigaChat")
+
+    # Кэширование ответов: повторные запуски с теми же промптами не обращаются к модели
+    return cached_gigachat(resilient_gigachat(gigachat))
+
+def get_gigachat():
+    """Возвращает клиент GigaChat, создавая его при первом обращении."""
+    return _components.get("gigachat", _create_gigachat)
 
 # Функции для узлов графа
 def retrieve(state):
     logger.debug("---RETRIEVE---")
     question = state["question"]
-    documents = state.get("documents", [])
+    retriever = get_retriever()
     
     if retriever is None:
         logger.warning("Векторное хранилище недоступно")
-        return {"documents": documents}
+        return {}
     
     try:
-        # Получаем документы из векторного хранилища
+        # Получаем документы из векторного хранилища (и BM25-индекса в гибридном режиме);
+        # оценка релевантности в metadata['score'] используется при сборке контекста
         retrieved_docs = retriever.invoke(question)
-        documents.extend(retrieved_docs)
         logger.info(f"Найдено {len(retrieved_docs)} релевантных документов")
     except Exception as e:
         logger.error(f"Ошибка при поиске в векторном хранилище: {e}")
+        return {}
+    
+    # Найденные документы добавляются к документам состояния редьюсером merge_documents
+    return {"documents": retrieved_docs}
+
+def rerank(state):
+    logger.debug("---RERANK---")
+    question = state["question"]
+    documents = state.get("documents", [])
     
-    return {"documents": documents}
+    # Дальше (к оценке LLM и генерации) проходят только лучшие по оценке cross-encoder документы
+    return {"documents": ReplaceDocuments(rerank_documents(get_reranker(), question, documents))}
 
 def generate(state):
     logger.debug("---GENERATE---")
@@ -250,8 +214,8 @@ def generate(state):
     documents = state["documents"]
     loop_step = state.get("loop_step", 0)
     
-    # Подготовка контекста из документов
-    context = "\n".join([doc.page_content if hasattr(doc, 'page_content') else str(doc) for doc in documents])
+    # Подготовка контекста из документов: без дубликатов, по релевантности и в пределах бюджета токенов
+    context = build_context(documents)
     
     # Формируем промпт с контекстом
     full_prompt = f"""
@@ -271,6 +235,13 @@ def generate(state):
     5. Должны быть реализованы все шаги теста
     """
     
+    # Ошибки, найденные статической проверкой предыдущего ответа, передаются модели для исправления
+    if state.get("java_errors"):
+        full_prompt += f"""
+    ### Ошибки в предыдущем ответе (исправь их):
+    {state["java_errors"]}
+    """
+    
     try:
         logger.info("Отправка запроса к GigaChat")
         messages = [
@@ -278,16 +249,30 @@ def generate(state):
             {"role": "user", "content": full_prompt}
         ]
         
-        generation = gigachat.chat(messages)
-        
-        response = generation.content
+        payload = {"messages": messages}
+        # Повторная попытка идёт мимо кэша ответов: её промпт может совпадать с отклонённой попыткой
+        gigachat = model_for_attempt(get_gigachat(), loop_step)
+        if STREAM_ENABLED:
+            # Ответ выводится в консоль и в responses/stream/ по мере генерации. Как только блок ```java закрыт,
+            # генерация останавливается, а ответ без блока кода прерывается, не дожидаясь его конца
+            validator = JavaStreamValidator()
+            response = stream_to_writer(gigachat_text_stream(gigachat, payload), stop_when=validator)
+            if validator.aborted:
+                logger.warning(f"Ответ не соответствует формату: {validator.reason}")
+                return {"generation": "", "loop_step": loop_step + 1, "java_errors": f"- {validator.reason}"}
+        else:
+            response = gigachat.chat(payload).choices[0].message.content
         logger.info(f"Получен ответ от GigaChat длиной {len(response)} символов")
         
         # Проверяем наличие Java-кода в ответе
         if '```java' not in response:
             logger.warning("В ответе отсутствует блок с Java-кодом")
-            return {"generation": "", "loop_step": loop_step + 1}
+            return {"generation": "", "loop_step": loop_step + 1, "java_errors": "- в ответе нет блока ```java"}
             
+        # Статическая проверка кода: ответ с ошибками отклоняется до LLM-валидаторов в grade_generation
+        code = extract_java_block(response)
+        java_errors = check_java_code(code) if code is not None else ["блок ```java не закрыт"]
+        
         # Проверяем наличие основных компонентов теста
         required_elements = [
             "import org.junit.jupiter.api",
@@ -301,15 +286,20 @@ def generate(state):
         missing_elements = [elem for elem in required_elements if elem not in response]
         if missing_elements:
             logger.warning(f"В ответе отсутствуют важные элементы: {missing_elements}")
-            return {"generation": "", "loop_step": loop_step + 1}
+            java_errors.append(f"отсутствуют элементы: {', '.join(missing_elements)}")
+        if java_errors:
+            logger.warning(f"Java-код не прошел статическую проверку: {java_errors}")
+            return {"generation": "", "loop_step": loop_step + 1,
+                    "java_errors": "\n".join(f"- {error}" for error in java_errors)}
             
         logger.info("Ответ успешно сгенерирован и прошел базовую валидацию")
-        return {"generation": response, "loop_step": loop_step + 1}
+        return {"generation": response, "loop_step": loop_step + 1, "java_errors": ""}
         
     except Exception as e:
         logger.error(f"Ошибка при генерации ответа: {e}")
         logger.exception("Подробности ошибки:")
-        return {"generation": "", "loop_step": loop_step + 1}
+        # Ошибки предыдущего ответа к этой попытке не относятся
+        return {"generation": "", "loop_step": loop_step + 1, "java_errors": ""}
 
 def grade_documents(state):
     logger.debug("---GRADE DOCUMENTS---")
@@ -318,57 +308,38 @@ def grade_documents(state):
     
     if not documents:
         logger.warning("Нет документов для оценки")
-        return {"documents": documents, "web_search": "Yes"}
+        return {"web_search": "Yes"}
     
-    # Оцениваем каждый документ
-    relevant_docs = []
-    for doc in documents:
-        content = doc.page_content if hasattr(doc, 'page_content') else str(doc)
-        
-        # Формируем промпт для оценки
-        grading_prompt = f"""
-        {doc_grader_instructions}
-        
-        Document: {content}
-        Question: {question}
-        
-        Is this document relevant? Return only 'yes' or 'no'.
-        """
-        
-        try:
-            result = gigachat.chat([HumanMessage(content=grading_prompt)])
-            if isinstance(result.content, str) and 'yes' in result.content.lower():
-                relevant_docs.append(doc)
-        except Exception as e:
-            logger.error(f"Ошибка при оценке документа: {e}")
+    relevant_docs = select_relevant_documents(_ask, question, documents, get_similarity_grader())
     
     # Если нет релевантных документов, предлагаем использовать веб-поиск
     if not relevant_docs:
         logger.info("Не найдено релевантных документов, переключаемся на веб-поиск")
-        return {"documents": documents, "web_search": "Yes"}
+        return {"web_search": "Yes"}
     
     logger.info(f"Найдено {len(relevant_docs)} релевантных документов")
-    return {"documents": relevant_docs, "web_search": "No"}
+    return {"documents": ReplaceDocuments(relevant_docs), "web_search": "No"}
 
 def web_search(state):
     logger.debug("---WEB SEARCH---")
     question = state["question"]
-    documents = state.get("documents", [])
+    web_search_tool = get_web_search_tool()
     
     if web_search_tool is None:
         logger.warning("Веб-поиск недоступен, пропускаем этап поиска")
-        return {"documents": documents}
+        return {}
     
     try:
         docs = web_search_tool.invoke({"query": question})
         web_results = "\n".join([d["content"] for d in docs])
         web_results = Document(page_content=web_results)
-        documents.append(web_results)
         logger.info("Веб-поиск успешно выполнен")
     except Exception as e:
         logger.error(f"Ошибка при выполнении веб-поиска: {e}")
+        return {}
     
-    return {"documents": documents}
+    # Повторный поиск с тем же вопросом не добавит дубликат: редьюсер отбрасывает документы с тем же содержимым
+    return {"documents": [web_results]}
 
 def route_question(state):
     logger.debug("---ROUTE QUESTION---")
@@ -391,8 +362,8 @@ def grade_generation(state):
         logger.warning("Получен пустой ответ")
         return "not useful"
     
-    # Подготовка контекста из документов
-    context = "\n".join([doc.page_content if hasattr(doc, 'page_content') else str(doc) for doc in documents])
+    # Подготовка контекста из документов: без дубликатов, по релевантности и в пределах бюджета токенов
+    context = build_context(documents)
     
     # Проверка качества ответа
     is_valid, validation_results = validate_response(context, generation, question)
@@ -428,6 +399,8 @@ workflow = StateGraph(GraphState)
 # Добавление узлов
 workflow.add_node("websearch", web_search)
 workflow.add_node("retrieve", retrieve)
+if RERANK_ENABLED:
+    workflow.add_node("rerank", rerank)
 workflow.add_node("grade_documents", grade_documents)
 workflow.add_node("generate", generate)
 
@@ -440,7 +413,11 @@ workflow.set_conditional_entry_point(
     },
 )
 workflow.add_edge("websearch", "generate")
-workflow.add_edge("retrieve", "grade_documents")
+if RERANK_ENABLED:
+    workflow.add_edge("retrieve", "rerank")
+    workflow.add_edge("rerank", "grade_documents")
+else:
+    workflow.add_edge("retrieve", "grade_documents")
 workflow.add_conditional_edges(
     "grade_documents",
     decide_to_generate,
@@ -476,86 +453,108 @@ def process_documents(documents):
 
     return source_chunks 
 
+def _create_embeddings():
+    # Импорт здесь: загрузка библиотек эмбеддингов занимает заметное время
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    # Создание векторных представлений (Embeddings)
+    model_id = "bert-base-uncased"
+    embeddings = HuggingFaceEmbeddings(
+        model_name=model_id
+    )
+
+    # Повторяющиеся чанки не пересчитываются моделью при перестроении базы
+    return CachedEmbeddings(embeddings, model_id)
+
+def get_embeddings():
+    """Возвращает модель эмбеддингов (с кэшем), загружая её при первом обращении."""
+    return _components.get("embeddings", _create_embeddings)
+
 def get_vector_store():
     """
     Функция для получения или создания векторной Базы-Знаний.
-    Если база уже существует, она загружается из файла,
+    Если база уже существует, она загружается из файла и дополняется
+    только новыми и изменёнными PDF-документами (см. Vector_Store.py),
     иначе происходит чтение PDF-документов и создание новой базы.
     """
     logger.debug('Инициализация векторного хранилища')
-    
-    # Создание векторных представлений (Embeddings)
-    embeddings = HuggingFaceEmbeddings(
-        model_name="bert-base-uncased"
-    )
-
-    db_file_name = 'db/db_01'
-    file_path = f"{db_file_name}/index.faiss"
-    
-    # Проверка наличия файла с векторной Базой-Знаний
-    if os.path.exists(file_path):
-        logger.info('Загружаем существующую векторную Базу-знаний')
-        return FAISS.load_local(db_file_name, embeddings, allow_dangerous_deserialization=True)
-
-    logger.info('Создаем новую векторную Базу-Знаний')
-    
-    # Создание директории pdf если её нет
-    if not os.path.exists('pdf'):
-        os.makedirs('pdf')
-        logger.info('Создана директория pdf/')
-    
-    # Создание директории db если её нет
-    if not os.path.exists('db'):
-        os.makedirs('db')
-        logger.info('Создана директория db/')
-    
-    documents = []
-    pdf_dir = 'pdf'
-    
-    # Чтение всех PDF-файлов
-    for root, dirs, files in os.walk(pdf_dir):
-        for file in files:
-            if file.endswith(".pdf"):
-                file_path = os.path.join(root, file)
-                logger.info(f'Обработка файла: {file_path}')
-                try:
-                    loader = PyPDFLoader(file_path)
-                    documents.extend(loader.load())
-                except Exception as e:
-                    logger.error(f'Ошибка при обработке файла {file_path}: {e}')
+    embeddings = get_embeddings()
 
-    if not documents:
-        logger.warning('Не найдено PDF файлов для обработки')
-        return None
+    # В гибридном режиме рядом с индексом FAISS ведётся BM25-индекс тех же чанков
+    keyword_index = get_keyword_index() if RETRIEVAL_MODE == "hybrid" else None
 
-    # Разделение документов на чанки
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1024, chunk_overlap=0)
-    chunks = text_splitter.split_documents(documents)
-    logger.info(f'Создано {len(chunks)} чанков из документов')
+    # Ответы из семантического кэша зависят от найденных документов, поэтому при изменении базы кэш сбрасывается
+    return sync_vector_store(embeddings, embeddings.model_id, db_dir='db/db_01', pdf_dir='pdf',
+                             keyword_index=keyword_index, on_index_changed=invalidate_semantic_cache)
 
-    # Создание векторной Базы-Знаний
-    vectorstore = FAISS.from_documents(chunks, embeddings)
-    
-    # Сохранение базы
-    vectorstore.save_local(db_file_name)
-    logger.info(f'Векторная База-Знаний сохранена в {db_file_name}')
-    
-    return vectorstore
+def get_keyword_index():
+    """Возвращает BM25-индекс чанков Базы-Знаний, открывая его при первом обращении."""
+    return _components.get("keyword_index", lambda: BM25Index(os.path.join('db/db_01', BM25_FILE_NAME)))
 
 # Инициализация векторного хранилища
-try:
-    vectorstore = get_vector_store()
-    if vectorstore:
-        logger.info("Векторное хранилище успешно инициализировано")
-        retriever = vectorstore.as_retriever(k=3)
-    else:
+def _create_retriever():
+    try:
+        vectorstore = get_vector_store()
+        if vectorstore:
+            logger.info("Векторное хранилище успешно инициализировано")
+            return HybridRetriever(
+                vectorstore=vectorstore,
+                keyword_index=get_keyword_index() if RETRIEVAL_MODE == "hybrid" else None,
+                # С переранжированием ретривер отдаёт больше кандидатов, лучшие отбирает cross-encoder
+                k=RERANK_CANDIDATES if RERANK_ENABLED else 3
+            )
         logger.warning("Векторное хранилище не создано - нет PDF файлов")
-        retriever = None
-except Exception as e:
-    logger.error(f"Ошибка при инициализации векторного хранилища: {e}")
-    retriever = None
+    except Exception as e:
+        logger.error(f"Ошибка при инициализации векторного хранилища: {e}")
+    return None
+
+def get_retriever():
+    """Возвращает ретривер векторной Базы-Знаний или None, если она недоступна."""
+    return _components.get("retriever", _create_retriever)
+
+def _create_semantic_cache():
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    try:
+        # База-Знаний синхронизируется до первого поиска в кэше: при её изменении кэш сбрасывается
+        get_retriever()
+        embeddings = get_embeddings()
+        return SemanticCache(embeddings, embeddings.model_id)
+    except Exception as e:
+        logger.error(f"Ошибка при инициализации семантического кэша: {e}")
+        return None
 
-def save_response(question, response, response_type="general"):
+def get_semantic_cache():
+    """Возвращает семантический кэш ответов или None, если он отключён."""
+    return _components.get("semantic_cache", _create_semantic_cache)
+
+def _create_similarity_grader():
+    if not GRADE_FAST_PATH:
+        return None
+    try:
+        return SimilarityGrader(get_embeddings())
+    except Exception as e:
+        logger.error(f"Ошибка при инициализации оценки документов по сходству: {e}")
+        return None
+
+def get_similarity_grader():
+    """Возвращает оценщик документов по сходству эмбеддингов или None, если он отключён."""
+    return _components.get("similarity_grader", _create_similarity_grader)
+
+def _create_reranker():
+    try:
+        reranker = CrossEncoderReranker()
+        logger.info(f"Модель переранжирования {reranker.model_name} успешно инициализирована")
+        return reranker
+    except Exception as e:
+        logger.error(f"Ошибка при инициализации модели переранжирования: {e}")
+        return None
+
+def get_reranker():
+    """Возвращает модель переранжирования или None, если она недоступна."""
+    return _components.get("reranker", _create_reranker)
+
+def save_response(question, response, response_type="general", file_tag=None):
     """
     Сохраняет ответ в структурированном формате в отдельный файл.
     
@@ -563,6 +562,10 @@ def save_response(question, response, response_type="general"):
         question (str): Вопрос пользователя
         response (str): Ответ системы
         response_type (str): Тип ответа (например, 'general', 'test_case', etc.)
+        file_tag (str): Метка, добавляемая к именам файлов (нужна, если ответы сохраняются параллельно)
+    
+    Returns:
+        str: Путь к файлу с ответом
     """
     try:
         # Создаем директории если их нет
@@ -576,6 +579,8 @@ def save_response(question, response, response_type="general"):
                 logger.info(f'Создана директория {dir_path}/')
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if file_tag:
+            timestamp = f"{timestamp}_{file_tag}"
         logger.info(f"Создание файлов с временной меткой: {timestamp}")
         
         # Форматируем ответ в структурированном виде
@@ -628,174 +633,113 @@ def save_response(question, response, response_type="general"):
                 logger.info(f'Java-код успешно сохранен в файл: {java_filename}')
             else:
                 logger.warning("Не удалось извлечь Java-код из ответа")
+        return txt_filename
     except Exception as e:
         logger.error(f'Ошибка при сохранении ответа: {str(e)}')
         logger.exception("Подробности ошибки:")
         raise
 
 # Функции для проверки качества ответов
-def check_factual_accuracy(context, generated_response):
-    """
-    Проверяет фактическую точность сгенерированного ответа.
-    
-    Args:
-        context (str): Исходные документы
-        generated_response (str): Сгенерированный ответ
-    
-    Returns:
-        dict: Результаты проверки фактической точности
-    """
-    try:
-        prompt = fact_checking_prompt.format(
-            context=context,
-            generated_response=generated_response
-        )
-        
-        result = gigachat.chat([HumanMessage(content=prompt)])
-        
-        if isinstance(result.content, str):
-            result = json.loads(result.content)
-            
-        logger.info(f"Результаты проверки фактической точности: {result}")
-        return result
-    except Exception as e:
-        logger.error(f"Ошибка при проверке фактической точности: {e}")
-        return {
-            "factual_accuracy": 0.0,
-            "hallucinations": ["Ошибка при проверке"],
-            "missing_facts": [],
-            "technical_accuracy": 0.0
-        }
-
-def compare_with_sources(context, generated_response, question):
+def _ask(prompt):
+    """Отправляет промпт GigaChat и возвращает текст ответа."""
+    return get_gigachat().chat(prompt).choices[0].message.content
+
+def validate_response(context, generated_response, question, mode=None):
     """
-    Сравнивает сгенерированный ответ с исходными документами.
+    Комплексная проверка качества сгенерированного ответа (RAG_Agent_Common.validate_response).
     
     Args:
         context (str): Исходные документы
         generated_response (str): Сгенерированный ответ
         question (str): Вопрос пользователя
+        mode (str): Режим проверки 'parallel' или 'fused' (по умолчанию RAG_VALIDATION_MODE)
     
     Returns:
-        dict: Результаты сравнения
+        tuple: (bool, dict) - флаг валидности и детальные результаты проверки
     """
-    try:
-        prompt = response_comparison_prompt.format(
-            context=context,
-            generated_response=generated_response,
-            question=question
-        )
-        
-        result = gigachat.chat([HumanMessage(content=prompt)])
-        
-        if isinstance(result.content, str):
-            result = json.loads(result.content)
-            
-        logger.info(f"Результаты сравнения с источниками: {result}")
-        return result
-    except Exception as e:
-        logger.error(f"Ошибка при сравнении с источниками: {e}")
-        return {
-            "completeness": 0.0,
-            "source_usage": 0.0,
-            "coherence": 0.0,
-            "needs_improvement": True,
-            "improvement_areas": ["Ошибка при сравнении"]
-        }
-
-def check_for_hallucinations(context, generated_response):
+    return check_response(_ask, context, generated_response, question, mode)
+
+def load_file(file_path):
     """
-    Проверяет ответ на наличие галлюцинаций.
+    Загружает PDF или TXT файл с тест-кейсом.
     
     Args:
-        context (str): Исходные документы
-        generated_response (str): Сгенерированный ответ
+        file_path (str): Путь к файлу
     
     Returns:
-        dict: Результаты проверки на галлюцинации
+        list: Документы LangChain
     """
-    try:
-        prompt = hallucination_check_prompt.format(
-            context=context,
-            generated_response=generated_response
-        )
-        
-        result = gigachat.chat([HumanMessage(content=prompt)])
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Файл не найден: {file_path}")
         
-        if isinstance(result.content, str):
-            result = json.loads(result.content)
-            
-        logger.info(f"Результаты проверки на галлюцинации: {result}")
-        return result
-    except Exception as e:
-        logger.error(f"Ошибка при проверке на галлюцинации: {e}")
-        return {
-            "has_hallucinations": True,
-            "hallucination_details": [{"statement": "Ошибка при проверке", "type": "error", "confidence": 0.0}],
-            "safe_to_use": False
-        }
-
-def validate_response(context, generated_response, question):
+    if file_path.endswith('.pdf'):
+        loader = PyPDFLoader(file_path)
+    elif file_path.endswith('.txt'):
+        loader = TextLoader(file_path, encoding='utf-8')
+    else:
+        raise ValueError("Поддерживаются только PDF и TXT файлы")
+    return loader.load()
+
+def run_test_case(file_path, max_retries=3):
     """
-    Комплексная проверка качества сгенерированного ответа.
+    Прогоняет один файл с ручным тест-кейсом через граф.
     
     Args:
-        context (str): Исходные документы
-        generated_response (str): Сгенерированный ответ
-        question (str): Вопрос пользователя
+        file_path (str): Путь к файлу тест-кейса
+        max_retries (int): Максимальное число попыток генерации внутри графа
     
     Returns:
-        tuple: (bool, dict) - флаг валидности и детальные результаты проверки
+        dict: Вопрос (question), ответ (response, пустая строка если он не получен),
+              число шагов генерации (loop_step), текст ошибки графа (error)
+              и признак ответа из семантического кэша (cached)
     """
-    # Проверка фактической точности
-    fact_check = check_factual_accuracy(context, generated_response)
-    
-    # Сравнение с источниками
-    source_comparison = compare_with_sources(context, generated_response, question)
-    
-    # Проверка на галлюцинации
-    hallucination_check = check_for_hallucinations(context, generated_response)
-    
-    # Агрегация результатов
-    validation_results = {
-        "factual_check": fact_check,
-        "source_comparison": source_comparison,
-        "hallucination_check": hallucination_check,
-        "overall_quality": (
-            fact_check.get("factual_accuracy", 0) * 0.4 +
-            source_comparison.get("completeness", 0) * 0.3 +
-            source_comparison.get("coherence", 0) * 0.3
-        )
+    test_case_file = os.path.basename(file_path)
+    inputs = {
+        "question": f"Создай автоматизированный тест на Java на основе ручного тест-кейса из файла {test_case_file}",
+        "max_retries": max_retries,
+        "documents": load_file(file_path),
+        "loop_step": 0,  # Добавляем начальное значение для счетчика попыток
+        "answers": 0  # Добавляем счетчик ответов
     }
+    logger.info(f"Задаю вопрос для создания автотеста: {inputs['question']}")
+    result = {"question": inputs["question"], "response": "", "loop_step": 0, "error": None, "cached": False}
+    
+    def generate():
+        response = ""
+        for event in graph.stream(inputs, stream_mode="values"):
+            logger.debug(event)
+            if "generation" in event:
+                response = event["generation"]
+                result["loop_step"] = event.get("loop_step", 0)
+                # Если получили ответ с кодом, прерываем цикл
+                if '```java' in response:
+                    logger.info("Получен ответ с Java-кодом, прерываем цикл")
+                    break
+                
+                # Проверяем количество попыток
+                if event.get("loop_step", 0) >= inputs["max_retries"]:
+                    logger.warning("Достигнуто максимальное количество попыток")
+                    break
+                    
+                # Проверяем количество ответов
+                if event.get("answers", 0) >= 5:
+                    logger.warning("Достигнуто максимальное количество ответов")
+                    break
+        return response
     
-    # Определение валидности ответа
-    is_valid = (
-        validation_results["overall_quality"] >= 0.7 and
-        not hallucination_check.get("has_hallucinations", True) and
-        not source_comparison.get("needs_improvement", True)
-    )
-    
-    logger.info(f"Результаты валидации ответа: valid={is_valid}, quality={validation_results['overall_quality']}")
+    try:
+        # Ответ на похожий вопрос к тому же тест-кейсу берётся из семантического кэша без запуска графа
+        result["response"], result["cached"] = answer_with_cache(
+            get_semantic_cache(), inputs["question"], inputs["documents"], generate)
+    except Exception as e:
+        logger.error(f"Ошибка при обработке графа: {e}")
+        result["error"] = str(e)
     
-    return is_valid, validation_results
+    return result
 
 if __name__ == "__main__":
-    # Пример использования системы для создания автотеста из ручного тест-кейса
-    
-    # Функция для загрузки файла
-    def load_file(file_path):
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"Файл не найден: {file_path}")
-            
-        if file_path.endswith('.pdf'):
-            loader = PyPDFLoader(file_path)
-        elif file_path.endswith('.txt'):
-            loader = TextLoader(file_path, encoding='utf-8')
-        else:
-            raise ValueError("Поддерживаются только PDF и TXT файлы")
-        return loader.load()
-
-    # Пример использования для создания автотеста
+    # Пример использования системы для создания автотеста из ручного тест-кейса.
+    # Для параллельной обработки большого числа тест-кейсов см. Batch_Runner.py
     try:
         # Путь к директории с тест-кейсами
         test_cases_dir = "test_cases"
@@ -821,47 +765,11 @@ if __name__ == "__main__":
             logger.info(f"Обрабатываю файл: {full_path}")
             
             try:
-                test_case_documents = load_file(full_path)
-                
-                inputs = {
-                    "question": f"Создай автоматизированный тест на Java на основе ручного тест-кейса из файла {test_case_file}",
-                    "max_retries": 3,
-                    "documents": test_case_documents,
-                    "loop_step": 0,  # Добавляем начальное значение для счетчика попыток
-                    "answers": 0  # Добавляем счетчик ответов
-                }
-                print("\nЗадаю вопрос для создания автотеста:", inputs["question"])
-                response = ""
+                result = run_test_case(full_path)
                 
-                try:
-                    for event in graph.stream(inputs, stream_mode="values"):
-                        logger.debug(event)
-                        if "generation" in event:
-                            response = event["generation"]
-                            # Если получили ответ с кодом, прерываем цикл
-                            if '```java' in response:
-                                logger.info("Получен ответ с Java-кодом, прерываем цикл")
-                                break
-                            
-                            # Проверяем количество попыток
-                            if event.get("loop_step", 0) >= inputs["max_retries"]:
-                                logger.warning("Достигнуто максимальное количество попыток")
-                                break
-                                
-                            # Проверяем количество ответов
-                            if event.get("answers", 0) >= 5:
-                                logger.warning("Достигнуто максимальное количество ответов")
-                                break
-                                
-                except Exception as e:
-                    logger.error(f"Ошибка при обработке графа: {e}")
-                    if response:  # Если успели получить ответ до ошибки
-                        save_response(inputs["question"], response, "test_case")
-                    continue
-                
-                # Сохраняем ответ
-                if response:
-                    save_response(inputs["question"], response, "test_case")
+                # Сохраняем ответ (в том числе полученный до ошибки графа)
+                if result["response"]:
+                    save_response(result["question"], result["response"], "test_case")
                 else:
                     logger.warning("Не удалось получить ответ с кодом")
                     
@@ -872,4 +780,17 @@ if __name__ == "__main__":
 
     except Exception as e:
         logger.error(f"Ошибка при создании автотеста: {e}")
-        logger.exception("Подробности ошибки:") 
\ No newline at end of file
+        logger.exception("Подробности ошибки:")
+    finally:
+        if LLM_CACHE_ENABLED:
+            logger.info(f"Статистика кэша ответов LLM: {get_default_cache().stats()}")
+        if _components.loaded("semantic_cache") is not None:
+            logger.info(f"Статистика семантического кэша: {_components.loaded('semantic_cache').stats()}")
+        if stream_stats()["generations"]:
+            logger.info(f"Потоковая генерация: {stream_stats()}")
+        if _components.loaded("similarity_grader") is not None:
+            logger.info(f"Оценка документов по сходству: {_components.loaded('similarity_grader').stats()}")
+        if retry_stats():
+            logger.info(f"Повторы вызовов модели: {retry_stats()}")
+        if hasattr(_components.loaded("web_search_tool"), 'stats'):
+            logger.info(f"Статистика кэша веб-поиска: {_components.loaded('web_search_tool').stats()}")
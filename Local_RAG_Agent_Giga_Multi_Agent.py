@@ -1,4 +1,3 @@
-from gigachat import GigaChat
 import os
 from dotenv import load_dotenv
 import logging
@@ -14,6 +13,9 @@ import concurrent.futures
 from queue import Queue
 import threading
 
+from LLM_Retry import resilient_gigachat, retry_stats
+from GigaChat_Registry import get_gigachat_client, aclose_gigachat_clients
+
 # Настройка логирования
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
@@ -35,6 +37,9 @@ else:
     logger.info("GIGACHAT_CREDENTIALS успешно загружен из .env")
 os.environ["GIGACHAT_CREDENTIALS"] = GIGACHAT_CREDENTIALS
 
+# Максимальное число одновременных запросов к GigaChat при параллельной обработке документов
+MAX_CONCURRENT_REQUESTS = int(os.getenv("RAG_MULTI_AGENT_CONCURRENCY", 4))
+
 # Промпты для агентов
 DOCUMENTATION_ANALYZER_PROMPT = """### Роль: Аналитик документации
 Ты - опытный аналитик, который анализирует документацию и преобразует её в структурированный формат для создания тест-кейсов.
@@ -288,10 +293,12 @@ class AgentValidator:
 class MultiAgentTestCaseGenerator:
     def __init__(self):
         try:
-            self.gigachat = GigaChat(
+            self.gigachat = resilient_gigachat(get_gigachat_client(
                 credentials=os.getenv("GIGACHAT_CREDENTIALS"),
                 verify_ssl_certs=False
-            )
+            ))
+            # Фазы разных документов выполняются одновременно, семафор ограничивает число запросов в работе
+            self.request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
             self.communication = AgentCommunication()
             self.validator = AgentValidator()
             logger.info("GigaChat успешно инициализирован")
@@ -386,7 +393,8 @@ class MultiAgentTestCaseGenerator:
         """Фаза анализа документации."""
         try:
             full_prompt = f"{DOCUMENTATION_ANALYZER_PROMPT}\n\n### Документация:\n{doc_content}"
-            response = self.gigachat.chat(full_prompt)
+            async with self.request_semaphore:
+                response = await self.gigachat.achat(full_prompt)
             
             if response and hasattr(response, 'choices') and response.choices:
                 content = response.choices[0].message.content
@@ -447,7 +455,8 @@ class MultiAgentTestCaseGenerator:
                 return []
 
             full_prompt = f"{TEST_CASE_CREATOR_PROMPT}\n\n### Анализ документации:\n{json.dumps(analysis.to_dict())}"
-            response = self.gigachat.chat(full_prompt)
+            async with self.request_semaphore:
+                response = await self.gigachat.achat(full_prompt)
             
             if response and hasattr(response, 'choices') and response.choices:
                 content = response.choices[0].message.content
@@ -490,7 +499,8 @@ class MultiAgentTestCaseGenerator:
                 return []
 
             full_prompt = f"{AUTOMATION_ENGINEER_PROMPT}\n\n### Ручные тест-кейсы:\n{json.dumps([case.to_dict() for case in test_cases])}"
-            response = self.gigachat.chat(full_prompt)
+            async with self.request_semaphore:
+                response = await self.gigachat.achat(full_prompt)
             
             if response and hasattr(response, 'choices') and response.choices:
                 content = response.choices[0].message.content
@@ -621,7 +631,8 @@ class MultiAgentTestCaseGenerator:
         """Основной метод генерации тест-кейсов с использованием мультиагентного подхода."""
         try:
             doc_name = os.path.basename(doc_path)
-            doc_content = self.load_file(doc_path)
+            # Чтение и разбор PDF выполняются в потоке, чтобы не блокировать обработку других документов
+            doc_content = await asyncio.to_thread(self.load_file, doc_path)
             
             # Запускаем обработку обратной связи
             feedback_task = asyncio.create_task(self.process_feedback())
@@ -691,6 +702,10 @@ async def main():
     except Exception as e:
         logger.error(f"Ошибка при создании тест-кейсов: {e}")
         logger.exception("Подробности ошибки:")
+    finally:
+        if retry_stats():
+            logger.info(f"Повторы вызовов модели: {retry_stats()}")
+        await aclose_gigachat_clients()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
@@ -1,4 +1,3 @@
-from gigachat import GigaChat
 import os
 from dotenv import load_dotenv
 import logging
@@ -6,6 +5,9 @@ from datetime import datetime
 from PyPDF2 import PdfReader
 from typing import Dict, List, Optional
 
+from LLM_Retry import resilient_gigachat, retry_stats
+from GigaChat_Registry import get_gigachat_client
+
 # Настройка логирования
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
@@ -84,10 +86,10 @@ RESEARCHER_PROMPT = """### Роль: Исследователь тест-кей
 class TestCaseGenerator:
     def __init__(self):
         try:
-            self.gigachat = GigaChat(
+            self.gigachat = resilient_gigachat(get_gigachat_client(
                 credentials=os.getenv("GIGACHAT_CREDENTIALS"),
                 verify_ssl_certs=False
-            )
+            ))
             logger.info("GigaChat успешно инициализирован")
         except Exception as e:
             logger.error(f"Ошибка при инициализации GigaChat: {e}")
@@ -241,6 +243,9 @@ def main():
     except Exception as e:
         logger.error(f"Ошибка при создании тест-кейсов: {e}")
         logger.exception("Подробности ошибки:")
+    finally:
+        if retry_stats():
+            logger.info(f"Повторы вызовов модели: {retry_stats()}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
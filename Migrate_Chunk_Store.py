@@ -0,0 +1,73 @@
+"""
+Перенос docstore векторной Базы-Знаний из index.pkl (формат FAISS.save_local)
+в хранилище чанков (Chunk_Store.py).
+
+Индекс index.faiss не меняется. Без переноса каталог будет перенесён
+автоматически при первом запуске агента.
+
+Запуск:
+    python Migrate_Chunk_Store.py --db db/db_01 --remove-pickle
+"""
+import argparse
+import logging
+import os
+
+import faiss
+
+from Chunk_Store import PICKLE_FILE_NAME, migrate_pickled_docstore
+
+logger = logging.getLogger(__name__)
+
+
+def migrate(db_dir, remove_pickle=False):
+    """
+    Переносит один каталог индекса.
+
+    Args:
+        db_dir (str): Каталог с индексом FAISS
+        remove_pickle (bool): Удалить index.pkl после переноса
+
+    Returns:
+        bool: True, если перенос выполнен и хранилище соответствует индексу
+    """
+    if not os.path.exists(os.path.join(db_dir, PICKLE_FILE_NAME)):
+        logger.error(f"В каталоге {db_dir} нет файла {PICKLE_FILE_NAME}")
+        return False
+
+    try:
+        count = migrate_pickled_docstore(db_dir)
+    except Exception as e:
+        logger.error(f"Ошибка при переносе каталога {db_dir}: {e}")
+        return False
+
+    index_path = os.path.join(db_dir, 'index.faiss')
+    if os.path.exists(index_path):
+        ntotal = faiss.read_index(index_path).ntotal
+        if ntotal != count:
+            logger.error(f"Число чанков ({count}) не совпадает с числом векторов индекса ({ntotal}): {db_dir}")
+            return False
+    else:
+        logger.warning(f"В каталоге {db_dir} нет индекса index.faiss")
+
+    if remove_pickle:
+        os.remove(os.path.join(db_dir, PICKLE_FILE_NAME))
+        logger.info(f"Файл {PICKLE_FILE_NAME} удалён из {db_dir}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перенос docstore из index.pkl в хранилище чанков")
+    parser.add_argument("--db", nargs="+", default=["db/db_01"], help="Каталоги с индексом FAISS")
+    parser.add_argument("--remove-pickle", action="store_true", help="Удалить index.pkl после переноса")
+    args = parser.parse_args()
+
+    failed = [db_dir for db_dir in args.db if not migrate(db_dir, args.remove_pickle)]
+    if failed:
+        logger.error(f"Не перенесены: {', '.join(failed)}")
+    else:
+        logger.info(f"Перенесено каталогов: {len(args.db)}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
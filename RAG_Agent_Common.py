@@ -0,0 +1,495 @@
+"""
+Общий код агентов Local_RAG_Agent (Ollama) и Local_RAG_Agent_Giga (GigaChat).
+
+Агенты отличаются только моделью, поэтому оценка релевантности документов
+и проверка сгенерированного ответа собраны здесь и получают функцию запроса
+к модели ask(prompt) -> str. Здесь же реестр компонентов агента (моделей,
+эмбеддингов, ретривера, веб-поиска), создаваемых при первом обращении.
+"""
+import copy
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Concurrency_Utils import run_concurrently
+
+logger = logging.getLogger(__name__)
+
+# Режим проверки ответа: 'parallel' - три отдельных запроса, 'fused' - один объединённый запрос
+VALIDATION_MODE = os.getenv("RAG_VALIDATION_MODE", "parallel")
+
+# Параметры параллельной оценки документов: число одновременных запросов и таймаут одного запроса (сек)
+GRADER_CONCURRENCY = int(os.getenv("RAG_GRADER_CONCURRENCY", 4))
+GRADER_TIMEOUT = float(os.getenv("RAG_GRADER_TIMEOUT", 60))
+
+# Пауза (сек) перед повторной попыткой создать компонент, который не удалось создать
+COMPONENT_RETRY_INTERVAL = float(os.getenv("RAG_COMPONENT_RETRY_INTERVAL", 30))
+
+
+class ComponentRegistry:
+    """
+    Компоненты агента, создаваемые при первом обращении.
+
+    Фабрика при ошибке либо выбрасывает исключение, либо пишет ошибку в лог и
+    возвращает None. Ни то, ни другое не кэшируется: временная недоступность
+    Ollama, GigaChat или модели эмбеддингов при запуске не отключает компонент
+    до конца работы процесса. После None повторная попытка выполняется не раньше,
+    чем через retry_interval секунд, чтобы узлы графа не пересоздавали компонент
+    на каждом вызове.
+    """
+
+    def __init__(self, retry_interval: float = None):
+        self.retry_interval = COMPONENT_RETRY_INTERVAL if retry_interval is None else retry_interval
+        self._components = {}
+        self._failed_at = {}
+        self._lock = threading.RLock()
+
+    def get(self, name, factory):
+        """
+        Возвращает компонент, создавая его при первом обращении.
+
+        Args:
+            name (str): Имя компонента
+            factory (callable): Функция создания компонента
+
+        Returns:
+            Созданный компонент или None, если его не удалось создать
+        """
+        with self._lock:
+            component = self._components.get(name)
+            if component is not None:
+                return component
+            failed_at = self._failed_at.get(name)
+            if failed_at is not None and time.monotonic() - failed_at < self.retry_interval:
+                return None
+
+            component = factory()
+            if component is None:
+                self._failed_at[name] = time.monotonic()
+                return None
+            self._failed_at.pop(name, None)
+            self._components[name] = component
+            return component
+
+    def loaded(self, name):
+        """Возвращает уже созданный компонент или None, не создавая его."""
+        return self._components.get(name)
+
+
+doc_grader_instructions = """You are a grader assessing relevance of a retrieved document to a user question.
+    If the document contains keyword(s) or semantic meaning related to the question, grade it as relevant."""
+
+# Промпт для проверки фактической точности
+fact_checking_prompt = """Ты - эксперт по проверке фактической точности. Проанализируй сгенерированный ответ и исходные документы.
+
+Исходные документы:
+{context}
+
+Сгенерированный ответ:
+{generated_response}
+
+Оцени:
+1. Соответствие фактов в ответе исходным документам
+2. Наличие утверждений, которых нет в исходных документах
+3. Точность технических деталей
+
+Верни JSON в формате:
+{{
+    "factual_accuracy": float, // от 0 до 1
+    "hallucinations": [string], // список найденных галлюцинаций
+    "missing_facts": [string], // важные факты из документов, пропущенные в ответе
+    "technical_accuracy": float // от 0 до 1
+}}"""
+
+# Промпт для сравнения ответа с документами
+response_comparison_prompt = """Проанализируй соответствие сгенерированного ответа исходным документам.
+
+Исходные документы:
+{context}
+
+Сгенерированный ответ:
+{generated_response}
+
+Вопрос пользователя:
+{question}
+
+Оцени:
+1. Полноту ответа на вопрос
+2. Использование информации из документов
+3. Логическую связность
+
+Верни JSON в формате:
+{{
+    "completeness": float, // от 0 до 1
+    "source_usage": float, // от 0 до 1
+    "coherence": float, // от 0 до 1
+    "needs_improvement": boolean,
+    "improvement_areas": [string]
+}}"""
+
+# Промпт для определения галлюцинаций
+hallucination_check_prompt = """Проверь сгенерированный ответ на наличие галлюцинаций и необоснованных утверждений.
+
+Исходные документы:
+{context}
+
+Сгенерированный ответ:
+{generated_response}
+
+Проверь:
+1. Каждое фактическое утверждение
+2. Каждую техническую деталь
+3. Каждую ссылку на источники
+
+Верни JSON в формате:
+{{
+    "has_hallucinations": boolean,
+    "hallucination_details": [
+        {{
+            "statement": string,
+            "type": "fact|technical|reference",
+            "confidence": float
+        }}
+    ],
+    "safe_to_use": boolean
+}}"""
+
+# Объединённый промпт: все три проверки одним запросом (режим проверки "fused")
+combined_validation_prompt = """Ты - эксперт по проверке качества ответов. Проанализируй сгенерированный ответ, исходные документы и вопрос пользователя.
+
+Исходные документы:
+{context}
+
+Сгенерированный ответ:
+{generated_response}
+
+Вопрос пользователя:
+{question}
+
+Выполни три проверки:
+1. Фактическая точность: соответствие фактов исходным документам, утверждения, которых нет в документах, точность технических деталей
+2. Сравнение с источниками: полнота ответа на вопрос, использование информации из документов, логическая связность
+3. Галлюцинации: каждое фактическое утверждение, каждая техническая деталь, каждая ссылка на источники
+
+Верни JSON в формате:
+{{
+    "factual_check": {{
+        "factual_accuracy": float, // от 0 до 1
+        "hallucinations": [string], // список найденных галлюцинаций
+        "missing_facts": [string], // важные факты из документов, пропущенные в ответе
+        "technical_accuracy": float // от 0 до 1
+    }},
+    "source_comparison": {{
+        "completeness": float, // от 0 до 1
+        "source_usage": float, // от 0 до 1
+        "coherence": float, // от 0 до 1
+        "needs_improvement": boolean,
+        "improvement_areas": [string]
+    }},
+    "hallucination_check": {{
+        "has_hallucinations": boolean,
+        "hallucination_details": [
+            {{
+                "statement": string,
+                "type": "fact|technical|reference",
+                "confidence": float
+            }}
+        ],
+        "safe_to_use": boolean
+    }}
+}}"""
+
+# Результаты проверок, возвращаемые при ошибке запроса или разбора ответа
+FACT_CHECK_FALLBACK = {
+    "factual_accuracy": 0.0,
+    "hallucinations": ["Ошибка при проверке"],
+    "missing_facts": [],
+    "technical_accuracy": 0.0
+}
+
+SOURCE_COMPARISON_FALLBACK = {
+    "completeness": 0.0,
+    "source_usage": 0.0,
+    "coherence": 0.0,
+    "needs_improvement": True,
+    "improvement_areas": ["Ошибка при сравнении"]
+}
+
+HALLUCINATION_CHECK_FALLBACK = {
+    "has_hallucinations": True,
+    "hallucination_details": [{"statement": "Ошибка при проверке", "type": "error", "confidence": 0.0}],
+    "safe_to_use": False
+}
+
+
+def grade_document(ask, doc, question):
+    """
+    Оценивает релевантность одного документа вопросу пользователя.
+
+    Args:
+        ask (callable): Функция запроса к модели, возвращающая текст ответа
+        doc: Документ (Document или строка)
+        question (str): Вопрос пользователя
+
+    Returns:
+        bool: True, если документ релевантен, или None, если модель не ответила
+    """
+    content = doc.page_content if hasattr(doc, 'page_content') else str(doc)
+
+    # Формируем промпт для оценки
+    grading_prompt = f"""
+    {doc_grader_instructions}
+    
+    Document: {content}
+    Question: {question}
+    
+    Is this document relevant? Return only 'yes' or 'no'.
+    """
+
+    try:
+        content = ask(grading_prompt)
+        return isinstance(content, str) and 'yes' in content.lower()
+    except Exception as e:
+        logger.error(f"Ошибка при оценке документа: {e}")
+        return None
+
+
+def select_relevant_documents(ask, question, documents, similarity_grader=None):
+    """
+    Отбирает документы, релевантные вопросу.
+
+    Args:
+        ask (callable): Функция запроса к модели, возвращающая текст ответа
+        question (str): Вопрос пользователя
+        documents (list): Документы для оценки
+        similarity_grader (SimilarityGrader): Оценка по сходству эмбеддингов или None
+
+    Returns:
+        list: Релевантные документы в исходном порядке
+    """
+    def grade_with_llm(docs):
+        # Документы оцениваются параллельно, порядок оценок совпадает с порядком документов
+        return run_concurrently(
+            lambda doc: grade_document(ask, doc, question),
+            docs,
+            max_workers=GRADER_CONCURRENCY,
+            timeout=GRADER_TIMEOUT,
+            default=None
+        )
+
+    # Явно релевантные и явно нерелевантные по сходству эмбеддингов документы не отправляются модели
+    if similarity_grader is not None:
+        grades = similarity_grader.grade(question, documents, grade_with_llm)
+    else:
+        grades = grade_with_llm(documents)
+    return [doc for doc, is_relevant in zip(documents, grades) if is_relevant]
+
+
+def parse_json_response(content):
+    """
+    Извлекает JSON-объект из ответа модели.
+
+    Args:
+        content (str): Текст ответа модели
+
+    Returns:
+        dict: Разобранный JSON
+    """
+    # Модель может обернуть JSON в markdown-блок или добавить пояснения
+    content = re.sub(r'```json\s*|\s*```', '', str(content))
+    json_match = re.search(r'\{[\s\S]*\}', content)
+    return json.loads(json_match.group() if json_match else content)
+
+
+def check_factual_accuracy(ask, context, generated_response):
+    """
+    Проверяет фактическую точность сгенерированного ответа.
+
+    Args:
+        ask (callable): Функция запроса к модели, возвращающая текст ответа
+        context (str): Исходные документы
+        generated_response (str): Сгенерированный ответ
+
+    Returns:
+        dict: Результаты проверки фактической точности
+    """
+    try:
+        prompt = fact_checking_prompt.format(
+            context=context,
+            generated_response=generated_response
+        )
+
+        result = parse_json_response(ask(prompt))
+
+        logger.info(f"Результаты проверки фактической точности: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Ошибка при проверке фактической точности: {e}")
+        return copy.deepcopy(FACT_CHECK_FALLBACK)
+
+
+def compare_with_sources(ask, context, generated_response, question):
+    """
+    Сравнивает сгенерированный ответ с исходными документами.
+
+    Args:
+        ask (callable): Функция запроса к модели, возвращающая текст ответа
+        context (str): Исходные документы
+        generated_response (str): Сгенерированный ответ
+        question (str): Вопрос пользователя
+
+    Returns:
+        dict: Результаты сравнения
+    """
+    try:
+        prompt = response_comparison_prompt.format(
+            context=context,
+            generated_response=generated_response,
+            question=question
+        )
+
+        result = parse_json_response(ask(prompt))
+
+        logger.info(f"Результаты сравнения с источниками: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Ошибка при сравнении с источниками: {e}")
+        return copy.deepcopy(SOURCE_COMPARISON_FALLBACK)
+
+
+def check_for_hallucinations(ask, context, generated_response):
+    """
+    Проверяет ответ на наличие галлюцинаций.
+
+    Args:
+        ask (callable): Функция запроса к модели, возвращающая текст ответа
+        context (str): Исходные документы
+        generated_response (str): Сгенерированный ответ
+
+    Returns:
+        dict: Результаты проверки на галлюцинации
+    """
+    try:
+        prompt = hallucination_check_prompt.format(
+            context=context,
+            generated_response=generated_response
+        )
+
+        result = parse_json_response(ask(prompt))
+
+        logger.info(f"Результаты проверки на галлюцинации: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Ошибка при проверке на галлюцинации: {e}")
+        return copy.deepcopy(HALLUCINATION_CHECK_FALLBACK)
+
+
+def run_validators(ask, context, generated_response, question):
+    """
+    Выполняет три отдельные проверки ответа параллельно.
+
+    Args:
+        ask (callable): Функция запроса к модели, возвращающая текст ответа
+        context (str): Исходные документы
+        generated_response (str): Сгенерированный ответ
+        question (str): Вопрос пользователя
+
+    Returns:
+        tuple: (fact_check, source_comparison, hallucination_check)
+    """
+    # Проверки независимы, поэтому выполняются параллельно
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        fact_future = executor.submit(check_factual_accuracy, ask, context, generated_response)
+        comparison_future = executor.submit(compare_with_sources, ask, context, generated_response, question)
+        hallucination_future = executor.submit(check_for_hallucinations, ask, context, generated_response)
+
+    return fact_future.result(), comparison_future.result(), hallucination_future.result()
+
+
+def check_combined(ask, context, generated_response, question):
+    """
+    Выполняет проверку фактической точности, сравнение с источниками и
+    проверку на галлюцинации одним запросом к модели.
+
+    Args:
+        ask (callable): Функция запроса к модели, возвращающая текст ответа
+        context (str): Исходные документы
+        generated_response (str): Сгенерированный ответ
+        question (str): Вопрос пользователя
+
+    Returns:
+        tuple: (fact_check, source_comparison, hallucination_check) в формате отдельных проверок
+    """
+    try:
+        prompt = combined_validation_prompt.format(
+            context=context,
+            generated_response=generated_response,
+            question=question
+        )
+
+        result = parse_json_response(ask(prompt))
+
+        logger.info(f"Результаты объединенной проверки: {result}")
+    except Exception as e:
+        logger.error(f"Ошибка при объединенной проверке: {e}")
+        result = {}
+
+    # Отсутствующие в ответе разделы заменяются результатами по умолчанию
+    sections = []
+    for key, fallback in [
+        ("factual_check", FACT_CHECK_FALLBACK),
+        ("source_comparison", SOURCE_COMPARISON_FALLBACK),
+        ("hallucination_check", HALLUCINATION_CHECK_FALLBACK)
+    ]:
+        section = result.get(key)
+        sections.append(section if isinstance(section, dict) else copy.deepcopy(fallback))
+    return tuple(sections)
+
+
+def validate_response(ask, context, generated_response, question, mode=None):
+    """
+    Комплексная проверка качества сгенерированного ответа.
+
+    Args:
+        ask (callable): Функция запроса к модели, возвращающая текст ответа
+        context (str): Исходные документы
+        generated_response (str): Сгенерированный ответ
+        question (str): Вопрос пользователя
+        mode (str): Режим проверки 'parallel' или 'fused' (по умолчанию VALIDATION_MODE)
+
+    Returns:
+        tuple: (bool, dict) - флаг валидности и детальные результаты проверки
+    """
+    mode = mode or VALIDATION_MODE
+
+    if mode == "fused":
+        fact_check, source_comparison, hallucination_check = check_combined(ask, context, generated_response, question)
+    else:
+        fact_check, source_comparison, hallucination_check = run_validators(ask, context, generated_response, question)
+
+    # Агрегация результатов
+    validation_results = {
+        "factual_check": fact_check,
+        "source_comparison": source_comparison,
+        "hallucination_check": hallucination_check,
+        "overall_quality": (
+            fact_check.get("factual_accuracy", 0) * 0.4 +
+            source_comparison.get("completeness", 0) * 0.3 +
+            source_comparison.get("coherence", 0) * 0.3
+        )
+    }
+
+    # Определение валидности ответа
+    is_valid = (
+        validation_results["overall_quality"] >= 0.7 and
+        not hallucination_check.get("has_hallucinations", True) and
+        not source_comparison.get("needs_improvement", True)
+    )
+
+    logger.info(f"Результаты валидации ответа: valid={is_valid}, quality={validation_results['overall_quality']}")
+
+    return is_valid, validation_results
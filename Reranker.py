@@ -0,0 +1,102 @@
+"""
+Переранжирование найденных чанков локальной моделью cross-encoder.
+
+Узел графа rerank стоит между retrieve и grade_documents: ретривер отдаёт
+больше кандидатов (RAG_RERANK_CANDIDATES), cross-encoder оценивает пары
+(вопрос, чанк) одним батчем на CPU, чанки с низкой оценкой отбрасываются,
+а дальше проходят только лучшие RAG_RERANK_TOP_N. Поэтому к LLM-оценщику
+документов уходит меньше запросов, а контекст генерации становится короче.
+
+Модель загружается через sentence-transformers (он же используется
+эмбеддингами HuggingFace); если модель недоступна, кандидаты отбираются
+по оценке ретривера.
+"""
+import logging
+import os
+import time
+from typing import List
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# Включение узла переранжирования в графе
+RERANK_ENABLED = os.getenv("RAG_RERANK", "0") == "1"
+RERANK_MODEL = os.getenv("RAG_RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+# Сколько кандидатов отдаёт ретривер, сколько лучших проходит дальше и минимальная оценка модели (0..1)
+RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", 20))
+RERANK_TOP_N = int(os.getenv("RAG_RERANK_TOP_N", 3))
+RERANK_MIN_SCORE = float(os.getenv("RAG_RERANK_MIN_SCORE", 0.1))
+RERANK_BATCH_SIZE = int(os.getenv("RAG_RERANK_BATCH_SIZE", 16))
+RERANK_MAX_LENGTH = int(os.getenv("RAG_RERANK_MAX_LENGTH", 512))
+
+
+class CrossEncoderReranker:
+    """Оценка релевантности пар (вопрос, чанк) моделью cross-encoder"""
+
+    def __init__(self, model_name: str = None, batch_size: int = None, max_length: int = None, device: str = "cpu"):
+        from sentence_transformers import CrossEncoder
+
+        self.model_name = model_name or RERANK_MODEL
+        self.batch_size = batch_size or RERANK_BATCH_SIZE
+        self.model = CrossEncoder(self.model_name, max_length=max_length or RERANK_MAX_LENGTH, device=device)
+
+    def score(self, question: str, texts: List[str]) -> List[float]:
+        """Возвращает оценки релевантности текстов вопросу."""
+        if not texts:
+            return []
+        scores = self.model.predict([(question, text) for text in texts], batch_size=self.batch_size,
+                                    show_progress_bar=False)
+        return [float(score) for score in scores]
+
+
+def rerank_documents(reranker, question, documents, top_n: int = None, min_score: float = None):
+    """
+    Переранжирует найденные ретривером документы.
+
+    Переранжируются только документы с оценкой ретривера (metadata['score']);
+    остальные (исходный тест-кейс, результаты веб-поиска) сохраняются в начале
+    списка в исходном порядке.
+
+    Args:
+        reranker (CrossEncoderReranker): Модель или None (тогда отбор по оценке ретривера)
+        question (str): Вопрос пользователя
+        documents (list): Документы из состояния графа
+        top_n (int): Сколько лучших документов оставить (по умолчанию RAG_RERANK_TOP_N)
+        min_score (float): Минимальная оценка модели (по умолчанию RAG_RERANK_MIN_SCORE)
+
+    Returns:
+        list: Документы; у переранжированных оценка модели записана в metadata['rerank_score'],
+              а metadata['score'] остаётся оценкой ретривера - по ней Document_Set и
+              Context_Builder сравнивают документы из разных запросов
+    """
+    top_n = top_n or RERANK_TOP_N
+    min_score = RERANK_MIN_SCORE if min_score is None else min_score
+
+    kept = [doc for doc in documents if (getattr(doc, 'metadata', None) or {}).get('score') is None]
+    candidates = [doc for doc in documents if (getattr(doc, 'metadata', None) or {}).get('score') is not None]
+    if not candidates:
+        return documents
+
+    if reranker is None:
+        ranked = sorted(candidates, key=lambda doc: doc.metadata['score'], reverse=True)
+        return kept + ranked[:top_n]
+
+    started = time.perf_counter()
+    try:
+        scores = reranker.score(question, [doc.page_content for doc in candidates])
+    except Exception as e:
+        logger.error(f"Ошибка при переранжировании документов: {e}")
+        ranked = sorted(candidates, key=lambda doc: doc.metadata['score'], reverse=True)
+        return kept + ranked[:top_n]
+
+    ranked = sorted(zip(candidates, scores), key=lambda item: item[1], reverse=True)
+    selected = []
+    for doc, score in ranked[:top_n]:
+        if score < min_score:
+            break
+        selected.append(Document(page_content=doc.page_content, metadata={**doc.metadata, "rerank_score": score}))
+
+    logger.info(f"Переранжирование: оставлено {len(selected)} из {len(candidates)} документов "
+                f"за {time.perf_counter() - started:.2f} с")
+    return kept + selected
@@ -0,0 +1,220 @@
+"""
+Семантический кэш ответов агента.
+
+Ответ зависит от тест-кейса целиком: тест-кейсы, различающиеся одной деталью
+(эндпоинт, ожидаемый статус), дают почти одинаковые эмбеддинги, но требуют
+разных автотестов. Поэтому исходные документы (тест-кейс) сравниваются
+точно - по sha256 содержимого, а по сходству эмбеддингов сравнивается
+только вопрос пользователя: если для того же тест-кейса уже был ответ на
+вопрос со сходством не ниже порога, он возвращается без запуска графа.
+Вопрос переводится в эмбеддинг той же моделью, что и База-Знаний (для
+моделей e5 - с префиксом "query: ", как требует модель).
+
+Кэш хранится в sqlite, ограничен по числу записей (вытесняются давно не
+использованные) и по времени жизни записи. При изменении Базы-Знаний кэш
+сбрасывается (invalidate_semantic_cache), так как ответы зависят от
+найденных документов.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from Document_Set import document_text
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", 'db/semantic_cache.sqlite')
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 1000))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", 7 * 24 * 3600))
+
+
+def documents_hash(documents) -> str:
+    """Возвращает sha256 содержимого исходных документов (тест-кейса) в их порядке."""
+    digest = hashlib.sha256()
+    for doc in documents or []:
+        digest.update(document_text(doc).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def query_prefix(model_id: str) -> str:
+    """Возвращает префикс запроса, с которым обучена модель эмбеддингов (e5: "query: ")."""
+    return "query: " if model_id and 'e5' in model_id.lower() else ""
+
+
+def passage_prefix(model_id: str) -> str:
+    """Возвращает префикс документа, с которым обучена модель эмбеддингов (e5: "passage: ")."""
+    return "passage: " if model_id and 'e5' in model_id.lower() else ""
+
+
+class SemanticCache:
+    """Кэш ответов с поиском по косинусному сходству эмбеддингов запросов"""
+
+    def __init__(self, embeddings, model_id: str, path: str = SEMANTIC_CACHE_PATH,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl: float = SEMANTIC_CACHE_TTL):
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+            logger.info(f'Создана директория {cache_dir}/')
+
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.query_prefix = query_prefix(model_id)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(answers)")]
+        if columns and 'documents_hash' not in columns:
+            # Записи прежнего формата искались по сходству вместе с тест-кейсом и могут относиться к другому тест-кейсу
+            self.connection.execute("DROP TABLE answers")
+            logger.info("Семантический кэш прежнего формата удалён")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS answers (id INTEGER PRIMARY KEY, model_id TEXT NOT NULL, "
+            "documents_hash TEXT NOT NULL, question TEXT NOT NULL, vector BLOB NOT NULL, "
+            "generation TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS answers_documents ON answers (model_id, documents_hash)"
+        )
+        self.connection.commit()
+
+    def _embed(self, question: str):
+        vector = np.asarray(self.embeddings.embed_query(self.query_prefix + question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, question: str, documents):
+        """
+        Ищет ответ на похожий вопрос к тому же тест-кейсу.
+
+        Args:
+            question (str): Вопрос пользователя
+            documents (list): Исходные документы (тест-кейс); должны совпадать точно
+
+        Returns:
+            str | None: Сохранённый ответ или None
+        """
+        key = documents_hash(documents)
+        now = time.time()
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, vector FROM answers WHERE model_id = ? AND documents_hash = ?", (self.model_id, key)
+            ).fetchall()
+        if not rows:
+            self.misses += 1
+            return None
+
+        # Эмбеддинг вопроса считается, только если для этого тест-кейса есть ответы
+        query = self._embed(question)
+        with self.lock:
+            ids = [row[0] for row in rows]
+            vectors = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+            similarities = vectors @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry_id = ids[best]
+            row = self.connection.execute(
+                "SELECT generation, created_at FROM answers WHERE id = ?", (entry_id,)
+            ).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                self.connection.execute("DELETE FROM answers WHERE id = ?", (entry_id,))
+                self.connection.commit()
+                self.misses += 1
+                return None
+
+            self.connection.execute("UPDATE answers SET accessed_at = ? WHERE id = ?", (now, entry_id))
+            self.connection.commit()
+            self.hits += 1
+            logger.info(f"Ответ взят из семантического кэша (сходство {similarities[best]:.3f})")
+            return row[0]
+
+    def put(self, question: str, documents, generation: str) -> None:
+        """Сохраняет ответ на вопрос к тест-кейсу и вытесняет давно не использованные записи."""
+        vector = self._embed(question)
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO answers (model_id, documents_hash, question, vector, generation, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.model_id, documents_hash(documents), question, vector.tobytes(), generation, now, now)
+            )
+            count = self.connection.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            if count > self.max_entries:
+                self.connection.execute(
+                    "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY accessed_at LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+                self.evictions += count - self.max_entries
+            self.connection.commit()
+
+    def stats(self) -> dict:
+        """Возвращает счётчики попаданий, промахов и вытеснений."""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+def invalidate_semantic_cache(path: str = SEMANTIC_CACHE_PATH) -> None:
+    """
+    Удаляет все записи кэша (вызывается при изменении Базы-Знаний).
+
+    Открытые экземпляры SemanticCache (в том числе в других процессах)
+    читают записи из базы при каждом поиске и сразу видят изменение.
+    """
+    if not os.path.exists(path):
+        return
+    connection = sqlite3.connect(path)
+    try:
+        count = connection.execute("DELETE FROM answers").rowcount
+        connection.commit()
+    finally:
+        connection.close()
+    logger.info(f"Семантический кэш сброшен: удалено {count} записей")
+
+
+def answer_with_cache(semantic_cache, question, documents, generate):
+    """
+    Возвращает ответ из семантического кэша или получает его и сохраняет в кэш.
+
+    Args:
+        semantic_cache (SemanticCache): Кэш или None (тогда ответ всегда генерируется)
+        question (str): Вопрос пользователя
+        documents (list): Исходные документы (тест-кейс)
+        generate (callable): Функция без аргументов, возвращающая ответ (запуск графа);
+                             исключение из неё пробрасывается, и ответ не кэшируется
+
+    Returns:
+        tuple: (ответ, True если ответ взят из кэша)
+    """
+    if semantic_cache is not None:
+        try:
+            cached_response = semantic_cache.lookup(question, documents)
+        except Exception as e:
+            logger.error(f"Ошибка при поиске в семантическом кэше: {e}")
+            cached_response = None
+        if cached_response:
+            return cached_response, True
+
+    response = generate()
+    # Кэшируются только ответы с Java-кодом: остальные - неудачные попытки генерации
+    if semantic_cache is not None and response and '```java' in response:
+        try:
+            semantic_cache.put(question, documents, response)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении ответа в семантический кэш: {e}")
+    return response, False
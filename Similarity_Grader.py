@@ -0,0 +1,298 @@
+"""
+Быстрая оценка релевантности документов по косинусному сходству эмбеддингов.
+
+Перед LLM-оценкой в grade_documents считается сходство вопроса с каждым
+документом: документы выше верхнего порога принимаются, ниже нижнего -
+отклоняются без запроса к модели, и только документы из промежуточной
+полосы уходят LLM-оценщику. Для моделей e5 вопрос и документы переводятся в
+эмбеддинги с префиксами "query: " и "passage: ", как требует модель (и как
+в Semantic_Cache.py); эмбеддинги документов берутся из кэша эмбеддингов
+(Embedding_Cache.py), поэтому повторно встреченные чанки не пересчитываются.
+
+Распределение сходства зависит от модели эмбеддингов: у усреднённых
+эмбеддингов bert-base-uncased и у e5 сходство почти любых двух текстов
+заметно выше 0.3 и нередко выше 0.9, так что общие для всех моделей пороги
+пропускают настоящую проверку. Поэтому пороги задаются для каждой модели (model_id) и берутся из
+файла калибровки RAG_GRADE_THRESHOLDS_PATH; пока для модели нет порогов, все
+документы оцениваются LLM. Вердикты LLM вместе со сходством записываются в
+RAG_GRADE_SAMPLES_PATH, и по ним пороги подбираются командой:
+
+    python Similarity_Grader.py --calibrate
+
+Порог принятия выбирается так, чтобы среди документов со сходством не ниже
+него LLM признала релевантными не меньше RAG_GRADE_CALIBRATION_PRECISION
+(по умолчанию 95%); порог отклонения - симметрично для нерелевантных.
+Переменные RAG_GRADE_ACCEPT_SIMILARITY и RAG_GRADE_REJECT_SIMILARITY
+задают пороги вручную для любой модели.
+
+Вердикты и пороги помечаются признаком prefixed: для моделей с префиксами
+сходство без них распределено иначе, поэтому откалиброванные без префиксов
+пороги и вердикты не используются и модель нужно откалибровать заново.
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from Semantic_Cache import passage_prefix, query_prefix
+
+logger = logging.getLogger(__name__)
+
+GRADE_FAST_PATH = os.getenv("RAG_GRADE_FAST_PATH", "1") == "1"
+# Пороги, заданные вручную для любой модели (иначе берутся из файла калибровки)
+GRADE_ACCEPT_SIMILARITY = os.getenv("RAG_GRADE_ACCEPT_SIMILARITY")
+GRADE_REJECT_SIMILARITY = os.getenv("RAG_GRADE_REJECT_SIMILARITY")
+GRADE_THRESHOLDS_PATH = os.getenv("RAG_GRADE_THRESHOLDS_PATH", 'db/grade_thresholds.json')
+# Файл вердиктов LLM для калибровки; пустое значение отключает запись
+GRADE_SAMPLES_PATH = os.getenv("RAG_GRADE_SAMPLES_PATH", 'db/grade_samples.jsonl')
+# Доля верных решений среди документов за порогом и минимальное число вердиктов для калибровки
+GRADE_CALIBRATION_PRECISION = float(os.getenv("RAG_GRADE_CALIBRATION_PRECISION", 0.95))
+GRADE_CALIBRATION_MIN_SAMPLES = int(os.getenv("RAG_GRADE_CALIBRATION_MIN_SAMPLES", 50))
+
+
+def uses_prefixes(model_id: str) -> bool:
+    """Возвращает True, если вопрос и документы переводятся в эмбеддинги с префиксами модели."""
+    return bool(query_prefix(model_id) or passage_prefix(model_id))
+
+
+def load_thresholds(model_id: str, path: str = GRADE_THRESHOLDS_PATH):
+    """
+    Возвращает откалиброванные пороги модели эмбеддингов.
+
+    Args:
+        model_id (str): Идентификатор модели эмбеддингов
+        path (str): Файл калибровки {model_id: {"accept": float|null, "reject": float|null, "prefixed": bool}}
+
+    Returns:
+        tuple: (accept, reject); None - порог не задан
+    """
+    if GRADE_ACCEPT_SIMILARITY is not None or GRADE_REJECT_SIMILARITY is not None:
+        return (float(GRADE_ACCEPT_SIMILARITY) if GRADE_ACCEPT_SIMILARITY is not None else None,
+                float(GRADE_REJECT_SIMILARITY) if GRADE_REJECT_SIMILARITY is not None else None)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            thresholds = json.load(f).get(model_id) or {}
+    except FileNotFoundError:
+        thresholds = {}
+    except (OSError, ValueError) as e:
+        logger.error(f"Ошибка при чтении порогов оценки по сходству из {path}: {e}")
+        thresholds = {}
+    if thresholds and thresholds.get("prefixed", False) != uses_prefixes(model_id):
+        logger.warning(f"Пороги модели эмбеддингов {model_id} откалиброваны без префиксов запроса и документа "
+                       f"и не используются: нужна повторная калибровка")
+        thresholds = {}
+    return thresholds.get("accept"), thresholds.get("reject")
+
+
+def calibrate_thresholds(samples, precision: float = None, min_samples: int = None):
+    """
+    Подбирает пороги по вердиктам LLM.
+
+    Args:
+        samples (list): Пары (сходство, релевантен ли документ по оценке LLM)
+        precision (float): Минимальная доля верных решений за порогом
+        min_samples (int): Минимальное число вердиктов (за каждым порогом - не меньше пятой части)
+
+    Returns:
+        tuple: (accept, reject); None - для порога не нашлось значения с нужной точностью
+    """
+    precision = GRADE_CALIBRATION_PRECISION if precision is None else precision
+    min_samples = GRADE_CALIBRATION_MIN_SAMPLES if min_samples is None else min_samples
+    samples = sorted((float(similarity), bool(relevant)) for similarity, relevant in samples)
+    if len(samples) < min_samples:
+        return None, None
+    side_min = max(1, min_samples // 5)
+
+    # Порог принятия: наименьшее сходство, выше которого доля релевантных не ниже precision
+    accept = None
+    relevant_above = 0
+    for count, (similarity, relevant) in enumerate(reversed(samples), start=1):
+        relevant_above += relevant
+        if count >= side_min and relevant_above / count >= precision:
+            accept = similarity
+
+    # Порог отклонения: наибольшее сходство ниже порога принятия, ниже которого доля нерелевантных не ниже precision
+    reject = None
+    irrelevant_below = 0
+    for count, (similarity, relevant) in enumerate(samples, start=1):
+        irrelevant_below += not relevant
+        if accept is not None and similarity >= accept:
+            break
+        if count >= side_min and irrelevant_below / count >= precision:
+            reject = similarity
+    return accept, reject
+
+
+class SimilarityGrader:
+    """Оценка документов по сходству с вопросом и счётчики сэкономленных запросов к LLM"""
+
+    def __init__(self, embeddings, model_id: str = None, accept_threshold: float = None,
+                 reject_threshold: float = None, samples_path: str = GRADE_SAMPLES_PATH):
+        self.embeddings = embeddings
+        self.model_id = model_id or getattr(embeddings, 'model_id', None)
+        self.query_prefix = query_prefix(self.model_id)
+        self.passage_prefix = passage_prefix(self.model_id)
+        accept, reject = load_thresholds(self.model_id)
+        self.accept_threshold = accept if accept_threshold is None else accept_threshold
+        self.reject_threshold = reject if reject_threshold is None else reject_threshold
+        self.samples_path = samples_path
+        self.lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+        self.ambiguous = 0
+        if self.accept_threshold is None and self.reject_threshold is None:
+            logger.warning(f"Для модели эмбеддингов {self.model_id} нет откалиброванных порогов: все документы "
+                           f"оцениваются LLM, вердикты записываются для калибровки в {self.samples_path}")
+
+    def similarities(self, question: str, texts):
+        """Возвращает косинусное сходство вопроса с каждым текстом."""
+        query = np.asarray(self.embeddings.embed_query(self.query_prefix + question), dtype=np.float32)
+        vectors = np.asarray(self.embeddings.embed_documents([self.passage_prefix + text for text in texts]),
+                             dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+        return vectors @ query / np.where(norms > 0, norms, 1)
+
+    def grade(self, question: str, documents, llm_grade):
+        """
+        Оценивает документы: по сходству с вопросом, а неоднозначные - LLM.
+
+        Args:
+            question (str): Вопрос пользователя
+            documents (list): Документы (Document или строки)
+            llm_grade (callable): Оценка LLM списка документов, возвращает список bool
+                                  (None - документ не удалось оценить)
+
+        Returns:
+            list: True (релевантен), False (не релевантен) или None (не оценён) для каждого документа
+        """
+        if not documents:
+            return []
+        texts = [doc.page_content if hasattr(doc, 'page_content') else str(doc) for doc in documents]
+        try:
+            similarities = [float(similarity) for similarity in self.similarities(question, texts)]
+        except Exception as e:
+            logger.error(f"Ошибка при расчёте сходства документов: {e}")
+            return list(llm_grade(documents))
+
+        grades = []
+        for similarity in similarities:
+            if self.accept_threshold is not None and similarity >= self.accept_threshold:
+                grades.append(True)
+            elif self.reject_threshold is not None and similarity <= self.reject_threshold:
+                grades.append(False)
+            else:
+                grades.append(None)
+        logger.debug(f"Сходство документов с вопросом: {[round(s, 3) for s in similarities]}")
+
+        ambiguous = [index for index, grade in enumerate(grades) if grade is None]
+        accepted = grades.count(True)
+        rejected = grades.count(False)
+        logger.info(f"Оценка по сходству: принято {accepted}, отклонено {rejected}, "
+                    f"на оценку LLM {len(ambiguous)} из {len(documents)} документов")
+
+        llm_grades = list(llm_grade([documents[index] for index in ambiguous])) if ambiguous else []
+        for index, is_relevant in zip(ambiguous, llm_grades):
+            grades[index] = is_relevant
+        # Ошибки и таймауты LLM в калибровку не попадают
+        self._record_samples([(similarities[index], is_relevant) for index, is_relevant in zip(ambiguous, llm_grades)
+                              if is_relevant is not None])
+
+        with self.lock:
+            self.accepted += accepted
+            self.rejected += rejected
+            self.ambiguous += len(ambiguous)
+        return grades
+
+    def _record_samples(self, samples):
+        if not self.samples_path or not samples:
+            return
+        try:
+            with self.lock:
+                directory = os.path.dirname(self.samples_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                prefixed = uses_prefixes(self.model_id)
+                with open(self.samples_path, 'a', encoding='utf-8') as f:
+                    for similarity, relevant in samples:
+                        f.write(json.dumps({"model_id": self.model_id, "similarity": similarity,
+                                            "relevant": bool(relevant), "prefixed": prefixed}) + "\n")
+        except OSError as e:
+            logger.error(f"Ошибка при записи вердиктов для калибровки в {self.samples_path}: {e}")
+
+    def stats(self) -> dict:
+        """Возвращает число документов, оценённых без LLM и отправленных LLM."""
+        with self.lock:
+            return {
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "llm_graded": self.ambiguous,
+                "llm_calls_saved": self.accepted + self.rejected
+            }
+
+
+def calibrate(samples_path: str = GRADE_SAMPLES_PATH, thresholds_path: str = GRADE_THRESHOLDS_PATH) -> dict:
+    """
+    Подбирает пороги для каждой модели по записанным вердиктам и сохраняет их.
+
+    Args:
+        samples_path (str): Файл вердиктов LLM (JSONL)
+        thresholds_path (str): Файл калибровки
+
+    Returns:
+        dict: Пороги по моделям
+    """
+    samples = {}
+    stale = {}
+    with open(samples_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                sample = json.loads(line)
+                model_id = sample["model_id"]
+                # Сходство, посчитанное без префиксов модели, к текущей оценке не относится
+                if sample.get("prefixed", False) != uses_prefixes(model_id):
+                    stale[model_id] = stale.get(model_id, 0) + 1
+                    continue
+                samples.setdefault(model_id, []).append((sample["similarity"], sample["relevant"]))
+    for model_id, count in stale.items():
+        logger.info(f"Модель {model_id}: пропущено {count} вердиктов, записанных без префиксов запроса и документа")
+
+    try:
+        with open(thresholds_path, 'r', encoding='utf-8') as f:
+            thresholds = json.load(f)
+    except FileNotFoundError:
+        thresholds = {}
+
+    for model_id, model_samples in samples.items():
+        accept, reject = calibrate_thresholds(model_samples)
+        thresholds[model_id] = {"accept": accept, "reject": reject, "samples": len(model_samples),
+                                "prefixed": uses_prefixes(model_id)}
+        logger.info(f"Модель {model_id}: вердиктов {len(model_samples)}, порог принятия {accept}, "
+                    f"порог отклонения {reject}")
+
+    directory = os.path.dirname(thresholds_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(thresholds_path, 'w', encoding='utf-8') as f:
+        json.dump(thresholds, f, ensure_ascii=False, indent=2)
+    return thresholds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Калибровка порогов оценки документов по сходству эмбеддингов")
+    parser.add_argument("--calibrate", action="store_true", help="Подобрать пороги по записанным вердиктам LLM")
+    parser.add_argument("--samples", default=GRADE_SAMPLES_PATH, help="Файл вердиктов LLM (JSONL)")
+    parser.add_argument("--thresholds", default=GRADE_THRESHOLDS_PATH, help="Файл калибровки")
+    args = parser.parse_args()
+
+    if args.calibrate:
+        calibrate(args.samples, args.thresholds)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
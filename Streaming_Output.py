@@ -0,0 +1,146 @@
+"""
+Потоковый вывод ответа модели в консоль и в файл.
+
+Узел generate получает ответ модели по мере генерации (llm.stream /
+GigaChat.stream): фрагменты сразу печатаются в консоль и дописываются в
+файл responses/stream/<время>_<метка>.md, а по окончании собираются в
+итоговую строку для grade_generation. Для каждого ответа измеряется время
+до первого токена.
+
+Если одновременно генерируется несколько ответов (пакетный запуск), в
+консоль выводится только один из них, чтобы потоки не перемешивались;
+файлы пишутся для всех.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+STREAM_ENABLED = os.getenv("RAG_STREAM", "1") == "1"
+STREAM_DIR = os.getenv("RAG_STREAM_DIR", os.path.join('responses', 'stream'))
+
+_stdout_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"generations": 0, "total_time_to_first_token": 0.0, "total_duration": 0.0}
+
+
+def gigachat_text_stream(client, payload):
+    """Возвращает фрагменты текста ответа GigaChat по мере генерации."""
+    stream = client.stream(payload)
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        # При остановке потока закрывается и запрос к модели
+        stream.close()
+
+
+def chat_model_text_stream(llm, messages):
+    """Возвращает фрагменты текста ответа чат-модели LangChain по мере генерации."""
+    stream = llm.stream(messages)
+    try:
+        for chunk in stream:
+            if chunk.content:
+                yield chunk.content
+    finally:
+        # При остановке потока закрывается и запрос к модели
+        stream.close()
+
+
+class StreamWriter:
+    """Вывод фрагментов ответа в консоль и в файл с замером времени до первого токена"""
+
+    def __init__(self, label: str = "generate", directory: str = STREAM_DIR):
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+            logger.info(f'Создана директория {directory}/')
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        self.path = os.path.join(directory, f"{timestamp}_{label}.md")
+        self.file = open(self.path, 'w', encoding='utf-8')
+        # Консоль занимает первый из одновременно идущих потоков
+        self.to_stdout = _stdout_lock.acquire(blocking=False)
+        self.parts = []
+        self.started = time.perf_counter()
+        self.time_to_first_token = None
+        self.duration = None
+
+    def write(self, text: str) -> None:
+        """Выводит очередной фрагмент ответа."""
+        if not text:
+            return
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.perf_counter() - self.started
+        self.parts.append(text)
+        self.file.write(text)
+        self.file.flush()
+        if self.to_stdout:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+    def text(self) -> str:
+        """Возвращает полученный на данный момент текст ответа."""
+        return "".join(self.parts)
+
+    def close(self) -> str:
+        """Завершает вывод и возвращает полный текст ответа."""
+        if self.duration is not None:
+            return self.text()
+        self.duration = time.perf_counter() - self.started
+        self.file.close()
+        if self.to_stdout:
+            sys.stdout.write("\n")
+            sys.stdout.flush()
+            _stdout_lock.release()
+
+        text = self.text()
+        if self.time_to_first_token is not None:
+            with _stats_lock:
+                _stats["generations"] += 1
+                _stats["total_time_to_first_token"] += self.time_to_first_token
+                _stats["total_duration"] += self.duration
+            logger.info(f"Время до первого токена: {self.time_to_first_token:.2f} с, "
+                        f"генерация: {self.duration:.2f} с, {len(text)} символов ({self.path})")
+        return text
+
+
+def stream_to_writer(text_stream, label: str = "generate", stop_when=None) -> str:
+    """
+    Выводит поток фрагментов ответа в консоль и файл.
+
+    Args:
+        text_stream: Итератор фрагментов текста (gigachat_text_stream, chat_model_text_stream)
+        label (str): Метка в имени файла
+        stop_when (callable): Получает текст ответа после каждого фрагмента; если возвращает True,
+            генерация прерывается (см. Java_Code_Check.JavaStreamValidator)
+
+    Returns:
+        str: Текст ответа (полученный до остановки)
+    """
+    writer = StreamWriter(label)
+    try:
+        for text in text_stream:
+            writer.write(text)
+            if stop_when is not None and stop_when(writer.text()):
+                break
+    finally:
+        if hasattr(text_stream, 'close'):
+            text_stream.close()
+        writer.close()
+    return writer.text()
+
+
+def stream_stats() -> dict:
+    """Возвращает число потоковых ответов и среднее время до первого токена и генерации (с)."""
+    with _stats_lock:
+        generations = _stats["generations"]
+        return {
+            "generations": generations,
+            "avg_time_to_first_token": _stats["total_time_to_first_token"] / generations if generations else None,
+            "avg_duration": _stats["total_duration"] / generations if generations else None
+        }
@@ -1,4 +1,3 @@
-from gigachat import GigaChat
 import os
 import sys
 import logging
@@ -22,6 +21,9 @@ import json
 from typing import Dict, List, Optional, Any, Protocol, abstractmethod
 from abc import ABC, abstractmethod
 
+from GigaChat_Registry import get_gigachat_client
+from LLM_Retry import resilient_gigachat
+
 # Настройка логирования
 logger = logging.getLogger(__name__)
 logging.basicConfig(
@@ -52,7 +54,8 @@ os.environ["GIGACHAT_CREDENTIALS"] = GIGACHAT_CREDENTIALS
 
 # Настройка GigaChat с расширенными параметрами
 try:
-    gigachat = GigaChat(
+    # GigaChatClient с теми же параметрами получает этот же экземпляр
+    gigachat = get_gigachat_client(
         credentials=os.getenv("GIGACHAT_CREDENTIALS"),
         scope=os.getenv("GIGACHAT_API_SCOPE", "GIGACHAT_API_PERS"),
         model=os.getenv("GIGACHAT_MODEL_NAME", "GigaChat:latest"),
@@ -371,7 +374,7 @@ class GigaChatClient:
     def __init__(self):
         try:
             # Улучшенная инициализация GigaChat с дополнительными параметрами
-            self.client = GigaChat(
+            self.client = resilient_gigachat(get_gigachat_client(
                 credentials=os.getenv("GIGACHAT_CREDENTIALS"),
                 scope=os.getenv("GIGACHAT_API_SCOPE", "GIGACHAT_API_PERS"),
                 model=os.getenv("GIGACHAT_MODEL_NAME", "GigaChat:latest"),
@@ -381,7 +384,7 @@ class GigaChatClient:
                 top_p=0.3,
                 temperature=0.1,
                 max_tokens=6000
-            )
+            ))
             logger.info("GigaChat успешно инициализирован с расширенными параметрами")
         except Exception as e:
             logger.error(f"Ошибка при инициализации GigaChat: {e}")
@@ -0,0 +1,596 @@
+"""
+Инкрементальное построение векторной Базы-Знаний FAISS.
+
+Рядом с index.faiss хранится манифест (manifest.json), в котором для каждого
+PDF-файла записаны хэш содержимого, время изменения, размер и идентификаторы
+его чанков в индексе. При повторном запуске эмбеддинги считаются только для
+новых и изменённых файлов, а векторы удалённых файлов удаляются из индекса.
+
+Текст из PDF извлекается параллельно в пуле процессов, а эмбеддинги
+считаются батчами фиксированного размера по мере поступления чанков.
+
+Точный индекс (index.faiss) остаётся источником данных для инкрементального
+обновления. Для больших корпусов по нему строится приближённый индекс
+IVF, HNSW или IVF-PQ (RAG_INDEX_TYPE), который сохраняется отдельным файлом,
+перестраивается при изменении базы и используется для поиска.
+
+Текст и метаданные чанков хранятся не в index.pkl, а в хранилище чанков
+(Chunk_Store.py), откуда при поиске читаются только найденные чанки.
+Каталоги с index.pkl переносятся в хранилище при первом запуске
+(или заранее скриптом Migrate_Chunk_Store.py).
+
+Если база не изменилась, индекс открывается только для чтения: векторы
+отображаются в память (mmap), поэтому время старта и потребление памяти
+не растут с размером корпуса, а процессы агента используют общий
+страничный кэш.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.vectorstores import FAISS
+import faiss
+import numpy as np
+
+from Chunk_Store import PICKLE_FILE_NAME, migrate_pickled_docstore, open_chunk_store
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE_NAME = 'manifest.json'
+INDEX_FILE_NAME = 'index.faiss'
+CHUNK_SIZE = 1024
+CHUNK_OVERLAP = 0
+
+# Число процессов для извлечения текста из PDF и размер батча для расчёта эмбеддингов
+INGEST_WORKERS = int(os.getenv("RAG_INGEST_WORKERS", min(4, os.cpu_count() or 1)))
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", 64))
+
+# Тип индекса для поиска: 'flat' (точный), 'ivf', 'hnsw' или 'ivfpq'
+INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "flat")
+# Число кластеров IVF (0 - подбирается по размеру корпуса), число подвекторов PQ и связей HNSW
+IVF_NLIST = int(os.getenv("RAG_IVF_NLIST", 0))
+PQ_M = int(os.getenv("RAG_PQ_M", 64))
+HNSW_M = int(os.getenv("RAG_HNSW_M", 32))
+# Параметры поиска: число просматриваемых кластеров IVF и размер очереди кандидатов HNSW
+INDEX_NPROBE = int(os.getenv("RAG_INDEX_NPROBE", 16))
+INDEX_EF_SEARCH = int(os.getenv("RAG_INDEX_EF_SEARCH", 64))
+# Максимальное число векторов для обучения IVF/PQ
+INDEX_TRAIN_SAMPLE = int(os.getenv("RAG_INDEX_TRAIN_SAMPLE", 100000))
+# Сколько раз перечитывается индекс, если хранилище чанков зафиксировано для другого файла индекса
+INDEX_LOAD_ATTEMPTS = 3
+
+
+def file_sha256(file_path):
+    """Вычисляет sha256 содержимого файла, читая его блоками."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(db_dir):
+    """Загружает манифест индекса или возвращает None, если его нет."""
+    manifest_path = os.path.join(db_dir, MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f'Ошибка при чтении манифеста {manifest_path}: {e}')
+        return None
+
+
+def save_manifest(db_dir, manifest):
+    """Атомарно сохраняет манифест индекса."""
+    manifest_path = os.path.join(db_dir, MANIFEST_FILE_NAME)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def scan_pdf_files(pdf_dir):
+    """Возвращает словарь {относительный путь: полный путь} для всех PDF-файлов."""
+    pdf_files = {}
+    for root, dirs, files in os.walk(pdf_dir):
+        for file in files:
+            if file.endswith(".pdf"):
+                file_path = os.path.join(root, file)
+                rel_path = os.path.relpath(file_path, pdf_dir).replace(os.sep, '/')
+                pdf_files[rel_path] = file_path
+    return pdf_files
+
+
+def split_pdf(file_path):
+    """Читает PDF-файл и разбивает его на чанки."""
+    loader = PyPDFLoader(file_path)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return text_splitter.split_documents(loader.load())
+
+
+def _split_pdf_task(task):
+    """Задача для пула процессов: читает и разбивает один PDF-файл."""
+    rel_path, file_path, digest = task
+    try:
+        return rel_path, file_path, digest, split_pdf(file_path)
+    except Exception as e:
+        logger.error(f'Ошибка при обработке файла {file_path}: {e}')
+        return rel_path, file_path, digest, None
+
+
+def iter_pdf_chunks(tasks, max_workers=None):
+    """
+    Параллельно извлекает текст из PDF-файлов и отдаёт результаты по мере готовности.
+
+    Одновременно в работе находится не более 2 * max_workers файлов, поэтому
+    потребление памяти не зависит от размера корпуса. Если пул процессов
+    недоступен, файлы обрабатываются последовательно.
+
+    Args:
+        tasks (list): Кортежи (относительный путь, полный путь, sha256)
+        max_workers (int): Число процессов (по умолчанию INGEST_WORKERS)
+
+    Yields:
+        tuple: (относительный путь, полный путь, sha256, список чанков или None при ошибке)
+    """
+    max_workers = max_workers or INGEST_WORKERS
+    pending_tasks = iter(tasks)
+    in_flight = {}
+
+    if max_workers > 1 and len(tasks) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                for task in pending_tasks:
+                    in_flight[pool.submit(_split_pdf_task, task)] = task
+                    if len(in_flight) >= max_workers * 2:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            result = future.result()
+                            del in_flight[future]
+                            yield result
+                for future in as_completed(list(in_flight)):
+                    result = future.result()
+                    del in_flight[future]
+                    yield result
+            return
+        except BrokenProcessPool as e:
+            logger.error(f'Пул процессов недоступен, продолжаем последовательно: {e}')
+
+    for task in list(in_flight.values()) + list(pending_tasks):
+        yield _split_pdf_task(task)
+
+
+def _file_entry(file_path, digest, chunk_ids):
+    stat = os.stat(file_path)
+    return {
+        "sha256": digest,
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "chunk_ids": chunk_ids
+    }
+
+
+def _bootstrap_manifest(vectorstore, model_id, pdf_files):
+    """
+    Восстанавливает манифест для индекса, созданного до появления манифеста.
+    Чанки группируются по метаданным source; файлы, которые всё ещё лежат
+    в каталоге, считаются неизменными с момента построения индекса.
+    Чанки документов, которых нет в каталоге, остаются в индексе как есть.
+    """
+    sources = {os.path.normpath(path): rel_path for rel_path, path in pdf_files.items()}
+
+    chunk_ids = {}
+    untracked = 0
+    for doc_id in vectorstore.index_to_docstore_id.values():
+        doc = vectorstore.docstore.search(doc_id)
+        source = os.path.normpath(getattr(doc, 'metadata', {}).get('source', ''))
+        if source in sources:
+            chunk_ids.setdefault(sources[source], []).append(doc_id)
+        else:
+            untracked += 1
+
+    files = {
+        rel_path: _file_entry(pdf_files[rel_path], file_sha256(pdf_files[rel_path]), ids)
+        for rel_path, ids in chunk_ids.items()
+    }
+
+    logger.info(f'Манифест восстановлен по существующему индексу: {len(files)} файлов')
+    if untracked:
+        logger.warning(f'{untracked} чанков не относятся к файлам из каталога PDF и не отслеживаются манифестом')
+    return {"embedding_model": model_id, "files": files}
+
+
+def index_factory_string(index_type, ntotal, nlist=None, pq_m=None, hnsw_m=None):
+    """
+    Возвращает описание индекса для faiss.index_factory.
+
+    Args:
+        index_type (str): 'ivf', 'hnsw' или 'ivfpq'
+        ntotal (int): Число векторов (для подбора числа кластеров IVF)
+        nlist (int): Число кластеров IVF
+        pq_m (int): Число подвекторов PQ (должно делить размерность)
+        hnsw_m (int): Число связей вершины графа HNSW
+
+    Returns:
+        str: Строка вида 'IVF1024,PQ64'
+    """
+    # Для обучения k-means FAISS рекомендует не меньше 39 векторов на кластер
+    nlist = nlist or IVF_NLIST or max(1, min(int(4 * math.sqrt(ntotal)), ntotal // 39))
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m or HNSW_M}"
+    if index_type == "ivfpq":
+        return f"IVF{nlist},PQ{pq_m or PQ_M}"
+    raise ValueError(f"Неизвестный тип индекса: {index_type}")
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Задаёт параметры поиска приближённого индекса (nprobe для IVF, efSearch для HNSW)."""
+    if hasattr(index, 'hnsw'):
+        index.hnsw.efSearch = ef_search or INDEX_EF_SEARCH
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe or INDEX_NPROBE
+    except RuntimeError:
+        pass
+
+
+def build_ann_index(flat_index, factory_string, train_sample=None):
+    """
+    Строит приближённый индекс по векторам точного индекса.
+
+    Векторы добавляются в том же порядке, поэтому позиции в индексе
+    (и соответствие index_to_docstore_id) сохраняются.
+
+    Args:
+        flat_index: Точный индекс FAISS
+        factory_string (str): Описание индекса для faiss.index_factory
+        train_sample (int): Максимальное число векторов для обучения
+
+    Returns:
+        faiss.Index: Обученный и заполненный индекс
+    """
+    train_sample = train_sample or INDEX_TRAIN_SAMPLE
+    vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+    index = faiss.index_factory(flat_index.d, factory_string, flat_index.metric_type)
+    if not index.is_trained:
+        sample = vectors
+        if len(vectors) > train_sample:
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), train_sample, replace=False)]
+        index.train(sample)
+    index.add(vectors)
+    set_search_params(index)
+    return index
+
+
+def read_index_mmap(path):
+    """Открывает индекс FAISS только для чтения, отображая его данные в память."""
+    # IO_FLAG_MMAP_IFC (FAISS >= 1.9) отображает и векторы плоских индексов, IO_FLAG_MMAP - только списки IVF
+    flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    try:
+        return faiss.read_index(path, flags)
+    except RuntimeError as e:
+        logger.warning(f'Индекс {path} нельзя отобразить в память, загружаем целиком: {e}')
+        return faiss.read_index(path)
+
+
+def index_file_stamp(path):
+    """
+    Возвращает отметку файла индекса: номер inode и размер.
+
+    os.replace сохраняет inode переименованного файла, поэтому отметку
+    временного файла можно зафиксировать в хранилище чанков до его переноса.
+    """
+    stat = os.stat(path)
+    return f"{stat.st_ino}:{stat.st_size}"
+
+
+def load_vector_store_read_only(db_dir, embeddings):
+    """
+    Открывает векторную Базу-Знаний только для поиска.
+
+    Args:
+        db_dir (str): Каталог с индексом FAISS
+        embeddings: Объект эмбеддингов LangChain
+
+    Returns:
+        FAISS | None: Векторное хранилище или None, если хранилища чанков нет или оно не соответствует индексу
+    """
+    store = open_chunk_store(db_dir, read_only=True)
+    if store is None:
+        return None
+    index_path = os.path.join(db_dir, INDEX_FILE_NAME)
+    for attempt in range(1, INDEX_LOAD_ATTEMPTS + 1):
+        stamp = index_file_stamp(index_path)
+        index = read_index_mmap(index_path)
+        # Другой процесс мог сохранить базу между фиксацией позиций и переносом файла индекса
+        stored_stamp = store.index_stamp()
+        consistent = (stored_stamp is None or stored_stamp == stamp == index_file_stamp(index_path))
+        if consistent and store.position_count() == index.ntotal:
+            break
+        if attempt < INDEX_LOAD_ATTEMPTS:
+            time.sleep(0.1 * attempt)
+    else:
+        logger.warning('Хранилище чанков не соответствует индексу')
+        store.close()
+        return None
+    return FAISS(embedding_function=embeddings, index=index, docstore=store,
+                 index_to_docstore_id=store.index_to_docstore_id())
+
+
+def load_vector_store(db_dir, embeddings):
+    """
+    Загружает векторную Базу-Знаний для изменения: индекс целиком в память, чанки - в хранилище чанков.
+
+    Args:
+        db_dir (str): Каталог с индексом FAISS
+        embeddings: Объект эмбеддингов LangChain
+
+    Returns:
+        FAISS: Векторное хранилище
+    """
+    store = open_chunk_store(db_dir)
+    return FAISS(embedding_function=embeddings, index=faiss.read_index(os.path.join(db_dir, INDEX_FILE_NAME)),
+                 docstore=store, index_to_docstore_id=store.positions())
+
+
+def save_vector_store(vectorstore, db_dir):
+    """
+    Сохраняет индекс FAISS и фиксирует изменения хранилища чанков.
+
+    Индекс сначала полностью записывается во временный файл: если запись
+    не удалась, изменения хранилища отменяются и база остаётся прежней.
+    Затем позиции фиксируются с отметкой нового файла и он сразу переносится
+    на место index.faiss; читатель, попавший между этими шагами, видит
+    несовпадение отметок и перечитывает индекс.
+    """
+    index_path = os.path.join(db_dir, INDEX_FILE_NAME)
+    tmp_path = f"{index_path}.tmp"
+    try:
+        faiss.write_index(vectorstore.index, tmp_path)
+    except Exception:
+        vectorstore.docstore.rollback()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    vectorstore.docstore.write_positions(vectorstore.index_to_docstore_id, index_file_stamp(tmp_path))
+    os.replace(tmp_path, index_path)
+
+    # index.pkl от прежнего формата больше не соответствует индексу
+    pickle_path = os.path.join(db_dir, PICKLE_FILE_NAME)
+    if os.path.exists(pickle_path):
+        os.remove(pickle_path)
+        logger.info(f'Удалён устаревший файл {pickle_path}')
+
+
+def _check_chunk_store(db_dir):
+    """
+    Проверяет, что хранилище чанков соответствует индексу FAISS, при необходимости
+    перенося в него docstore из index.pkl.
+
+    Returns:
+        bool: True, если индекс можно использовать
+    """
+    store = open_chunk_store(db_dir, read_only=True)
+    position_count = store.position_count() if store is not None else None
+    if store is not None:
+        store.close()
+    ntotal = read_index_mmap(os.path.join(db_dir, INDEX_FILE_NAME)).ntotal
+    if position_count == ntotal:
+        return True
+
+    pickle_path = os.path.join(db_dir, PICKLE_FILE_NAME)
+    if os.path.exists(pickle_path):
+        logger.info(f'Переносим чанки из {pickle_path} в хранилище чанков')
+        try:
+            return migrate_pickled_docstore(db_dir) == ntotal
+        except Exception as e:
+            logger.error(f'Ошибка при переносе {pickle_path}: {e}')
+    return False
+
+
+def _load_ann_index(vectorstore, db_dir, manifest, index_type, rebuild):
+    """Загружает или перестраивает приближённый индекс и подставляет его в векторное хранилище."""
+    flat_index = vectorstore.index
+    if not flat_index.ntotal:
+        return
+    ann_path = os.path.join(db_dir, f'index_{index_type}.faiss')
+    factory_string = index_factory_string(index_type, flat_index.ntotal)
+    ann_info = {"type": index_type, "factory": factory_string, "ntotal": flat_index.ntotal}
+
+    if not rebuild and manifest.get("ann_index") == ann_info and os.path.exists(ann_path):
+        index = read_index_mmap(ann_path)
+        set_search_params(index)
+    else:
+        logger.info(f'Строим приближённый индекс {factory_string} по {flat_index.ntotal} векторам')
+        try:
+            index = build_ann_index(flat_index, factory_string)
+        except Exception as e:
+            logger.error(f'Ошибка при построении индекса {factory_string}, используется точный поиск: {e}')
+            return
+        faiss.write_index(index, ann_path)
+        manifest["ann_index"] = ann_info
+        save_manifest(db_dir, manifest)
+
+    vectorstore.index = index
+    logger.info(f'Для поиска используется индекс {factory_string}')
+
+
+def _add_chunks(vectorstore, embeddings, chunks, db_dir):
+    """Считает эмбеддинги чанков и добавляет их в индекс (или создаёт индекс)."""
+    texts = [chunk.page_content for chunk in chunks]
+    metadatas = [chunk.metadata for chunk in chunks]
+    ids = [str(uuid.uuid4()) for _ in chunks]
+    vectors = embeddings.embed_documents(texts)
+
+    if vectorstore is None:
+        # Тот же индекс, что создаёт FAISS.from_embeddings, но с хранилищем чанков вместо InMemoryDocstore
+        vectorstore = FAISS(embedding_function=embeddings, index=faiss.IndexFlatL2(len(vectors[0])),
+                            docstore=open_chunk_store(db_dir), index_to_docstore_id={})
+    vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+    return vectorstore, ids
+
+
+def sync_vector_store(embeddings, model_id, db_dir='db/db_01', pdf_dir='pdf', keyword_index=None,
+                      index_type=None, on_index_changed=None):
+    """
+    Загружает векторную Базу-Знаний и синхронизирует её с каталогом PDF-файлов.
+
+    Args:
+        embeddings: Объект эмбеддингов LangChain
+        model_id (str): Идентификатор модели эмбеддингов (при смене модели индекс перестраивается)
+        db_dir (str): Каталог с индексом FAISS
+        pdf_dir (str): Каталог с PDF-документами
+        keyword_index: BM25-индекс (Hybrid_Retriever.BM25Index), синхронизируемый с чанками индекса FAISS
+        index_type (str): Тип индекса для поиска (по умолчанию RAG_INDEX_TYPE)
+        on_index_changed (callable): Вызывается без аргументов после сохранения изменённого индекса
+            (например, для сброса семантического кэша ответов)
+
+    Returns:
+        FAISS | None: Векторное хранилище или None, если документов нет
+    """
+    for dir_path in [pdf_dir, db_dir]:
+        if not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+            logger.info(f'Создана директория {dir_path}/')
+
+    pdf_files = scan_pdf_files(pdf_dir)
+    manifest = load_manifest(db_dir)
+    vectorstore = None
+    changed = False
+    index_changed = False
+    # Существующий индекс загружается для изменения, только если есть новые, изменённые или удалённые файлы
+    stored_index = False
+
+    if os.path.exists(os.path.join(db_dir, INDEX_FILE_NAME)):
+        if manifest is not None and manifest.get("embedding_model") != model_id:
+            logger.warning(f'Модель эмбеддингов изменилась ({manifest.get("embedding_model")} -> {model_id}), '
+                           f'индекс будет перестроен')
+            manifest = None
+        elif not _check_chunk_store(db_dir):
+            logger.warning('Хранилище чанков не соответствует индексу, индекс будет перестроен')
+            manifest = None
+        elif manifest is None:
+            logger.info('Загружаем существующую векторную Базу-знаний')
+            vectorstore = load_vector_store(db_dir, embeddings)
+            manifest = _bootstrap_manifest(vectorstore, model_id, pdf_files)
+            changed = True
+        else:
+            stored_index = True
+    else:
+        manifest = None
+
+    if manifest is None:
+        logger.info('Создаем новую векторную Базу-Знаний')
+        manifest = {"embedding_model": model_id, "files": {}}
+
+    def load_for_update():
+        nonlocal vectorstore, stored_index
+        if stored_index:
+            logger.info('Загружаем существующую векторную Базу-знаний для обновления')
+            vectorstore = load_vector_store(db_dir, embeddings)
+            stored_index = False
+
+    files = manifest["files"]
+
+    # Удаляем векторы файлов, которых больше нет в каталоге
+    removed = [rel_path for rel_path in files if rel_path not in pdf_files]
+    removed_ids = [doc_id for rel_path in removed for doc_id in files[rel_path]["chunk_ids"]]
+    if removed_ids:
+        load_for_update()
+        if vectorstore is not None:
+            vectorstore.delete(removed_ids)
+            index_changed = True
+    for rel_path in removed:
+        logger.info(f'Файл удалён из Базы-Знаний: {rel_path}')
+        del files[rel_path]
+        changed = True
+
+    # Определяем новые и изменённые файлы
+    to_process = []
+    for rel_path, file_path in sorted(pdf_files.items()):
+        entry = files.get(rel_path)
+        stat = os.stat(file_path)
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            continue
+
+        digest = file_sha256(file_path)
+        if entry and entry["sha256"] == digest:
+            files[rel_path] = _file_entry(file_path, digest, entry["chunk_ids"])
+            changed = True
+            continue
+
+        to_process.append((rel_path, file_path, digest))
+
+    # Чанки поступают потоком из пула процессов и индексируются батчами фиксированного размера
+    batch = []
+
+    def flush_batch():
+        nonlocal vectorstore, index_changed
+        if not batch:
+            return
+        load_for_update()
+        vectorstore, chunk_ids = _add_chunks(vectorstore, embeddings, [chunk for _, chunk in batch], db_dir)
+        index_changed = True
+        for (batch_rel_path, _), chunk_id in zip(batch, chunk_ids):
+            files[batch_rel_path]["chunk_ids"].append(chunk_id)
+        logger.info(f'Проиндексировано {len(batch)} чанков')
+        batch.clear()
+
+    for rel_path, file_path, digest, chunks in iter_pdf_chunks(to_process):
+        if chunks is None:
+            continue
+
+        entry = files.get(rel_path)
+        if entry and entry["chunk_ids"]:
+            load_for_update()
+            if vectorstore is not None:
+                vectorstore.delete(entry["chunk_ids"])
+                index_changed = True
+
+        logger.info(f'Файл {rel_path} разбит на {len(chunks)} чанков')
+        files[rel_path] = _file_entry(file_path, digest, [])
+        changed = True
+        for chunk in chunks:
+            batch.append((rel_path, chunk))
+            if len(batch) >= EMBED_BATCH_SIZE:
+                flush_batch()
+    flush_batch()
+
+    if stored_index:
+        # Индекс не менялся: открываем его только для чтения
+        vectorstore = load_vector_store_read_only(db_dir, embeddings)
+        if vectorstore is None:
+            load_for_update()
+
+    if vectorstore is None:
+        logger.warning('Не найдено PDF файлов для обработки')
+        return None
+
+    if index_changed:
+        save_vector_store(vectorstore, db_dir)
+        logger.info(f'Векторная База-Знаний сохранена в {db_dir}')
+        if on_index_changed is not None:
+            on_index_changed()
+    if changed or index_changed:
+        save_manifest(db_dir, manifest)
+
+    if keyword_index is not None and (index_changed or keyword_index.count() != len(vectorstore.index_to_docstore_id)):
+        keyword_index.sync(vectorstore)
+
+    # Приближённый индекс подставляется после сохранения: index.faiss всегда остаётся точным
+    index_type = index_type or INDEX_TYPE
+    if index_type != "flat":
+        _load_ann_index(vectorstore, db_dir, manifest, index_type, rebuild=index_changed)
+
+    return vectorstore
@@ -0,0 +1,162 @@
+"""
+Веб-поиск агента: кэш результатов и локальный поиск для офлайн-запусков.
+
+Узел web_search вызывается на каждом цикле «not useful» с тем же вопросом,
+поэтому результаты поиска кэшируются на диске (db/web_search_cache.sqlite)
+по нормализованному запросу и числу результатов, с ограничением времени
+жизни записи. Кэш использует то же хранилище, что и кэш ответов LLM
+(LLM_Cache.ResponseCache).
+
+Вместо Tavily можно использовать локальный поиск (WEB_SEARCH_BACKEND=local):
+сохранённые страницы из каталога WEB_SEARCH_LOCAL_DIR (.txt, .md, .html)
+разбиваются на фрагменты и индексируются BM25 (Hybrid_Retriever.BM25Index).
+Результаты имеют тот же вид, что и у Tavily (список словарей url/content),
+поэтому узел web_search не зависит от выбранного поиска.
+"""
+import html
+import logging
+import os
+import re
+
+from Hybrid_Retriever import BM25Index
+from LLM_Cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+# Поиск: 'tavily' - Tavily Search API, 'local' - BM25 по сохранённым страницам
+WEB_SEARCH_BACKEND = os.getenv("WEB_SEARCH_BACKEND", "tavily")
+WEB_SEARCH_K = int(os.getenv("WEB_SEARCH_K", 3))
+WEB_SEARCH_CACHE_ENABLED = os.getenv("WEB_SEARCH_CACHE_ENABLED", "1") == "1"
+WEB_SEARCH_CACHE_PATH = os.getenv("WEB_SEARCH_CACHE_PATH", 'db/web_search_cache.sqlite')
+WEB_SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("WEB_SEARCH_CACHE_MAX_ENTRIES", 1000))
+WEB_SEARCH_CACHE_TTL = float(os.getenv("WEB_SEARCH_CACHE_TTL", 24 * 3600))
+WEB_SEARCH_LOCAL_DIR = os.getenv("WEB_SEARCH_LOCAL_DIR", 'web_pages')
+# Размер фрагмента страницы в символах (фрагменты собираются из целых абзацев)
+WEB_SEARCH_LOCAL_PASSAGE_SIZE = int(os.getenv("WEB_SEARCH_LOCAL_PASSAGE_SIZE", 1000))
+
+LOCAL_PAGE_EXTENSIONS = ('.txt', '.md', '.html', '.htm')
+
+
+def normalize_query(query: str) -> str:
+    """Приводит запрос к виду для ключа кэша: нижний регистр, одиночные пробелы."""
+    return " ".join(str(query).lower().split())
+
+
+def _html_to_text(text: str) -> str:
+    text = re.sub(r'(?is)<(script|style)\b.*?</\1>', ' ', text)
+    text = re.sub(r'(?i)<br\s*/?>|</(p|div|li|h[1-6]|tr|pre)>', '\n\n', text)
+    text = re.sub(r'<[^>]+>', ' ', text)
+    return html.unescape(text)
+
+
+def _split_passages(text: str, size: int):
+    passages = []
+    current = ""
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 1 > size:
+            passages.append(current)
+            current = ""
+        current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        passages.append(current)
+    return passages
+
+
+class LocalSearchTool:
+    """Поиск BM25 по сохранённым страницам с результатами в формате Tavily"""
+
+    def __init__(self, directory: str = WEB_SEARCH_LOCAL_DIR, k: int = WEB_SEARCH_K,
+                 passage_size: int = WEB_SEARCH_LOCAL_PASSAGE_SIZE):
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f"Каталог сохранённых страниц не найден: {directory}")
+
+        self.directory = directory
+        self.k = k
+        self.passages = {}
+        # Индекс строится в памяти при запуске: каталог страниц небольшой и может меняться между запусками
+        self.index = BM25Index(':memory:')
+        for root, _, files in os.walk(directory):
+            for file_name in sorted(files):
+                if not file_name.lower().endswith(LOCAL_PAGE_EXTENSIONS):
+                    continue
+                path = os.path.join(root, file_name)
+                try:
+                    with open(path, 'r', encoding='utf-8', errors='replace') as file:
+                        text = file.read()
+                except OSError as e:
+                    logger.error(f"Ошибка при чтении страницы {path}: {e}")
+                    continue
+                if file_name.lower().endswith(('.html', '.htm')):
+                    text = _html_to_text(text)
+                relative_path = os.path.relpath(path, directory)
+                for number, passage in enumerate(_split_passages(text, passage_size)):
+                    self.passages[f"{relative_path}#{number}"] = passage
+        self.index.add(self.passages.items())
+        logger.info(f"Локальный поиск: проиндексировано {len(self.passages)} фрагментов страниц из {directory}/")
+
+    def invoke(self, query):
+        """Ищет фрагменты страниц; query - строка или словарь {"query": ...}, как у TavilySearchResults."""
+        if isinstance(query, dict):
+            query = query["query"]
+        return [
+            {"url": doc_id.split('#')[0], "content": self.passages[doc_id], "score": score}
+            for doc_id, score in self.index.search(query, k=self.k)
+        ]
+
+
+class CachedSearchTool:
+    """Обёртка над инструментом поиска, кэширующая результаты по нормализованному запросу и k"""
+
+    def __init__(self, tool, backend: str, k: int = WEB_SEARCH_K, cache: ResponseCache = None):
+        self.tool = tool
+        self.backend = backend
+        self.k = k
+        self.cache = cache or ResponseCache(path=WEB_SEARCH_CACHE_PATH, max_entries=WEB_SEARCH_CACHE_MAX_ENTRIES,
+                                            ttl=WEB_SEARCH_CACHE_TTL)
+
+    def __getattr__(self, name):
+        return getattr(self.tool, name)
+
+    def invoke(self, query):
+        text = query["query"] if isinstance(query, dict) else query
+        key = self.cache.make_key(f"web_search:{self.backend}", {"k": self.k}, normalize_query(text))
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info("Результаты веб-поиска взяты из кэша")
+            return cached
+
+        results = self.tool.invoke(query)
+        # Tavily возвращает текст ошибки строкой: кэшируются только непустые списки результатов
+        if isinstance(results, list) and results:
+            self.cache.put(key, results)
+        return results
+
+    def stats(self) -> dict:
+        """Возвращает счётчики попаданий, промахов и вытеснений кэша."""
+        return self.cache.stats()
+
+
+def create_web_search_tool(backend: str = WEB_SEARCH_BACKEND, k: int = WEB_SEARCH_K):
+    """
+    Создаёт инструмент веб-поиска.
+
+    Args:
+        backend (str): 'tavily' или 'local' (по умолчанию WEB_SEARCH_BACKEND)
+        k (int): Число результатов
+
+    Returns:
+        Инструмент с методом invoke({"query": ...}), возвращающим список словарей url/content
+    """
+    if backend == "local":
+        tool = LocalSearchTool(k=k)
+    elif backend == "tavily":
+        from langchain_community.tools.tavily_search import TavilySearchResults
+
+        tool = TavilySearchResults(max_results=k)
+    else:
+        raise ValueError(f"Неизвестный поиск WEB_SEARCH_BACKEND: {backend}")
+
+    return CachedSearchTool(tool, backend, k) if WEB_SEARCH_CACHE_ENABLED else tool
@@ -17,7 +17,15 @@ logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
 class EnhancedTestCaseGenerator:
-    def __init__(self):
+    def __init__(self, gigachat=None):
+        """
+        Args:
+            gigachat: Готовый клиент GigaChat (например, из GigaChat_Registry.get_gigachat_client);
+                если не передан, создаётся собственный клиент
+        """
+        if gigachat is not None:
+            self.gigachat = gigachat
+            return
         try:
             # Улучшенная инициализация GigaChat с дополнительными параметрами
             self.gigachat = GigaChat(
@@ -0,0 +1,101 @@
+import pickle
+
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+
+from Chunk_Store import PICKLE_FILE_NAME, migrate_pickled_docstore, open_chunk_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = open_chunk_store(str(tmp_path))
+    yield store
+    store.close()
+
+
+def reader(tmp_path):
+    return open_chunk_store(str(tmp_path), read_only=True)
+
+
+def test_read_only_store_is_missing_until_created(tmp_path):
+    assert reader(tmp_path) is None
+
+
+def test_changes_are_visible_only_after_write_positions(tmp_path, store):
+    store.add({"a": Document(page_content="chunk a", metadata={"page": 1})})
+    other = reader(tmp_path)
+    try:
+        assert other.search("a") == "ID a not found."
+        assert other.position_count() == 0
+
+        store.write_positions({0: "a"})
+
+        assert other.search("a") == Document(page_content="chunk a", metadata={"page": 1})
+        assert other.index_to_docstore_id()[0] == "a"
+        assert len(other.index_to_docstore_id()) == 1
+    finally:
+        other.close()
+
+
+def test_delete_is_committed_with_new_positions(tmp_path, store):
+    store.add({"a": Document(page_content="chunk a"), "b": Document(page_content="chunk b")})
+    store.write_positions({0: "a", 1: "b"})
+
+    store.delete(["a"])
+    other = reader(tmp_path)
+    try:
+        assert other.search("a").page_content == "chunk a"
+        store.write_positions({0: "b"})
+        assert other.search("a") == "ID a not found."
+        assert other.index_to_docstore_id().values() == ["b"]
+    finally:
+        other.close()
+
+
+def test_rollback_discards_uncommitted_changes(store):
+    store.add({"a": Document(page_content="chunk a")})
+    store.write_positions({0: "a"})
+    store.add({"b": Document(page_content="chunk b")})
+    store.delete(["a"])
+
+    store.rollback()
+
+    assert store.search("a").page_content == "chunk a"
+    assert store.search("b") == "ID b not found."
+
+
+def test_chunks_missing_from_positions_are_dropped(store):
+    # Прерванное обновление: чанк добавлен, но индекс FAISS с ним не сохранён
+    store.add({"a": Document(page_content="chunk a"), "orphan": Document(page_content="orphan")})
+    store.write_positions({0: "a"})
+
+    assert store.search("orphan") == "ID orphan not found."
+    assert store.positions() == {0: "a"}
+
+
+def test_read_only_store_rejects_changes(tmp_path, store):
+    store.write_positions({})
+    other = reader(tmp_path)
+    try:
+        with pytest.raises(ValueError):
+            other.add({"a": Document(page_content="chunk a")})
+        with pytest.raises(ValueError):
+            other.write_positions({})
+    finally:
+        other.close()
+
+
+def test_migrate_pickled_docstore(tmp_path):
+    docstore = InMemoryDocstore({"a": Document(page_content="chunk a"), "b": Document(page_content="chunk b")})
+    with open(tmp_path / PICKLE_FILE_NAME, 'wb') as f:
+        pickle.dump((docstore, {0: "b", 1: "a"}), f)
+
+    assert migrate_pickled_docstore(str(tmp_path)) == 2
+
+    store = reader(tmp_path)
+    try:
+        assert store.index_to_docstore_id().values() == ["b", "a"]
+        assert store.search("a").page_content == "chunk a"
+    finally:
+        store.close()
@@ -0,0 +1,72 @@
+from langchain_core.documents import Document
+
+from Document_Set import DocumentSet, ReplaceDocuments, merge_documents
+
+
+def doc(text, score=None):
+    return Document(page_content=text, metadata={} if score is None else {"score": score})
+
+
+def texts(documents):
+    return [document.page_content for document in documents]
+
+
+def test_merge_appends_new_documents_and_drops_duplicates():
+    current = [doc("тест-кейс"), doc("a", 0.5)]
+
+    merged = merge_documents(current, [doc(" a \n", 0.4), doc("b", 0.3)])
+
+    assert texts(merged) == ["тест-кейс", "a", "b"]
+    assert current == [doc("тест-кейс"), doc("a", 0.5)]
+
+
+def test_duplicate_with_higher_score_replaces_stored_document():
+    merged = merge_documents([doc("a", 0.2)], [doc("a", 0.9)])
+
+    assert merged == [doc("a", 0.9)]
+
+
+def test_replace_documents_replaces_set():
+    merged = merge_documents([doc("a"), doc("b")], ReplaceDocuments([doc("c"), doc("c")]))
+
+    assert texts(merged) == ["c"]
+
+
+def test_merge_of_empty_update_keeps_documents():
+    assert texts(merge_documents([doc("a")], None)) == ["a"]
+    assert merge_documents(None, []) == []
+
+
+def test_eviction_drops_lowest_scored_document_first():
+    documents = DocumentSet([doc("тест-кейс"), doc("a", 0.9), doc("b", 0.1)], max_size=3)
+
+    assert documents.add(doc("c", 0.5)) is True
+
+    assert texts(documents) == ["тест-кейс", "a", "c"]
+    assert documents.evicted == 1
+
+
+def test_new_document_with_lowest_score_is_not_added():
+    documents = DocumentSet([doc("a", 0.9), doc("b", 0.8)], max_size=2)
+
+    assert documents.add(doc("c", 0.1)) is False
+    assert texts(documents) == ["a", "b"]
+
+
+def test_unscored_documents_are_evicted_last_newest_first():
+    documents = DocumentSet([doc("тест-кейс"), doc("веб-поиск 1")], max_size=2)
+
+    documents.add(doc("веб-поиск 2"))
+
+    assert texts(documents) == ["тест-кейс", "веб-поиск 1"]
+    assert documents.evicted == 1
+
+
+def test_repeated_cycles_do_not_grow_state():
+    state = [doc("тест-кейс")]
+    web_results = [doc("веб-поиск 1"), doc("веб-поиск 2")]
+
+    for _ in range(5):
+        state = merge_documents(state, web_results)
+
+    assert texts(state) == ["тест-кейс", "веб-поиск 1", "веб-поиск 2"]
@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+import pytest
+
+gigachat = pytest.importorskip("gigachat")
+
+import GigaChat_Registry
+from gigachat.models import AccessToken
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(GigaChat_Registry, "_clients", {})
+    monkeypatch.setattr(GigaChat_Registry, "_token_caches", {})
+    refreshes = []
+
+    async def fake_aupdate_token(self):
+        refreshes.append(self)
+        await asyncio.sleep(0.01)
+        self._access_token = AccessToken(access_token="token", expires_at=int((time.time() + 3600) * 1000))
+
+    monkeypatch.setattr(gigachat.GigaChat, "_aupdate_token", fake_aupdate_token)
+    yield refreshes
+    GigaChat_Registry.close_gigachat_clients()
+
+
+def test_same_parameters_share_client(registry):
+    first = GigaChat_Registry.get_gigachat_client(credentials="secret", model="GigaChat")
+    assert GigaChat_Registry.get_gigachat_client(credentials="secret", model="GigaChat", timeout=None) is first
+    assert GigaChat_Registry.get_gigachat_client(credentials="secret", model="GigaChat-Pro") is not first
+
+
+def test_concurrent_async_refresh_requests_one_token(registry):
+    first = GigaChat_Registry.get_gigachat_client(credentials="secret", model="GigaChat")
+    second = GigaChat_Registry.get_gigachat_client(credentials="secret", model="GigaChat-Pro")
+
+    async def refresh_all():
+        await asyncio.gather(first._aupdate_token(), second._aupdate_token(), first._aupdate_token())
+
+    asyncio.run(refresh_all())
+    assert len(registry) == 1
+    assert second._access_token is first._access_token
+
+    # Блокировка создаётся для каждого цикла событий: повторный asyncio.run не падает
+    first._token_cache.access_token = None
+    asyncio.run(refresh_all())
+    assert len(registry) == 2
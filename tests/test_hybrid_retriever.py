@@ -0,0 +1,88 @@
+import pytest
+from langchain_core.documents import Document
+
+from Hybrid_Retriever import BM25Index, HybridRetriever, reciprocal_rank_fusion, tokenize
+
+CHUNKS = {
+    "users": "GET /api/v1/users возвращает список пользователей",
+    "orders": "POST /api/v1/orders создаёт заказ, при ошибке возвращается ERR-404",
+    "auth": "Авторизация пользователей по токену",
+}
+
+
+class FakeDocstore:
+    def search(self, doc_id):
+        return Document(page_content=CHUNKS[doc_id], metadata={"id": doc_id}) if doc_id in CHUNKS \
+            else f"ID {doc_id} not found."
+
+
+class FakeVectorStore:
+    """Плотный поиск с заранее заданным порядком чанков и расстояниями L2"""
+
+    def __init__(self, ranking):
+        self.ranking = ranking
+        self.docstore = FakeDocstore()
+        self.index_to_docstore_id = dict(enumerate(CHUNKS))
+
+    def similarity_search_with_score(self, query, k):
+        return [(self.docstore.search(doc_id), 0.5 * rank) for rank, doc_id in enumerate(self.ranking[:k], start=1)]
+
+
+@pytest.fixture
+def keyword_index():
+    index = BM25Index(':memory:')
+    index.add(CHUNKS.items())
+    return index
+
+
+def test_tokenize_keeps_compound_identifiers_and_parts():
+    assert tokenize("GET /api/v1/Users ERR-404") == ["get", "api/v1/users", "api", "v1", "users", "err-404", "err", "404"]
+
+
+def test_bm25_ranks_exact_identifier_first(keyword_index):
+    results = keyword_index.search("ERR-404", k=3)
+    assert [doc_id for doc_id, _ in results] == ["orders"]
+    assert keyword_index.search("/api/v1/users", k=1)[0][0] == "users"
+    assert keyword_index.search("несуществующее слово") == []
+
+
+def test_bm25_delete_and_sync(keyword_index):
+    keyword_index.delete(["orders"])
+    assert keyword_index.count() == 2
+    assert keyword_index.search("ERR-404") == []
+
+    keyword_index.sync(FakeVectorStore([]))
+    assert keyword_index.count() == 3
+    assert keyword_index.search("ERR-404")[0][0] == "orders"
+
+
+def test_reciprocal_rank_fusion_prefers_documents_ranked_by_both():
+    fused = reciprocal_rank_fusion([["a", "b"], ["b", "c"]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["b", "a", "c"]
+    assert [score for _, score in fused] == pytest.approx([1 / 62 + 1 / 61, 1 / 61, 1 / 62])
+
+
+def test_hybrid_retriever_fuses_dense_and_keyword_results(keyword_index):
+    retriever = HybridRetriever(vectorstore=FakeVectorStore(["auth", "users"]), keyword_index=keyword_index,
+                                k=3, fetch_k=3)
+
+    documents = retriever.invoke("ERR-404 пользователей")
+
+    by_id = {doc.metadata["id"]: doc.metadata for doc in documents}
+    assert set(by_id) == {"auth", "users", "orders"}
+    # Чанк, найденный только по ключевому слову, попадает в результат с пустым расстоянием FAISS
+    assert by_id["orders"]["dense_distance"] is None
+    assert by_id["orders"]["bm25_score"] > 0
+    assert by_id["auth"]["dense_distance"] == 0.5
+    scores = [doc.metadata["score"] for doc in documents]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_dense_only_retriever_writes_rrf_score():
+    retriever = HybridRetriever(vectorstore=FakeVectorStore(["users", "auth", "orders"]), k=2)
+
+    documents = retriever.invoke("пользователи")
+
+    assert [doc.metadata["id"] for doc in documents] == ["users", "auth"]
+    assert [doc.metadata["score"] for doc in documents] == pytest.approx([1 / 61, 1 / 62])
+    assert [doc.metadata["dense_distance"] for doc in documents] == [0.5, 1.0]
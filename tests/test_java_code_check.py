@@ -0,0 +1,99 @@
+import pytest
+
+import Java_Code_Check
+from Java_Code_Check import JavaStreamValidator, check_java_code, extract_java_block, find_java_fence
+
+VALID_TEST = """
+import org.junit.jupiter.api.Test;
+import static io.restassured.RestAssured.given;
+
+public class UserApiTest {
+    @Test
+    public void getUser() {
+        given().when().get("/users/1").then().statusCode(200);
+    }
+}
+"""
+
+
+@pytest.fixture(params=["javalang", "without_parser"])
+def parser(request, monkeypatch):
+    if request.param == "javalang":
+        if Java_Code_Check.javalang is None:
+            pytest.skip("javalang не установлен")
+    else:
+        monkeypatch.setattr(Java_Code_Check, "javalang", None)
+    return request.param
+
+
+def test_find_java_fence_skips_javascript():
+    assert find_java_fence("```javascript\nx\n```") is None
+    assert find_java_fence("```javascript\nx\n```\n```java\ny") == len("```javascript\nx\n```\n```java")
+    # Следующий символ ещё не получен: нельзя отличить ```java от ```javascript
+    assert find_java_fence("текст ```java") is None
+
+
+def test_extract_java_block():
+    assert extract_java_block("До\n```java\nclass A {}\n```\nПосле") == "class A {}"
+    assert extract_java_block("```java\nclass A {}") is None
+    assert extract_java_block("нет кода") is None
+
+
+def test_valid_code_passes(parser):
+    assert check_java_code(VALID_TEST) == []
+
+
+def test_empty_code():
+    assert check_java_code("  \n") == ["пустой блок Java-кода"]
+
+
+def test_missing_required_elements(parser):
+    code = """
+import org.junit.Assert;
+
+class Helper {
+    void run() {}
+}
+"""
+    assert check_java_code(code) == [
+        "нет public класса",
+        "нет методов с аннотацией @Test",
+        "нет импорта org.junit.jupiter.api",
+    ]
+
+
+def test_syntax_error_is_reported(parser):
+    errors = check_java_code(VALID_TEST.replace("statusCode(200);\n    }", "statusCode(200);\n"))
+    assert len(errors) == 1
+    assert errors[0].startswith("синтаксическая ошибка")
+
+
+def test_unbalanced_brackets_ignore_strings_and_comments(monkeypatch):
+    monkeypatch.setattr(Java_Code_Check, "javalang", None)
+    code = VALID_TEST.replace('"/users/1"', '"/users/{id"').replace("@Test", "// ) }\n    @Test")
+    assert check_java_code(code) == []
+
+
+def test_validator_stops_after_closed_block():
+    validator = JavaStreamValidator()
+    assert validator("Вот тест:\n```ja") is False
+    assert validator("Вот тест:\n```java\nclass A {}") is False
+    assert validator("Вот тест:\n```java\nclass A {}\n```") is True
+    assert validator.code == "class A {}"
+    assert validator.aborted is False
+
+
+def test_validator_aborts_without_block_in_preamble():
+    validator = JavaStreamValidator(max_preamble=20)
+    assert validator("x" * 20) is False
+    assert validator("x" * 21) is True
+    assert validator.aborted is True
+    assert validator.code is None
+
+
+def test_validator_waits_for_block_once_started():
+    validator = JavaStreamValidator(max_preamble=20)
+    text = "```java\n" + "int x = 1;\n" * 10
+    assert validator(text) is False
+    assert validator.aborted is False
+    assert validator(text + "```") is True
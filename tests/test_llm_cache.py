@@ -0,0 +1,86 @@
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+
+from LLM_Cache import CachedChatModel, ResponseCache, cached_chat_model, model_for_attempt, uncached
+
+
+class FakeChatModel:
+    """Чат-модель, отвечающая по очереди заданными ответами"""
+
+    def __init__(self, answers, temperature=0):
+        self.model = "fake"
+        self.temperature = temperature
+        self._identifying_params = {"model": "fake", "temperature": temperature}
+        self.answers = list(answers)
+        self.calls = 0
+
+    def invoke(self, messages, *args, **kwargs):
+        self.calls += 1
+        return AIMessage(content=self.answers.pop(0))
+
+    def stream(self, messages, *args, **kwargs):
+        self.calls += 1
+        for part in self.answers.pop(0).split(" "):
+            yield AIMessageChunk(content=part + " ")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(path=str(tmp_path / "llm_cache.sqlite"))
+
+
+PROMPT = [HumanMessage(content="Создай автотест")]
+
+
+def test_repeated_temperature_zero_call_is_served_from_cache(cache):
+    llm = FakeChatModel(["ответ"])
+    model = CachedChatModel(llm, cache)
+
+    assert model.invoke(PROMPT).content == "ответ"
+    assert model.invoke(PROMPT).content == "ответ"
+    assert llm.calls == 1
+
+
+def test_only_temperature_zero_models_are_cached(monkeypatch, cache):
+    monkeypatch.setattr("LLM_Cache.LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr("LLM_Cache._default_cache", cache)
+    sampling = FakeChatModel([], temperature=0.7)
+
+    assert cached_chat_model(sampling) is sampling
+    assert isinstance(cached_chat_model(FakeChatModel([])), CachedChatModel)
+
+
+def test_call_with_nonzero_temperature_bypasses_cache(cache):
+    llm = FakeChatModel(["первый", "второй"])
+    model = CachedChatModel(llm, cache)
+
+    model.invoke(PROMPT, temperature=0.5)
+    assert model.invoke(PROMPT, temperature=0.5).content == "второй"
+    assert llm.calls == 2
+
+
+def test_retry_after_rejection_reaches_model(cache):
+    llm = FakeChatModel(["отклонённый ответ", "исправленный ответ"])
+    model = CachedChatModel(llm, cache)
+
+    # Первая попытка кэшируется; повтор с тем же промптом после отклонения ответа идёт к модели
+    assert model_for_attempt(model, 0).invoke(PROMPT).content == "отклонённый ответ"
+    assert model_for_attempt(model, 1).invoke(PROMPT).content == "исправленный ответ"
+    assert llm.calls == 2
+
+
+def test_streamed_retry_after_rejection_reaches_model(cache):
+    llm = FakeChatModel(["отклонённый ответ", "исправленный ответ"])
+    model = CachedChatModel(llm, cache)
+
+    list(model_for_attempt(model, 0).stream(PROMPT))
+    retry = "".join(chunk.content for chunk in model_for_attempt(model, 1).stream(PROMPT))
+
+    assert retry.split() == ["исправленный", "ответ"]
+    assert llm.calls == 2
+
+
+def test_uncached_unwraps_cache(cache):
+    llm = FakeChatModel([])
+    assert uncached(CachedChatModel(llm, cache)) is llm
+    assert uncached(llm) is llm
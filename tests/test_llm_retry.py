@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+
+import LLM_Retry
+from LLM_Retry import CircuitBreaker, CircuitOpenError, acall_with_retry, backoff_delay, call_with_retry, retry_stats
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.headers = headers
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(LLM_Retry.time, "sleep", delays.append)
+    return delays
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(LLM_Retry.time, "monotonic", clock)
+    return clock
+
+
+def failing(*errors, result="ok"):
+    errors = list(errors)
+    calls = []
+
+    def func():
+        calls.append(True)
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    func.calls = calls
+    return func
+
+
+def test_transient_errors_are_retried(sleeps):
+    func = failing(StatusError(503), ConnectionError("reset"))
+    breaker = CircuitBreaker("test", failure_threshold=5)
+
+    assert call_with_retry(func, "test.transient", breaker, attempts=3) == "ok"
+
+    assert len(func.calls) == 3
+    assert len(sleeps) == 2
+    assert breaker.state == "closed" and breaker.failures == 0
+    assert retry_stats()["test.transient"] == {"calls": 1, "retries": 2, "failures": 0, "rejected": 0}
+
+
+def test_request_errors_are_not_retried(sleeps):
+    func = failing(StatusError(400))
+    breaker = CircuitBreaker("test", failure_threshold=5)
+
+    with pytest.raises(StatusError):
+        call_with_retry(func, "test.request_error", breaker, attempts=3)
+
+    assert len(func.calls) == 1
+    assert sleeps == []
+    assert breaker.failures == 0
+
+
+def test_last_error_is_raised_after_all_attempts(sleeps):
+    func = failing(StatusError(500), StatusError(502), StatusError(504))
+
+    with pytest.raises(StatusError) as error:
+        call_with_retry(func, "test.exhausted", CircuitBreaker("test", failure_threshold=10), attempts=3)
+
+    assert error.value.status_code == 504
+    assert retry_stats()["test.exhausted"]["failures"] == 1
+
+
+def test_retry_after_header_is_respected(sleeps):
+    func = failing(StatusError(429, headers={"Retry-After": "7"}))
+
+    call_with_retry(func, "test.retry_after", CircuitBreaker("test"), attempts=2)
+
+    assert sleeps == [7.0]
+
+
+def test_backoff_delay_grows_and_is_capped():
+    for attempt, upper in [(1, 1.0), (2, 2.0), (3, 4.0), (10, 30.0)]:
+        delay = backoff_delay(attempt, base_delay=1.0, max_delay=30.0)
+        assert upper / 2 <= delay <= upper
+    assert 2.0 <= backoff_delay(2, StatusError(429), base_delay=1.0, max_delay=30.0) <= 4.0
+
+
+def test_circuit_opens_after_consecutive_failures_and_closes_after_trial(sleeps, clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+
+    with pytest.raises(StatusError):
+        call_with_retry(failing(StatusError(503), StatusError(503), StatusError(503)), "test.circuit", breaker,
+                        attempts=3)
+    # Выключатель разомкнулся после второй ошибки, третья попытка не выполнялась
+    assert breaker.state == "open"
+    assert len(sleeps) == 1
+
+    rejected = failing()
+    with pytest.raises(CircuitOpenError):
+        call_with_retry(rejected, "test.circuit", breaker)
+    assert rejected.calls == []
+    assert retry_stats()["test.circuit"]["rejected"] == 1
+
+    clock.now += 61
+    assert breaker.state == "half-open"
+    assert call_with_retry(failing(), "test.circuit", breaker) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_failed_trial_call_opens_circuit_again(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    clock.now += 61
+
+    breaker.before_call()
+    # Пока идёт пробный вызов, остальные отклоняются
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+
+
+def test_async_retry_does_not_block_event_loop(monkeypatch):
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(LLM_Retry.asyncio, "sleep", fake_sleep)
+    func = failing(TimeoutError())
+
+    async def afunc():
+        return func()
+
+    assert asyncio.run(acall_with_retry(afunc, "test.async", CircuitBreaker("test"), attempts=2)) == "ok"
+    assert len(delays) == 1
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import Similarity_Grader
+from Similarity_Grader import SimilarityGrader, calibrate, load_thresholds
+
+
+class RecordingEmbeddings:
+    """Эмбеддинги, запоминающие тексты запросов и документов"""
+
+    def __init__(self):
+        self.queries = []
+        self.documents = []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [1.0, 0.0]
+
+    def embed_documents(self, texts):
+        self.documents.extend(texts)
+        return [[1.0, 0.0] for _ in texts]
+
+
+@pytest.fixture(autouse=True)
+def no_manual_thresholds(monkeypatch):
+    monkeypatch.setattr(Similarity_Grader, "GRADE_ACCEPT_SIMILARITY", None)
+    monkeypatch.setattr(Similarity_Grader, "GRADE_REJECT_SIMILARITY", None)
+
+
+def test_e5_question_and_documents_are_prefixed():
+    embeddings = RecordingEmbeddings()
+    grader = SimilarityGrader(embeddings, "intfloat/multilingual-e5-large", samples_path="")
+
+    grader.similarities("вопрос", ["документ"])
+
+    assert embeddings.queries == ["query: вопрос"]
+    assert embeddings.documents == ["passage: документ"]
+
+
+def test_other_models_are_not_prefixed():
+    embeddings = RecordingEmbeddings()
+    grader = SimilarityGrader(embeddings, "bert-base-uncased", samples_path="")
+
+    grader.similarities("вопрос", ["документ"])
+
+    assert embeddings.queries == ["вопрос"]
+    assert embeddings.documents == ["документ"]
+
+
+def test_unprefixed_calibration_is_not_reused_for_e5(tmp_path):
+    samples_path = tmp_path / "samples.jsonl"
+    thresholds_path = tmp_path / "thresholds.json"
+    model_id = "intfloat/multilingual-e5-large"
+    thresholds_path.write_text(json.dumps({model_id: {"accept": 0.9, "reject": 0.8}}), encoding='utf-8')
+    assert load_thresholds(model_id, str(thresholds_path)) == (None, None)
+
+    samples_path.write_text(
+        "".join(json.dumps({"model_id": model_id, "similarity": 0.5, "relevant": True}) + "\n" for _ in range(60)),
+        encoding='utf-8')
+    grader = SimilarityGrader(RecordingEmbeddings(), model_id, samples_path=str(samples_path))
+    grader.grade("вопрос", ["документ"] * 60, lambda documents: [True] * len(documents))
+    thresholds = calibrate(str(samples_path), str(thresholds_path))
+
+    assert thresholds[model_id] == {"accept": 1.0, "reject": None, "samples": 60, "prefixed": True}
+    assert load_thresholds(model_id, str(thresholds_path)) == (1.0, None)
@@ -0,0 +1,169 @@
+import os
+
+import pytest
+
+pytest.importorskip("faiss")
+
+import Vector_Store
+from Chunk_Store import open_chunk_store
+from langchain_core.documents import Document
+
+
+class FakeEmbeddings:
+    """Детерминированные эмбеддинги с подсчётом посчитанных текстов"""
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0]
+
+
+def fake_split_pdf(file_path):
+    # Вместо разбора PDF каждая строка файла - отдельный чанк
+    with open(file_path, encoding='utf-8') as f:
+        return [Document(page_content=line, metadata={"source": file_path}) for line in f.read().splitlines()]
+
+
+@pytest.fixture
+def knowledge_base(tmp_path, monkeypatch):
+    monkeypatch.setattr(Vector_Store, "split_pdf", fake_split_pdf)
+    monkeypatch.setattr(Vector_Store, "INGEST_WORKERS", 1)
+    pdf_dir = tmp_path / "pdf"
+    pdf_dir.mkdir()
+    db_dir = tmp_path / "db"
+    embeddings = FakeEmbeddings()
+    changes = []
+
+    def sync():
+        embeddings.embedded.clear()
+        return Vector_Store.sync_vector_store(embeddings, "fake-model", db_dir=str(db_dir), pdf_dir=str(pdf_dir),
+                                              on_index_changed=lambda: changes.append(True))
+
+    return pdf_dir, db_dir, embeddings, changes, sync
+
+
+def write(path, *lines):
+    path.write_text("\n".join(lines), encoding='utf-8')
+
+
+def stored_texts(db_dir):
+    store = open_chunk_store(str(db_dir), read_only=True)
+    try:
+        return sorted(store.search(doc_id).page_content for doc_id in store.positions().values())
+    finally:
+        store.close()
+
+
+def test_first_sync_indexes_all_files(knowledge_base):
+    pdf_dir, db_dir, embeddings, changes, sync = knowledge_base
+    write(pdf_dir / "a.pdf", "a1", "a2")
+    write(pdf_dir / "b.pdf", "b1")
+
+    vectorstore = sync()
+
+    assert sorted(embeddings.embedded) == ["a1", "a2", "b1"]
+    assert vectorstore.index.ntotal == 3
+    assert changes == [True]
+    manifest = Vector_Store.load_manifest(str(db_dir))
+    assert manifest["embedding_model"] == "fake-model"
+    assert {path: len(entry["chunk_ids"]) for path, entry in manifest["files"].items()} == {"a.pdf": 2, "b.pdf": 1}
+
+
+def test_unchanged_files_are_not_embedded_again(knowledge_base):
+    pdf_dir, db_dir, embeddings, changes, sync = knowledge_base
+    write(pdf_dir / "a.pdf", "a1", "a2")
+    sync()
+
+    vectorstore = sync()
+
+    assert embeddings.embedded == []
+    assert changes == [True]
+    assert vectorstore.index.ntotal == 2
+
+
+def test_touched_file_with_same_content_is_not_embedded_again(knowledge_base):
+    pdf_dir, db_dir, embeddings, changes, sync = knowledge_base
+    write(pdf_dir / "a.pdf", "a1", "a2")
+    sync()
+    stat = os.stat(pdf_dir / "a.pdf")
+    os.utime(pdf_dir / "a.pdf", (stat.st_atime, stat.st_mtime + 10))
+
+    sync()
+
+    assert embeddings.embedded == []
+    assert changes == [True]
+    assert Vector_Store.load_manifest(str(db_dir))["files"]["a.pdf"]["mtime"] == stat.st_mtime + 10
+
+
+def test_added_changed_and_deleted_files(knowledge_base):
+    pdf_dir, db_dir, embeddings, changes, sync = knowledge_base
+    write(pdf_dir / "a.pdf", "a1", "a2")
+    write(pdf_dir / "b.pdf", "b1")
+    write(pdf_dir / "c.pdf", "c1")
+    sync()
+    unchanged_ids = Vector_Store.load_manifest(str(db_dir))["files"]["c.pdf"]["chunk_ids"]
+
+    (pdf_dir / "a.pdf").unlink()
+    write(pdf_dir / "b.pdf", "b1 changed", "b2")
+    write(pdf_dir / "d.pdf", "d1")
+    vectorstore = sync()
+
+    assert sorted(embeddings.embedded) == ["b1 changed", "b2", "d1"]
+    assert changes == [True, True]
+    assert vectorstore.index.ntotal == 4
+    files = Vector_Store.load_manifest(str(db_dir))["files"]
+    assert sorted(files) == ["b.pdf", "c.pdf", "d.pdf"]
+    assert files["c.pdf"]["chunk_ids"] == unchanged_ids
+    assert stored_texts(db_dir) == ["b1 changed", "b2", "c1", "d1"]
+
+
+def test_embedding_model_change_rebuilds_index(knowledge_base):
+    pdf_dir, db_dir, embeddings, changes, sync = knowledge_base
+    write(pdf_dir / "a.pdf", "a1")
+    sync()
+
+    embeddings.embedded.clear()
+    vectorstore = Vector_Store.sync_vector_store(embeddings, "other-model", db_dir=str(db_dir), pdf_dir=str(pdf_dir))
+
+    assert embeddings.embedded == ["a1"]
+    assert vectorstore.index.ntotal == 1
+    assert Vector_Store.load_manifest(str(db_dir))["embedding_model"] == "other-model"
+
+
+def test_failed_index_write_leaves_chunk_store_uncommitted(knowledge_base, monkeypatch):
+    pdf_dir, db_dir, embeddings, changes, sync = knowledge_base
+    write(pdf_dir / "a.pdf", "a1", "a2")
+    sync()
+    index_path = db_dir / Vector_Store.INDEX_FILE_NAME
+    index_bytes = index_path.read_bytes()
+
+    def failing_write_index(index, path):
+        open(path, 'wb').close()
+        raise OSError("диск заполнен")
+
+    monkeypatch.setattr(Vector_Store.faiss, "write_index", failing_write_index)
+    write(pdf_dir / "b.pdf", "b1")
+    with pytest.raises(OSError):
+        sync()
+
+    assert stored_texts(db_dir) == ["a1", "a2"]
+    assert index_path.read_bytes() == index_bytes
+    assert not os.path.exists(f"{index_path}.tmp")
+    assert Vector_Store.load_vector_store_read_only(str(db_dir), embeddings).index.ntotal == 2
+
+
+def test_read_only_load_rejects_store_committed_for_other_index(knowledge_base, monkeypatch):
+    pdf_dir, db_dir, embeddings, changes, sync = knowledge_base
+    write(pdf_dir / "a.pdf", "a1")
+    sync()
+    store = open_chunk_store(str(db_dir))
+    store.write_positions(store.positions(), "0:0")
+    store.close()
+    monkeypatch.setattr(Vector_Store.time, "sleep", lambda seconds: None)
+
+    assert Vector_Store.load_vector_store_read_only(str(db_dir), embeddings) is None